@@ -1,6 +1,10 @@
 # COMPLETE V3K AI Trading Bot - Live Signals + AI Features + Advanced Platform
 # Production Version — /dashboard, /live-stats, /quick-stats routes active
 
+# Startup clock + lazy subsystem registry (subsystems.py) — imported first so the report
+# covers every import below. GET /startup/report shows the breakdown.
+import subsystems as _subsystems
+_SUBS = _subsystems.Registry()
 from flask import Flask, request, jsonify, render_template_string
 from flask_cors import CORS
 import traceback
@@ -12,16 +16,22 @@ import os
 import sys
 import requests
 import json
-import numpy as np
-import pandas as pd
-import yfinance as yf
+import functools
 from functools import wraps
 import jwt
 import random
 import sqlite3
 import warnings
 import hashlib
+import re
 from collections import deque
+_SUBS.mark("flask + stdlib")
+import numpy as np
+_SUBS.mark("numpy")
+import pandas as pd
+_SUBS.mark("pandas")
+# yfinance (~0.35 s to import) is imported where it is used: bar_store's fetcher and the
+# direct-Yahoo fallbacks below.
 
 warnings.filterwarnings('ignore')
 
@@ -33,6 +43,7 @@ from dataclasses import dataclass
 from typing import Dict, List, Optional, Tuple
 from enum import Enum
 import math
+import importlib.util
 
 # Risk Management Configuration
 class RiskLevel(Enum):
@@ -73,38 +84,55 @@ class RiskMetrics:
 class AdvancedRiskManager:
     """Advanced Risk Management System with Portfolio Analytics"""
     
+    # Default limits per risk level; class-level so readers (e.g. the portfolio backtest)
+    # don't have to build a manager — and open its SQLite DB — to see them.
+    RISK_PARAMS = {
+        RiskLevel.CONSERVATIVE: {
+            'max_portfolio_risk': 3.0,      # 3% max portfolio risk
+            'max_position_risk': 1.0,       # 1% max per position
+            'max_sector_concentration': 20.0, # 20% max per sector
+            'max_single_position': 8.0,     # 8% max single position
+            'max_correlation': 0.6,         # 60% max correlation
+            'max_positions': 8              # Max 8 positions
+        },
+        RiskLevel.MODERATE: {
+            'max_portfolio_risk': 5.0,      # 5% max portfolio risk
+            'max_position_risk': 2.0,       # 2% max per position
+            'max_sector_concentration': 30.0, # 30% max per sector
+            'max_single_position': 12.0,    # 12% max single position
+            'max_correlation': 0.7,         # 70% max correlation
+            'max_positions': 12             # Max 12 positions
+        },
+        RiskLevel.AGGRESSIVE: {
+            'max_portfolio_risk': 8.0,      # 8% max portfolio risk
+            'max_position_risk': 3.0,       # 3% max per position
+            'max_sector_concentration': 40.0, # 40% max per sector
+            'max_single_position': 15.0,    # 15% max single position
+            'max_correlation': 0.8,         # 80% max correlation
+            'max_positions': 15             # Max 15 positions
+        }
+    }
+    
+    # Nifty 50 symbol -> sector
+    SECTOR_MAPPINGS = {
+        'RELIANCE.NS': 'Energy', 'TCS.NS': 'IT', 'HDFCBANK.NS': 'Banking',
+        'INFY.NS': 'IT', 'HINDUNILVR.NS': 'FMCG', 'ICICIBANK.NS': 'Banking',
+        'KOTAKBANK.NS': 'Banking', 'BHARTIARTL.NS': 'Telecom', 'ITC.NS': 'FMCG',
+        'SBIN.NS': 'Banking', 'BAJFINANCE.NS': 'NBFC', 'LT.NS': 'Infrastructure',
+        'HCLTECH.NS': 'IT', 'ASIANPAINT.NS': 'Paint', 'AXISBANK.NS': 'Banking',
+        'MARUTI.NS': 'Auto', 'SUNPHARMA.NS': 'Pharma', 'TITAN.NS': 'Jewelry',
+        'ULTRACEMCO.NS': 'Cement', 'WIPRO.NS': 'IT', 'NESTLEIND.NS': 'FMCG',
+        'POWERGRID.NS': 'Power', 'NTPC.NS': 'Power', 'TATAMOTORS.NS': 'Auto',
+        'TECHM.NS': 'IT'
+    }
+    
     def __init__(self, initial_capital: float = 100000):
         self.initial_capital = initial_capital
         self.current_capital = initial_capital
         self.risk_level = RiskLevel.MODERATE
         
         # Risk Parameters (configurable based on risk level)
-        self.risk_params = {
-            RiskLevel.CONSERVATIVE: {
-                'max_portfolio_risk': 3.0,      # 3% max portfolio risk
-                'max_position_risk': 1.0,       # 1% max per position
-                'max_sector_concentration': 20.0, # 20% max per sector
-                'max_single_position': 8.0,     # 8% max single position
-                'max_correlation': 0.6,         # 60% max correlation
-                'max_positions': 8              # Max 8 positions
-            },
-            RiskLevel.MODERATE: {
-                'max_portfolio_risk': 5.0,      # 5% max portfolio risk
-                'max_position_risk': 2.0,       # 2% max per position
-                'max_sector_concentration': 30.0, # 30% max per sector
-                'max_single_position': 12.0,    # 12% max single position
-                'max_correlation': 0.7,         # 70% max correlation
-                'max_positions': 12             # Max 12 positions
-            },
-            RiskLevel.AGGRESSIVE: {
-                'max_portfolio_risk': 8.0,      # 8% max portfolio risk
-                'max_position_risk': 3.0,       # 3% max per position
-                'max_sector_concentration': 40.0, # 40% max per sector
-                'max_single_position': 15.0,    # 15% max single position
-                'max_correlation': 0.8,         # 80% max correlation
-                'max_positions': 15             # Max 15 positions
-            }
-        }
+        self.risk_params = {lvl: dict(p) for lvl, p in self.RISK_PARAMS.items()}
         
         # Portfolio tracking
         self.active_positions: List[Position] = []
@@ -120,17 +148,7 @@ class AdvancedRiskManager:
     
     def _load_sector_mappings(self) -> Dict[str, str]:
         """Load sector mappings for Nifty 50 stocks"""
-        return {
-            'RELIANCE.NS': 'Energy', 'TCS.NS': 'IT', 'HDFCBANK.NS': 'Banking',
-            'INFY.NS': 'IT', 'HINDUNILVR.NS': 'FMCG', 'ICICIBANK.NS': 'Banking',
-            'KOTAKBANK.NS': 'Banking', 'BHARTIARTL.NS': 'Telecom', 'ITC.NS': 'FMCG',
-            'SBIN.NS': 'Banking', 'BAJFINANCE.NS': 'NBFC', 'LT.NS': 'Infrastructure',
-            'HCLTECH.NS': 'IT', 'ASIANPAINT.NS': 'Paint', 'AXISBANK.NS': 'Banking',
-            'MARUTI.NS': 'Auto', 'SUNPHARMA.NS': 'Pharma', 'TITAN.NS': 'Jewelry',
-            'ULTRACEMCO.NS': 'Cement', 'WIPRO.NS': 'IT', 'NESTLEIND.NS': 'FMCG',
-            'POWERGRID.NS': 'Power', 'NTPC.NS': 'Power', 'TATAMOTORS.NS': 'Auto',
-            'TECHM.NS': 'IT'
-        }
+        return dict(self.SECTOR_MAPPINGS)
     
     def _init_database(self):
         """Initialize SQLite database for position tracking"""
@@ -560,8 +578,9 @@ class AdvancedRiskManager:
         except Exception as e:
             print(f"Metrics update error: {e}")
 
-# Initialize the risk manager
-risk_manager = AdvancedRiskManager(initial_capital=100000)  # ₹1 Lakh default
+# Initialize the risk manager (on first use — the constructor opens the SQLite DB)
+risk_manager = _SUBS.register("risk", lambda: AdvancedRiskManager(initial_capital=100000),  # ₹1 Lakh default
+                              "AdvancedRiskManager + risk_management.db")
 
 # Enhanced signal validation with risk management
 def validate_signal_with_risk_management(signal):
@@ -782,30 +801,34 @@ def get_risk_validated_signals():
         return jsonify({"error": str(e), "risk_validated_signals": []}), 500
 
 # Real-time risk monitoring
+def risk_check_once():
+    """Mark open positions to the latest streamed prices and warn on high risk utilization."""
+    # Update positions with current prices if we have active positions
+    if risk_manager.active_positions and real_time_streamer.streaming:
+        price_updates = {}
+        for position in risk_manager.active_positions:
+            if position.symbol in real_time_streamer.last_prices:
+                price_updates[position.symbol] = real_time_streamer.last_prices[position.symbol]
+        
+        if price_updates:
+            risk_manager.update_position_prices(price_updates)
+    
+    # Check for risk violations
+    portfolio_summary = risk_manager.get_portfolio_summary()
+    risk_metrics = portfolio_summary.get('risk_metrics', {})
+    
+    # Alert on high risk utilization
+    risk_utilization = risk_metrics.get('risk_utilization', 0)
+    if risk_utilization > 90:
+        print(f"⚠️ HIGH RISK WARNING: Portfolio risk utilization at {risk_utilization:.1f}%")
+    return {"positions": len(risk_manager.active_positions), "risk_utilization": risk_utilization}
+
 def start_risk_monitoring():
     """Start real-time risk monitoring thread"""
     def monitor_risk():
         while True:
             try:
-                # Update positions with current prices if we have active positions
-                if risk_manager.active_positions and real_time_streamer.streaming:
-                    price_updates = {}
-                    for position in risk_manager.active_positions:
-                        if position.symbol in real_time_streamer.last_prices:
-                            price_updates[position.symbol] = real_time_streamer.last_prices[position.symbol]
-                    
-                    if price_updates:
-                        risk_manager.update_position_prices(price_updates)
-                
-                # Check for risk violations
-                portfolio_summary = risk_manager.get_portfolio_summary()
-                risk_metrics = portfolio_summary.get('risk_metrics', {})
-                
-                # Alert on high risk utilization
-                risk_utilization = risk_metrics.get('risk_utilization', 0)
-                if risk_utilization > 90:
-                    print(f"⚠️ HIGH RISK WARNING: Portfolio risk utilization at {risk_utilization:.1f}%")
-                
+                risk_check_once()
                 time_module.sleep(30)  # Check every 30 seconds
                 
             except Exception as e:
@@ -962,11 +985,13 @@ def get_risk_alerts():
         return jsonify({'error': str(e)}), 500
 
 # Initialize risk monitoring on startup
-def init_risk_management():
-    """Initialize risk management system"""
+def init_risk_management(start_monitor=True):
+    """Initialize risk management system. start_monitor=False only registers the price
+    callback (the monitoring loop is jobs.py's risk_monitor job)."""
     try:
         # Start risk monitoring
-        start_risk_monitoring()
+        if start_monitor:
+            start_risk_monitoring()
         
         # Add risk validation callback to real-time streamer
         if real_time_streamer:
@@ -985,15 +1010,7 @@ def init_risk_management():
     except Exception as e:
         print(f"Risk management initialization error: {e}")
 
-print("🚀 Enhancement #3: Advanced Risk Management System - LOADED!")
-print("✅ Portfolio risk limits and validation")
-print("✅ Position sizing with stop-loss optimization") 
-print("✅ Sector concentration limits")
-print("✅ Real-time risk monitoring")
-print("✅ Advanced position management")
-print("✅ Risk-validated signal generation")
-print("✅ New endpoints: /risk-analysis, /portfolio-summary, /add-position")
-print("🛡️ Your capital is now protected with professional risk management!")
+_SUBS.mark("risk layer")
 
 # ====== ENHANCEMENT #2: REAL-TIME DATA STREAMING SYSTEM ======
 # Add this to your existing trading bot code
@@ -1010,16 +1027,19 @@ import time as time_module
 # Install required packages:
 # pip install websocket-client python-socketio
 
-try:
-    import socketio
-    SOCKETIO_AVAILABLE = True
+# Optional dependencies are probed with find_spec and imported where they're used.
+SOCKETIO_AVAILABLE = importlib.util.find_spec("socketio") is not None
+if SOCKETIO_AVAILABLE:
     print("✅ SocketIO available for real-time streaming")
-except ImportError:
-    SOCKETIO_AVAILABLE = False
+else:
     print("⚠️ SocketIO not available - install with: pip install python-socketio")
 
+from tick_stream import BarAggregator, LatencyMeter, IST
+
 class RealTimeDataStreamer:
-    """Real-time market data streaming system"""
+    """Real-time market data streaming system.
+    Ticks come from a pluggable tick_stream source (Kite WebSocket, or a replay file) and
+    are fanned out to the price history, incremental 1m / 5m bars and the callbacks."""
     
     def __init__(self):
         self.streaming = False
@@ -1029,150 +1049,110 @@ class RealTimeDataStreamer:
         self.price_changes = {}
         self.volume_data = defaultdict(lambda: deque(maxlen=50))
         self.streaming_symbols = []
-        self.update_queue = queue.Queue()
+        self.update_queue = deque(maxlen=1000)   # latest updates for WebSocket broadcasting
         self.alert_triggers = {}
+        self.source = None
+        self.bars = BarAggregator((60, 300))
+        self.latency = LatencyMeter()            # tick arrival → all callbacks done
+        self._cum_volume = {}
+        self._stop = threading.Event()           # per session: set by stop_streaming
         
     def add_callback(self, callback):
         """Add callback for real-time data updates"""
         self.callbacks.append(callback)
         print(f"✅ Added callback: {len(self.callbacks)} total callbacks")
     
-    def start_streaming(self, symbols):
-        """Start real-time data streaming for symbols"""
+    def start_streaming(self, symbols, source=None):
+        """Start real-time data streaming for symbols (source: a tick_stream source;
+        default from _tick_source() — TICK_SOURCE env / today's Kite token)"""
         try:
+            if self.streaming:
+                self.stop_streaming()
+            source = source or _tick_source()
+            if source is None:
+                print("❌ No tick source — connect Zerodha for today or set TICK_SOURCE=replay:<file>")
+                return False
             self.streaming_symbols = symbols
+            self.source = source
+            self._stop = stop = threading.Event()
             self.streaming = True
+            source.start(symbols, self._on_ticks)
             
-            # Start the main streaming thread
-            streaming_thread = threading.Thread(
-                target=self._stream_data_continuous, 
-                args=(symbols,), 
-                daemon=True
-            )
-            streaming_thread.start()
-            
-            # Start the alert monitoring thread
+            # Start the alert monitoring thread (exits when this session's event is set)
             alert_thread = threading.Thread(
                 target=self._monitor_alerts, 
+                args=(stop,),
                 daemon=True
             )
             alert_thread.start()
             
-            print(f"✅ Real-time streaming started for {len(symbols)} symbols")
+            print(f"✅ Real-time streaming started for {len(symbols)} symbols ({source.name})")
             return True
             
         except Exception as e:
+            self.streaming = False
+            self._stop.set()
             print(f"❌ Streaming startup error: {e}")
             return False
     
     def stop_streaming(self):
         """Stop real-time data streaming"""
         self.streaming = False
+        self._stop.set()
+        if self.source is not None:
+            self.source.stop()
         print("🛑 Real-time streaming stopped")
     
-    def _stream_data_continuous(self, symbols):
-        """Continuous data streaming simulation"""
-        print(f"🔄 Starting continuous streaming for: {', '.join([s.replace('.NS', '') for s in symbols])}")
-        
-        # Initialize base prices from Yahoo Finance
-        self._initialize_base_prices(symbols)
-        
-        while self.streaming:
-            try:
-                current_time = datetime.now()
-                batch_updates = []
-                
-                for symbol in symbols:
-                    # Generate realistic price update
-                    update = self._generate_realistic_price_update(symbol, current_time)
-                    if update:
-                        batch_updates.append(update)
-                        
-                        # Store in history
-                        self.price_history[symbol].append({
-                            'price': update['price'],
-                            'timestamp': current_time,
-                            'volume': update.get('volume', 0)
-                        })
-                
-                # Process batch updates
-                if batch_updates:
-                    self._process_batch_updates(batch_updates)
-                
-                # Stream at market speed (every 1-3 seconds)
-                sleep_time = 1 if is_market_open() else 5
-                time_module.sleep(sleep_time)
-                
-            except Exception as e:
-                print(f"Streaming error: {e}")
-                time_module.sleep(2)
-    
-    def _initialize_base_prices(self, symbols):
-        """Initialize base prices from real market data"""
-        print("📊 Initializing base prices...")
-        for symbol in symbols:
-            try:
-                data = get_live_stock_data(symbol, period="1d", interval="5m")
-                if data is not None and not data.empty:
-                    latest_price = data['Close'].iloc[-1]
-                    self.last_prices[symbol] = float(latest_price)
-                    print(f"  {symbol.replace('.NS', '')}: ₹{latest_price:.2f}")
-                else:
-                    # Fallback random price
-                    self.last_prices[symbol] = random.uniform(100, 5000)
-            except Exception as e:
-                print(f"Error initializing {symbol}: {e}")
-                self.last_prices[symbol] = random.uniform(100, 5000)
+    def _on_ticks(self, ticks):
+        """Source callback: one batch of ticks → history, bars, callbacks, latency"""
+        now = datetime.now()
+        updates = []
+        for t in ticks:
+            update = self._tick_update(t, now)
+            if update:
+                updates.append(update)
+                self.price_history[t['symbol']].append({
+                    'price': update['price'],
+                    'timestamp': now,
+                    'volume': update['volume']
+                })
+        if updates:
+            self._process_batch_updates(updates)
+            done = time_module.perf_counter()
+            for t in ticks:
+                self.latency.add(done - t['recv'])
     
-    def _generate_realistic_price_update(self, symbol, timestamp):
-        """Generate realistic price movement"""
+    def _tick_update(self, tick, now):
+        """Tick → the update dict the callbacks consume. change_percent is vs the previous
+        close when the feed carries it, else vs the last tick; volume is traded since the last tick."""
         try:
-            base_price = self.last_prices.get(symbol, 1000)
-            
-            # Market hours affect volatility
-            if is_market_open():
-                volatility = random.uniform(0.001, 0.008)  # 0.1% to 0.8%
-                volume_multiplier = random.uniform(0.8, 2.5)
-            else:
-                volatility = random.uniform(0.0005, 0.003)  # Lower after hours
-                volume_multiplier = random.uniform(0.3, 1.2)
-            
-            # Trending behavior (70% chance to continue previous direction)
-            prev_change = self.price_changes.get(symbol, 0)
-            if random.random() < 0.7 and abs(prev_change) > 0.001:
-                direction = 1 if prev_change > 0 else -1
-                change_percent = direction * random.uniform(0.001, volatility)
-            else:
-                change_percent = random.uniform(-volatility, volatility)
-            
-            # Apply change
-            new_price = base_price * (1 + change_percent)
-            price_change = ((new_price - base_price) / base_price) * 100
-            
-            # Generate volume (simulated)
-            base_volume = random.randint(10000, 500000)
-            volume = int(base_volume * volume_multiplier)
-            
-            # Update stored values
-            self.last_prices[symbol] = new_price
-            self.price_changes[symbol] = change_percent
-            
-            update = {
+            symbol = tick['symbol']; price = tick['price']
+            prev = self.last_prices.get(symbol)
+            ref = tick.get('close') or prev or price
+            change = ((price - ref) / ref) * 100 if ref else 0.0
+            cum = tick.get('volume')
+            last_cum = self._cum_volume.get(symbol)
+            volume = max(0, cum - last_cum) if (cum is not None and last_cum is not None) else 0
+            if cum is not None:
+                self._cum_volume[symbol] = cum
+            self.last_prices[symbol] = price
+            self.price_changes[symbol] = change / 100.0
+            self.volume_data[symbol].append(volume)
+            self.bars.add(symbol, tick['ts'], price, volume)
+            return {
                 'symbol': symbol,
                 'display_symbol': symbol.replace('.NS', ''),
-                'price': round(new_price, 2),
-                'change': round(price_change, 3),
-                'change_percent': round(price_change, 3),
+                'price': round(price, 2),
+                'change': round(change, 3),
+                'change_percent': round(change, 3),
                 'volume': volume,
-                'timestamp': timestamp.isoformat(),
+                'ts': tick['ts'],
+                'timestamp': now.isoformat(),
                 'market_open': is_market_open(),
-                'trend': 'up' if price_change > 0 else 'down' if price_change < 0 else 'neutral'
+                'trend': 'up' if prev is not None and price > prev else 'down' if prev is not None and price < prev else 'neutral'
             }
-            
-            return update
-            
         except Exception as e:
-            print(f"Price generation error for {symbol}: {e}")
+            print(f"Tick processing error for {tick.get('symbol')}: {e}")
             return None
     
     def _process_batch_updates(self, updates):
@@ -1189,8 +1169,7 @@ class RealTimeDataStreamer:
             self._check_alert_conditions(updates)
             
             # Store for WebSocket broadcasting (if available)
-            for update in updates:
-                self.update_queue.put(update)
+            self.update_queue.extend(updates)
                 
         except Exception as e:
             print(f"Batch processing error: {e}")
@@ -1249,12 +1228,10 @@ class RealTimeDataStreamer:
         except Exception as e:
             print(f"Real-time alert error: {e}")
     
-    def _monitor_alerts(self):
-        """Monitor for trading opportunities in real-time"""
-        while self.streaming:
+    def _monitor_alerts(self, stop):
+        """Monitor for trading opportunities in real-time until this session's stop event is set"""
+        while not stop.wait(10):  # Check every 10 seconds
             try:
-                time_module.sleep(10)  # Check every 10 seconds
-                
                 # Analyze recent price movements for trading signals
                 for symbol in self.streaming_symbols:
                     recent_data = list(self.price_history[symbol])
@@ -1263,7 +1240,7 @@ class RealTimeDataStreamer:
                         
             except Exception as e:
                 print(f"Alert monitoring error: {e}")
-                time_module.sleep(5)
+                stop.wait(5)
     
     def _analyze_real_time_patterns(self, symbol, recent_data):
         """Analyze real-time patterns for trading opportunities"""
@@ -1308,6 +1285,9 @@ class RealTimeDataStreamer:
         try:
             summary = {
                 'streaming': self.streaming,
+                'source': self.source.stats() if self.source else None,
+                'tick_to_callback_ms': self.latency.stats(),
+                'late_ticks': self.bars.late_ticks,
                 'symbols_count': len(self.streaming_symbols),
                 'active_symbols': [s.replace('.NS', '') for s in self.streaming_symbols],
                 'latest_prices': {},
@@ -1349,6 +1329,7 @@ class WebSocketManager:
         self.connected_clients = set()
         
         if SOCKETIO_AVAILABLE:
+            import socketio
             self.sio = socketio.SocketIO(app, cors_allowed_origins="*")
             self._setup_socket_handlers()
             print("✅ WebSocket manager initialized")
@@ -1396,8 +1377,8 @@ class WebSocketManager:
             except Exception as e:
                 print(f"Alert broadcast error: {e}")
 
-# Initialize the streaming components
-real_time_streamer = RealTimeDataStreamer()
+# Initialize the streaming components (on first use)
+real_time_streamer = _SUBS.register("streaming", RealTimeDataStreamer, "RealTimeDataStreamer (tick source, bars)")
 ws_manager = None  # Will be initialized with app
 
 def init_websocket_manager(app):
@@ -1498,44 +1479,30 @@ def auto_start_streaming():
     except Exception as e:
         print(f"Auto-start streaming error: {e}")
 
-print("🚀 Enhancement #2: Real-time Data Streaming - LOADED!")
-print("✅ Live price streaming simulation")
-print("✅ Real-time pattern detection")
-print("✅ WebSocket support (if available)")
-print("✅ Volume & price alerts")
-print("✅ New endpoints: /start-streaming, /stop-streaming, /live-prices")
-print("🔄 Ready to stream live market data!")
+_SUBS.mark("streaming layer")
 
 
-try:
-    import talib
-    TALIB_AVAILABLE = True
+TALIB_AVAILABLE = importlib.util.find_spec("talib") is not None
+if TALIB_AVAILABLE:
     print("✅ TALib available for advanced indicators")
-except ImportError:
-    TALIB_AVAILABLE = False
+else:
     print("⚠️ TALib not available - install with: pip install TA-Lib")
 
-try:
-    from sklearn.ensemble import RandomForestClassifier
-    from sklearn.preprocessing import StandardScaler
-    import joblib
-    ML_AVAILABLE = True
+# sklearn alone costs ~1 s to import; the model code imports it when it first trains.
+ML_AVAILABLE = importlib.util.find_spec("sklearn") is not None
+if ML_AVAILABLE:
     print("✅ ML libraries available")
-except ImportError:
-    ML_AVAILABLE = False
+else:
     print("⚠️ ML libraries not available - install with: pip install scikit-learn")
     
 # Fix encoding issues
 os.environ['PYTHONIOENCODING'] = 'utf-8'
 
 # AI Dependencies (optional)
-try:
-    from textblob import TextBlob
-    import feedparser
-    AI_FEATURES_AVAILABLE = True
+AI_FEATURES_AVAILABLE = all(importlib.util.find_spec(m) is not None for m in ("textblob", "feedparser"))
+if AI_FEATURES_AVAILABLE:
     print("✅ AI features available")
-except ImportError:
-    AI_FEATURES_AVAILABLE = False
+else:
     print("⚠️ AI features disabled - install: pip install textblob feedparser")
 
 # Advanced features (optional)
@@ -1581,6 +1548,35 @@ CORS(app, resources={
     }
 })
 
+# ── Metrics (metrics.py) → GET /metrics ──────────────────────────────────────
+# Latency histograms per route, per external dependency and per scan phase; the caches,
+# queues and threads are read by a collector at scrape time (registered with /metrics).
+import metrics as _metrics
+_METRICS = _metrics.Registry("v3k_")
+_M_ROUTE = _METRICS.histogram("http_request_seconds", "Flask route latency.", ("route", "method"))
+_M_STATUS = _METRICS.counter("http_requests_total", "Flask responses by status.", ("route", "method", "status"))
+_M_EXT = _METRICS.histogram("external_call_seconds", "Latency of calls to external services.", ("dependency",))
+_M_EXT_ERR = _METRICS.counter("external_call_errors_total", "Failed external calls (exception or HTTP >= 400).",
+                              ("dependency", "reason"))
+_M_SCAN = _METRICS.histogram("scan_phase_seconds", "V3K scan time per phase (phase=total: whole scan).", ("phase",))
+_metrics.instrument_requests(_M_EXT, _M_EXT_ERR, [
+    ("api.telegram.org", "telegram"), ("api.anthropic.com", "anthropic"), ("news.google.com", "google_news"),
+    ("upstash.io", "upstash"), ("kvdb.io", "kvdb"), ("nseindia.com", "nse"), ("yahoo.com", "yahoo"),
+    ("kite.trade", "kite")])
+
+@app.before_request
+def _metrics_start():
+    request.environ["v3k.t0"] = time_module.perf_counter()
+
+@app.after_request
+def _metrics_observe(response):
+    t0 = request.environ.get("v3k.t0")
+    if t0 is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        _M_ROUTE.observe(time_module.perf_counter() - t0, route, request.method)
+        _M_STATUS.inc(route, request.method, str(response.status_code))
+    return response
+
 # Global application state - CRITICAL FOR SIGNALS
 class TradingBotState:
     def __init__(self):
@@ -1647,8 +1643,10 @@ def is_market_open():
 def get_live_stock_data(symbol, period="5d", interval="15m"):
     """Get live stock data from Yahoo Finance"""
     try:
+        import yfinance as yf
         ticker = yf.Ticker(symbol)
-        data = ticker.history(period=period, interval=interval)
+        with _M_EXT.time("yahoo_history"):
+            data = ticker.history(period=period, interval=interval)
         
         if data.empty:
             print(f"No data for {symbol}")
@@ -1925,85 +1923,94 @@ def generate_live_scalping_signals():
     return scalping_signals
 
 # ====== CORE LIVE BACKGROUND SCANNER - MUST NOT BE OVERWRITTEN ======
-def background_scanner():
-    """LIVE background scanner that generates real-time signals - CORE FUNCTION"""
+def _legacy_scan_once():
+    """One pass of the live scanner: equity / option / scalping signals into bot_state
+    (published to the KV store too when a job runner does the scanning for the web workers)."""
     global cached_signals, cached_options, cached_scalping, last_scan_time, bot_state
     
-    while True:
-        try:
-            print("Starting LIVE signal scan...")
-            current_time = datetime.now()
-            market_open = is_market_open()
-            
-            bot_state.scan_status = "scanning"
-            
-            # Generate LIVE equity signals
-            equity_signals = []
-            symbols_to_scan = NIFTY_50_SYMBOLS[:12]  # Top 12 for faster scanning
-            
-            print(f"Scanning {len(symbols_to_scan)} symbols for live signals...")
-            
-            for symbol in symbols_to_scan:
+    try:
+        print("Starting LIVE signal scan...")
+        current_time = datetime.now()
+        market_open = is_market_open()
+        
+        bot_state.scan_status = "scanning"
+        
+        # Generate LIVE equity signals
+        equity_signals = []
+        symbols_to_scan = NIFTY_50_SYMBOLS[:12]  # Top 12 for faster scanning
+        
+        print(f"Scanning {len(symbols_to_scan)} symbols for live signals...")
+        
+        for symbol in symbols_to_scan:
+            try:
+                data = get_live_stock_data(symbol, period="5d", interval="15m")
+                if data is not None:
+                    data_with_indicators = calculate_technical_indicators(data)
+                    signals = analyze_stock_signals(symbol, data_with_indicators)
+                    equity_signals.extend(signals)
+                    if signals:
+                        print(f"Scanned {symbol}: {len(signals)} signals")
+            except Exception as e:
+                print(f"Error scanning {symbol}: {e}")
+        
+        # Generate LIVE option signals
+        print("Generating live option signals...")
+        option_signals = generate_live_option_signals()
+        
+        # Generate LIVE scalping signals
+        print("Generating live scalping signals...")
+        scalping_signals = generate_live_scalping_signals()
+        
+        # Sort signals by strength and take top signals
+        equity_signals = sorted(equity_signals, key=lambda x: x.get('strength', 0), reverse=True)[:10]
+        option_signals = sorted(option_signals, key=lambda x: x.get('strength', 0), reverse=True)[:6]
+        scalping_signals = sorted(scalping_signals, key=lambda x: x.get('strength', 0), reverse=True)[:8]
+        
+        # Update global variables - CRITICAL
+        cached_signals = equity_signals
+        cached_options = option_signals
+        cached_scalping = scalping_signals
+        last_scan_time = current_time
+        
+        # Update bot_state - CRITICAL
+        bot_state.cached_signals = equity_signals
+        bot_state.cached_options = option_signals
+        bot_state.cached_scalping = scalping_signals
+        bot_state.last_scan_time = current_time
+        bot_state.scan_status = "completed"
+        
+        # Calculate performance metrics
+        all_signals = equity_signals + option_signals + scalping_signals
+        bot_state.performance_metrics = calculate_performance_metrics(all_signals)
+        
+        total_signals = len(all_signals)
+        print(f"LIVE SCAN COMPLETED: {total_signals} signals - {len(equity_signals)} equity, {len(option_signals)} options, {len(scalping_signals)} scalping")
+        print(f"Market Open: {market_open}, Next scan in: {30 if market_open else 120}s")
+        
+        # Send high priority alerts
+        high_priority_signals = [s for s in all_signals if s.get('strength', 0) >= 85]
+        if high_priority_signals:
+            for signal in high_priority_signals[:2]:
                 try:
-                    data = get_live_stock_data(symbol, period="5d", interval="15m")
-                    if data is not None:
-                        data_with_indicators = calculate_technical_indicators(data)
-                        signals = analyze_stock_signals(symbol, data_with_indicators)
-                        equity_signals.extend(signals)
-                        if signals:
-                            print(f"Scanned {symbol}: {len(signals)} signals")
+                    send_telegram_alert_internal(signal)
+                    print(f"Alert sent for {signal['symbol']} (Strength: {signal['strength']})")
                 except Exception as e:
-                    print(f"Error scanning {symbol}: {e}")
-            
-            # Generate LIVE option signals
-            print("Generating live option signals...")
-            option_signals = generate_live_option_signals()
-            
-            # Generate LIVE scalping signals
-            print("Generating live scalping signals...")
-            scalping_signals = generate_live_scalping_signals()
-            
-            # Sort signals by strength and take top signals
-            equity_signals = sorted(equity_signals, key=lambda x: x.get('strength', 0), reverse=True)[:10]
-            option_signals = sorted(option_signals, key=lambda x: x.get('strength', 0), reverse=True)[:6]
-            scalping_signals = sorted(scalping_signals, key=lambda x: x.get('strength', 0), reverse=True)[:8]
-            
-            # Update global variables - CRITICAL
-            cached_signals = equity_signals
-            cached_options = option_signals
-            cached_scalping = scalping_signals
-            last_scan_time = current_time
-            
-            # Update bot_state - CRITICAL
-            bot_state.cached_signals = equity_signals
-            bot_state.cached_options = option_signals
-            bot_state.cached_scalping = scalping_signals
-            bot_state.last_scan_time = current_time
-            bot_state.scan_status = "completed"
-            
-            # Calculate performance metrics
-            all_signals = equity_signals + option_signals + scalping_signals
-            bot_state.performance_metrics = calculate_performance_metrics(all_signals)
-            
-            total_signals = len(all_signals)
-            print(f"LIVE SCAN COMPLETED: {total_signals} signals - {len(equity_signals)} equity, {len(option_signals)} options, {len(scalping_signals)} scalping")
-            print(f"Market Open: {market_open}, Next scan in: {30 if market_open else 120}s")
-            
-            # Send high priority alerts
-            high_priority_signals = [s for s in all_signals if s.get('strength', 0) >= 85]
-            if high_priority_signals:
-                for signal in high_priority_signals[:2]:
-                    try:
-                        send_telegram_alert_internal(signal)
-                        print(f"Alert sent for {signal['symbol']} (Strength: {signal['strength']})")
-                    except Exception as e:
-                        print(f"Alert sending failed: {e}")
-            
-        except Exception as e:
-            print(f"LIVE scanner error: {e}")
-            print(traceback.format_exc())
-            bot_state.scan_status = "error"
+                    print(f"Alert sending failed: {e}")
         
+    except Exception as e:
+        print(f"LIVE scanner error: {e}")
+        print(traceback.format_exc())
+        bot_state.scan_status = "error"
+    
+    if _BACKGROUND == "runner":
+        _legacy_publish()
+    return {"status": bot_state.scan_status, "equity": len(bot_state.cached_signals),
+            "options": len(bot_state.cached_options), "scalping": len(bot_state.cached_scalping)}
+
+def background_scanner():
+    """LIVE background scanner that generates real-time signals - CORE FUNCTION"""
+    while True:
+        _legacy_scan_once()
         # Sleep based on market hours
         sleep_time = 30 if is_market_open() else 120
         time_module.sleep(sleep_time)
@@ -2347,7 +2354,9 @@ class NewsAnalyzer:
             
             for source_url in news_sources:
                 try:
-                    feed = feedparser.parse(source_url)
+                    import feedparser
+                    with _M_EXT.time("yahoo"):
+                        feed = feedparser.parse(source_url)
                     
                     for entry in feed.entries[:5]:
                         news_item = {
@@ -2375,6 +2384,7 @@ class NewsAnalyzer:
             return "Neutral"
         
         try:
+            from textblob import TextBlob
             blob = TextBlob(text)
             polarity = blob.sentiment.polarity
             
@@ -2411,7 +2421,7 @@ class AdvancedTechnicalAnalyzer:
     
     def __init__(self):
         self.ml_model = None
-        self.scaler = StandardScaler()
+        self.scaler = None
         self.trained = False
         self.feature_columns = [
             'RSI', 'ADX', 'CCI', 'MFI', 'ATR', 'Volume_Ratio', 
@@ -2423,6 +2433,7 @@ class AdvancedTechnicalAnalyzer:
         try:
             if not TALIB_AVAILABLE or data is None or len(data) < 30:
                 return data
+            import talib
             
             # Convert to numpy arrays for TALib
             high = data['High'].values.astype(float)
@@ -2929,8 +2940,26 @@ def send_welcome():
         return jsonify({"sent": False, "error": str(e)}), 200
 
 
-_EXPLAIN_CACHE = {}     # "sym|side" -> (ts, dict)
+# ── In-process caches (ttl_cache.py): bounded LRU + TTL, single-flight loads ─
+# Caches of JSON-able results also sit in front of a host-wide file tier (SHARED_CACHE_DIR,
+# default .shared_cache; "off" disables), so every gunicorn worker on the machine reuses
+# one computation — and one Claude / Yahoo call — per entry instead of repeating it.
+from ttl_cache import TTLCache, FileTier
+import ttl_cache as _ttl_cache
+
+def _shared_tier():
+    root = os.environ.get("SHARED_CACHE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".shared_cache")
+    if root.lower() == "off":
+        return None
+    try:
+        return FileTier(root)
+    except OSError as e:
+        logging.warning("shared cache tier unavailable (%s) — caches stay per-process", e)
+        return None
+_CACHE_TIER = _shared_tier()
+
 _EXPLAIN_TTL   = 1800   # 30 min
+_EXPLAIN_CACHE = TTLCache("explain", 256, _EXPLAIN_TTL, shared=_CACHE_TIER)     # "sym|side" -> dict
 
 @app.route("/explain-signal", methods=["POST"])
 def explain_signal():
@@ -2943,67 +2972,64 @@ def explain_signal():
         if not sym:
             return jsonify({"explanation": "", "engine": "none"}), 200
         key = sym + "|" + side
-        now = time_module.time()
-        c = _EXPLAIN_CACHE.get(key)
-        if c and now - c[0] < _EXPLAIN_TTL:
-            return jsonify(c[1]), 200
-
-        price = d.get("price"); t1 = d.get("t1"); sl = d.get("sl")
-        strat = str(d.get("strat", ""))[:200]
-        backtest = d.get("backtest"); ml = d.get("ml")
-        news = d.get("news") or {}
-        nlabel = str(news.get("label", "")); nreason = str(news.get("reason", ""))[:160]
-        regime = str(d.get("regime", ""))[:120]
-        rr = None
-        try:
-            if price and t1 and sl and (price - sl) != 0:
-                rr = round(abs((t1 - price) / (price - sl)), 2)
-        except Exception:
-            rr = None
 
-        facts = (
-            "Ticker: %s\nDirection: %s\nEntry: %s  Target: %s  Stop: %s  (reward:risk ≈ %s)\n"
-            "Technical basis: %s\nBacktested win-rate: %s%%\nML win-probability: %s%%\n"
-            "News sentiment: %s — %s\nMarket regime: %s"
-            % (sym, side.upper(), price, t1, sl, rr, strat, backtest,
-               ml if ml is not None else "n/a", nlabel or "n/a", nreason or "n/a", regime or "n/a")
-        )
-
-        engine = "template"; text = ""
-        if _ANTHROPIC_KEY:
+        def _build():
+            price = d.get("price"); t1 = d.get("t1"); sl = d.get("sl")
+            strat = str(d.get("strat", ""))[:200]
+            backtest = d.get("backtest"); ml = d.get("ml")
+            news = d.get("news") or {}
+            nlabel = str(news.get("label", "")); nreason = str(news.get("reason", ""))[:160]
+            regime = str(d.get("regime", ""))[:120]
+            rr = None
             try:
-                prompt = (
-                    "You are a candid trading coach. Using ONLY the facts below, write 2-3 short sentences "
-                    "in plain English explaining WHY this setup triggered, then ONE sentence naming the single "
-                    "biggest risk. Be honest and specific, no hype, no financial advice, no disclaimers.\n\n" + facts
-                )
-                r = requests.post(
-                    "https://api.anthropic.com/v1/messages", timeout=25,
-                    headers={"x-api-key": _ANTHROPIC_KEY, "anthropic-version": "2023-06-01", "content-type": "application/json"},
-                    json={"model": _ANTHROPIC_MODEL, "max_tokens": 220, "messages": [{"role": "user", "content": prompt}]},
-                )
-                if r.status_code == 200:
-                    text = "".join(b.get("text", "") for b in r.json().get("content", []) if b.get("type") == "text").strip()
-                    engine = "claude" if text else "template"
-            except Exception as e:
-                try: logging.warning("explain claude failed: %s", e)
-                except Exception: pass
-
-        if not text:
-            bits = []
-            bits.append("%s is flagged %s on %s." % (sym, side.upper(), strat or "the composite model"))
-            if rr is not None:
-                bits.append("The plan risks 1 to make about %s (target %s, stop %s)." % (rr, t1, sl))
-            if nlabel and nlabel != "neutral":
-                bits.append("Recent news is %s%s." % (nlabel, (": " + nreason) if nreason else ""))
-            if regime:
-                bits.append("Market backdrop: %s." % regime)
-            bits.append("Biggest risk: the wide stop means a single adverse move can erase several wins, so honour the stop.")
-            text = " ".join(bits)
-
-        out = {"explanation": text, "engine": engine, "rr": rr}
-        _EXPLAIN_CACHE[key] = (now, out)
-        return jsonify(out), 200
+                if price and t1 and sl and (price - sl) != 0:
+                    rr = round(abs((t1 - price) / (price - sl)), 2)
+            except Exception:
+                rr = None
+
+            facts = (
+                "Ticker: %s\nDirection: %s\nEntry: %s  Target: %s  Stop: %s  (reward:risk ≈ %s)\n"
+                "Technical basis: %s\nBacktested win-rate: %s%%\nML win-probability: %s%%\n"
+                "News sentiment: %s — %s\nMarket regime: %s"
+                % (sym, side.upper(), price, t1, sl, rr, strat, backtest,
+                   ml if ml is not None else "n/a", nlabel or "n/a", nreason or "n/a", regime or "n/a")
+            )
+
+            engine = "template"; text = ""
+            if _ANTHROPIC_KEY:
+                try:
+                    prompt = (
+                        "You are a candid trading coach. Using ONLY the facts below, write 2-3 short sentences "
+                        "in plain English explaining WHY this setup triggered, then ONE sentence naming the single "
+                        "biggest risk. Be honest and specific, no hype, no financial advice, no disclaimers.\n\n" + facts
+                    )
+                    r = requests.post(
+                        "https://api.anthropic.com/v1/messages", timeout=25,
+                        headers={"x-api-key": _ANTHROPIC_KEY, "anthropic-version": "2023-06-01", "content-type": "application/json"},
+                        json={"model": _ANTHROPIC_MODEL, "max_tokens": 220, "messages": [{"role": "user", "content": prompt}]},
+                    )
+                    if r.status_code == 200:
+                        text = "".join(b.get("text", "") for b in r.json().get("content", []) if b.get("type") == "text").strip()
+                        engine = "claude" if text else "template"
+                except Exception as e:
+                    try: logging.warning("explain claude failed: %s", e)
+                    except Exception: pass
+
+            if not text:
+                bits = []
+                bits.append("%s is flagged %s on %s." % (sym, side.upper(), strat or "the composite model"))
+                if rr is not None:
+                    bits.append("The plan risks 1 to make about %s (target %s, stop %s)." % (rr, t1, sl))
+                if nlabel and nlabel != "neutral":
+                    bits.append("Recent news is %s%s." % (nlabel, (": " + nreason) if nreason else ""))
+                if regime:
+                    bits.append("Market backdrop: %s." % regime)
+                bits.append("Biggest risk: the wide stop means a single adverse move can erase several wins, so honour the stop.")
+                text = " ".join(bits)
+
+            return {"explanation": text, "engine": engine, "rr": rr}
+
+        return jsonify(_EXPLAIN_CACHE.get_or_set(key, _build)), 200
     except Exception as e:
         return jsonify({"explanation": "", "engine": "error", "error": str(e)}), 200
 
@@ -3054,12 +3080,11 @@ def news_sentiment():
         syms = [str(s).upper().strip() for s in (d.get("symbols") or []) if str(s).strip()][:12]
         if not syms:
             return jsonify({"engine": "none", "results": {}}), 200
-        now = time_module.time()
         results, need = {}, []
         for s in syms:
             c = _NEWS_SENT_CACHE.get(market + ":" + s)
-            if c and now - c[0] < _NEWS_SENT_TTL:
-                results[s] = c[1]
+            if c is not None:
+                results[s] = c
             else:
                 need.append(s)
         engine = "cache"
@@ -3071,7 +3096,7 @@ def news_sentiment():
                 scored = {it["sym"]: _score_news_keyword(it["sym"], it["headlines"]) for it in items}
             for s in need:
                 res = scored.get(s) or _score_news_keyword(s, [])
-                _NEWS_SENT_CACHE[market + ":" + s] = (now, res)
+                _NEWS_SENT_CACHE.set(market + ":" + s, res)
                 results[s] = res
         return jsonify({"engine": engine, "results": results}), 200
     except Exception as e:
@@ -3241,9 +3266,8 @@ class MultiTimeframeAnalyzer:
             '1d': {'period': '1y', 'interval': '1d', 'weight': TimeframeWeight.DAY_1.value}
         }
         
-        self.analysis_cache = {}
-        self.cache_lock = Lock()
         self.cache_timeout = 300  # 5 minutes
+        self.analysis_cache = TTLCache("mtf_analysis", 256, self.cache_timeout)   # symbol -> result
         
         # Confluence requirements for different recommendation levels
         self.recommendation_criteria = {
@@ -3280,56 +3304,47 @@ class MultiTimeframeAnalyzer:
         }
         
     def analyze_symbol_multi_timeframe(self, symbol: str, include_patterns: bool = True) -> MultiTimeframeResult:
-        """Perform comprehensive multi-timeframe analysis"""
+        """Perform comprehensive multi-timeframe analysis (cached per symbol for cache_timeout)"""
         try:
-            # Check cache first
-            cache_key = f"{symbol}_{int(datetime.now().timestamp() // self.cache_timeout)}"
-            
-            with self.cache_lock:
-                if cache_key in self.analysis_cache:
-                    print(f"📊 Using cached analysis for {symbol.replace('.NS', '')}")
-                    return self.analysis_cache[cache_key]
-            
-            print(f"🔍 Starting multi-timeframe analysis for {symbol.replace('.NS', '')}")
-            
-            timeframe_results = {}
-            
-            # Analyze each timeframe (can be parallelized for speed)
-            with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-                future_to_tf = {
-                    executor.submit(self._analyze_single_timeframe, symbol, tf, config, include_patterns): tf
-                    for tf, config in self.timeframes.items()
-                }
-                
-                for future in concurrent.futures.as_completed(future_to_tf):
-                    tf = future_to_tf[future]
-                    try:
-                        result = future.result(timeout=30)
-                        if result:
-                            timeframe_results[tf] = result
-                            print(f"  ✅ {tf}: {result.trend_direction.value} (Strength: {result.signal_strength:.1f}%)")
-                    except Exception as e:
-                        print(f"  ❌ {tf}: Analysis failed - {e}")
-            
-            if not timeframe_results:
-                print(f"❌ No timeframe analysis completed for {symbol}")
-                return None
-            
-            # Calculate overall consensus
-            consensus_result = self._calculate_consensus(symbol, timeframe_results)
-            
-            # Cache the result
-            with self.cache_lock:
-                self.analysis_cache[cache_key] = consensus_result
-            
-            print(f"🎯 Multi-timeframe analysis complete for {symbol.replace('.NS', '')}")
-            print(f"   Overall: {consensus_result.recommendation} | Consensus: {consensus_result.consensus_score:.1f}%")
-            
-            return consensus_result
-            
+            return self.analysis_cache.get_or_set(
+                symbol, lambda: self._analyze_uncached(symbol, include_patterns), cache_none=False)
         except Exception as e:
             print(f"Multi-timeframe analysis error for {symbol}: {e}")
             return None
+
+    def _analyze_uncached(self, symbol: str, include_patterns: bool) -> MultiTimeframeResult:
+        print(f"🔍 Starting multi-timeframe analysis for {symbol.replace('.NS', '')}")
+        
+        timeframe_results = {}
+        
+        # Analyze each timeframe (can be parallelized for speed)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+            future_to_tf = {
+                executor.submit(self._analyze_single_timeframe, symbol, tf, config, include_patterns): tf
+                for tf, config in self.timeframes.items()
+            }
+            
+            for future in concurrent.futures.as_completed(future_to_tf):
+                tf = future_to_tf[future]
+                try:
+                    result = future.result(timeout=30)
+                    if result:
+                        timeframe_results[tf] = result
+                        print(f"  ✅ {tf}: {result.trend_direction.value} (Strength: {result.signal_strength:.1f}%)")
+                except Exception as e:
+                    print(f"  ❌ {tf}: Analysis failed - {e}")
+        
+        if not timeframe_results:
+            print(f"❌ No timeframe analysis completed for {symbol}")
+            return None
+        
+        # Calculate overall consensus
+        consensus_result = self._calculate_consensus(symbol, timeframe_results)
+        
+        print(f"🎯 Multi-timeframe analysis complete for {symbol.replace('.NS', '')}")
+        print(f"   Overall: {consensus_result.recommendation} | Consensus: {consensus_result.consensus_score:.1f}%")
+        
+        return consensus_result
     
     def _analyze_single_timeframe(self, symbol: str, timeframe: str, config: dict, include_patterns: bool) -> Optional[TimeframeAnalysis]:
         """Analyze a single timeframe for the symbol"""
@@ -3928,8 +3943,8 @@ class MultiTimeframeAnalyzer:
         except Exception as e:
             return "HIGH"
 
-# Initialize multi-timeframe analyzer
-multi_tf_analyzer = MultiTimeframeAnalyzer()
+# Initialize multi-timeframe analyzer (on first use)
+multi_tf_analyzer = _SUBS.register("mtf", MultiTimeframeAnalyzer, "MultiTimeframeAnalyzer + its result cache")
 
 # Enhanced signal generation with multi-timeframe analysis
 def generate_multi_timeframe_signals(symbols_list: List[str], max_symbols: int = 6) -> List[Dict]:
@@ -4070,10 +4085,10 @@ def get_multi_timeframe_analysis(symbol):
                 "key_levels": analysis.key_levels
             }
         
-        return jsonify({
+        return _send({
             "multi_timeframe_analysis": response,
             "timestamp": datetime.now().isoformat()
-        })
+        }, multi_tf_analyzer.cache_timeout, volatile=("timestamp",))
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -4145,9 +4160,7 @@ def get_timeframe_summary():
 def clear_multi_timeframe_cache():
     """Clear multi-timeframe analysis cache"""
     try:
-        with multi_tf_analyzer.cache_lock:
-            cache_size = len(multi_tf_analyzer.analysis_cache)
-            multi_tf_analyzer.analysis_cache.clear()
+        cache_size = multi_tf_analyzer.analysis_cache.clear()
         
         return jsonify({
             "status": "success",
@@ -4230,17 +4243,7 @@ def get_ultimate_enhanced_signals():
         print(f"Ultimate signals error: {e}")
         return jsonify({"error": str(e), "ultimate_signals": []}), 500
 
-print("🚀 Enhancement #4: Multi-Timeframe Analysis System - LOADED!")
-print("✅ 5-timeframe analysis (5m, 15m, 1h, 4h, 1d)")
-print("✅ Weighted consensus scoring")
-print("✅ Professional recommendation engine")
-print("✅ Trend alignment verification")
-print("✅ Pattern detection across timeframes")
-print("✅ Risk level assessment")
-print("✅ Conflicting signal detection")
-print("✅ New endpoints: /multi-timeframe-analysis, /get-multi-timeframe-signals")
-print("✅ Ultimate signals combining all 4 enhancements: /get-ultimate-signals")
-print("🎯 Professional-grade multi-timeframe analysis complete!")
+_SUBS.mark("multi-timeframe layer")
 
 
 # ====== ENHANCEMENT #5: SMART ALERT SYSTEM WITH ADVANCED FILTERING ======
@@ -5133,8 +5136,8 @@ class SmartAlertSystem:
             print(f"Alert statistics error: {e}")
             return {'error': str(e)}
 
-# Initialize the smart alert system
-smart_alerts = SmartAlertSystem()
+# Initialize the smart alert system (on first use)
+smart_alerts = _SUBS.register("alerts", SmartAlertSystem, "SmartAlertSystem (filters, channels, delivery queue)")
 
 # Background alert processor
 def start_alert_processor():
@@ -5419,11 +5422,13 @@ def get_smart_filtered_signals():
         return jsonify({"error": str(e), "smart_filtered_signals": []}), 500
 
 # Integration with existing systems
-def init_smart_alert_system():
-    """Initialize smart alert system integration"""
+def init_smart_alert_system(start_processor=True):
+    """Initialize smart alert system integration. start_processor=False only registers the
+    callbacks (delivery is jobs.py's alert_delivery job)."""
     try:
         # Start alert processor
-        start_alert_processor()
+        if start_processor:
+            start_alert_processor()
         
         # Add alert callback to real-time streamer
         if 'real_time_streamer' in globals():
@@ -5485,16 +5490,7 @@ def init_smart_alert_system():
     except Exception as e:
         print(f"Smart alert system initialization error: {e}")
 
-print("🚀 Enhancement #5: Smart Alert System - LOADED!")
-print("✅ Advanced alert filtering (strength, consensus, price range)")
-print("✅ Multi-channel delivery (Telegram, Email, Webhook)")
-print("✅ Intelligent cooldowns and rate limiting")
-print("✅ Priority-based alert management")
-print("✅ Custom alert rules and templates")
-print("✅ Comprehensive delivery tracking")
-print("✅ Real-time alert processing")
-print("✅ New endpoints: /alert-filters, /alert-statistics, /send-test-alert")
-print("🔔 Professional-grade alert system ready!")
+_SUBS.mark("smart-alert layer")
 
 
 # ====== MAIN APPLICATION ENTRY POINT ======
@@ -5556,13 +5552,6 @@ if __name__ == "__main__":
     finally:
         print("👋 V3K AI Trading Bot terminated.")
 
-# ====== FINAL STATUS MESSAGE ======# ====== FINAL STATUS MESSAGE ======
-print("🎯 V3K AI Trading Bot - Complete Platform Loaded Successfully!")
-print("📊 Features: Live Signals + AI Assistant + Advanced Analytics")
-print("🚀 Ready for production trading!")
-
-# Note: The above should be at the END of your file, not here in the middle
-
 # ====== FIXED API ROUTES ======
 
 @app.route("/get-signals", methods=["GET"])
@@ -5929,7 +5918,6 @@ def toggle_demo_mode():
 def sector_performance():
     """Get NSE sector index performance (1-day change) using yfinance"""
     try:
-        import yfinance as yf
         sector_map = {
             "IT":     "^CNXit",
             "Bank":   "^NSEBANK",
@@ -5942,19 +5930,9 @@ def sector_performance():
             "Infra":  "^CNXINFRA",
             "Media":  "^CNXMEDIA",
         }
-        sectors = []
-        for name, symbol in sector_map.items():
-            try:
-                hist = yf.Ticker(symbol).history(period="2d")
-                if len(hist) >= 2:
-                    chg = round((hist["Close"].iloc[-1] - hist["Close"].iloc[-2]) / hist["Close"].iloc[-2] * 100, 2)
-                elif len(hist) == 1:
-                    chg = 0.0
-                else:
-                    chg = 0.0
-                sectors.append({"name": name, "change": chg})
-            except Exception:
-                sectors.append({"name": name, "change": 0.0})
+        quotes = _QUOTES.get(list(sector_map.values()))
+        sectors = [{"name": name, "change": round(quotes[symbol]["change"], 2) if quotes.get(symbol) else 0.0}
+                   for name, symbol in sector_map.items()]
         return jsonify({"sectors": sectors, "timestamp": datetime.now().isoformat()})
     except Exception as e:
         return jsonify({"error": str(e), "sectors": []}), 500
@@ -5991,7 +5969,8 @@ def get_us_signals():
         signals = []
         for sym in us_tickers:
             try:
-                hist = yf.Ticker(sym).history(period="5d", interval="1d")
+                with _M_EXT.time("yahoo_history"):
+                    hist = yf.Ticker(sym).history(period="5d", interval="1d")
                 if len(hist) < 2:
                     continue
                 close  = hist["Close"].iloc[-1]
@@ -6026,29 +6005,16 @@ def get_us_signals():
 def watchlist_prices():
     """Fetch latest price + 1-day change for a list of symbols (NSE and US)"""
     try:
-        import yfinance as yf
         data    = request.json or {}
         symbols = data.get("symbols", [])[:30]  # cap at 30
-        prices  = {}
-        for sym in symbols:
-            try:
-                # Auto-detect NSE vs US: if no exchange suffix and not in US list, add .NS
-                us_set = {"AAPL","MSFT","NVDA","GOOGL","GOOG","AMZN","META","TSLA","JPM",
-                          "JNJ","V","UNH","HD","PG","MA","DIS","BAC","ADBE","CRM","NFLX",
-                          "INTC","AMD","QCOM","ORCL","SBUX","COIN","PYPL","UBER","PLTR","SPY","QQQ"}
-                ticker_sym = sym if (sym in us_set or "." in sym) else sym + ".NS"
-                hist = yf.Ticker(ticker_sym).history(period="2d", interval="1d")
-                if len(hist) >= 2:
-                    price  = round(hist["Close"].iloc[-1], 2)
-                    change = round((hist["Close"].iloc[-1] - hist["Close"].iloc[-2]) / hist["Close"].iloc[-2] * 100, 2)
-                elif len(hist) == 1:
-                    price  = round(hist["Close"].iloc[-1], 2)
-                    change = 0.0
-                else:
-                    continue
-                prices[sym] = {"price": price, "change": change}
-            except Exception:
-                continue
+        # Auto-detect NSE vs US: if no exchange suffix and not in US list, add .NS
+        us_set = {"AAPL","MSFT","NVDA","GOOGL","GOOG","AMZN","META","TSLA","JPM",
+                  "JNJ","V","UNH","HD","PG","MA","DIS","BAC","ADBE","CRM","NFLX",
+                  "INTC","AMD","QCOM","ORCL","SBUX","COIN","PYPL","UBER","PLTR","SPY","QQQ"}
+        tickers = {sym: sym if (sym in us_set or "." in sym) else sym + ".NS" for sym in symbols}
+        quotes  = _QUOTES.get(list(tickers.values()))
+        prices  = {sym: {"price": round(quotes[t]["price"], 2), "change": round(quotes[t]["change"], 2)}
+                   for sym, t in tickers.items() if quotes.get(t)}
         return jsonify({"prices": prices, "timestamp": datetime.now().isoformat()})
     except Exception as e:
         return jsonify({"error": str(e), "prices": {}}), 500
@@ -6081,6 +6047,17 @@ def _kite_load_token():
         pass
     return None
 
+def _tick_source():
+    """Tick source for RealTimeDataStreamer. TICK_SOURCE=replay:<file>[@speed] replays a
+    recorded JSON-lines session; otherwise the Kite WebSocket with today's token (or None)."""
+    from tick_stream import KiteSource, ReplaySource
+    spec = _os.environ.get("TICK_SOURCE", "").strip()
+    if spec.startswith("replay:"):
+        path, _, speed = spec[len("replay:"):].partition("@")
+        return ReplaySource(path, float(speed or 1.0))
+    token = _kite_load_token()
+    return KiteSource(KITE_API_KEY, token) if token else None
+
 @app.route("/zerodha/login-url", methods=["GET"])
 def zerodha_login_url():
     return jsonify({"url": f"https://kite.zerodha.com/connect/login?v=3&api_key={KITE_API_KEY}"})
@@ -6263,8 +6240,8 @@ import xml.etree.ElementTree as _ET
 
 _ANTHROPIC_KEY   = _clean_env("ANTHROPIC_API_KEY", "CLAUDE_API_KEY")
 _ANTHROPIC_MODEL = _clean_env("ANTHROPIC_MODEL") or "claude-haiku-4-5-20251001"
-_NEWS_SENT_CACHE = {}      # "market:SYM" -> (ts, result)
 _NEWS_SENT_TTL   = 900     # 15 min — news doesn't change minute-to-minute
+_NEWS_SENT_CACHE = TTLCache("news_sentiment", 256, _NEWS_SENT_TTL, shared=_CACHE_TIER)   # "market:SYM" -> result
 
 def _news_query(sym, market):
     if (market or "india") == "us":
@@ -6369,60 +6346,69 @@ def _score_news_claude(items):
         except Exception: pass
         return None
 
-def _kv_file(key):
-    return os.path.join(os.path.dirname(os.path.abspath(__file__)), key + ".json")
-
 def _storage_kind():
     if _UPSTASH_URL and _UPSTASH_TOKEN: return "upstash"
     if _KVDB_BUCKET: return "kvdb"
     return "local(ephemeral)"
 
+# All KV traffic goes through one KVStore (kv_store.py): reads are served from a short-TTL
+# in-process cache, writes are visible immediately in this process and flushed to the
+# backend in coalesced batches (one Upstash MSET per flush window). KV_CACHE_TTL bounds how
+# stale another worker's writes can look here.
+from kv_store import KVStore, Lease, UpstashBackend, KvdbBackend, FileBackend
+
+def _kv_backend():
+    kind = _storage_kind()
+    if kind == "upstash": return UpstashBackend(_UPSTASH_URL, _UPSTASH_TOKEN)
+    if kind == "kvdb": return KvdbBackend(_KVDB_BUCKET)
+    return FileBackend(os.path.dirname(os.path.abspath(__file__)))
+
+_KV = KVStore(_kv_backend(), ttl=float(os.environ.get("KV_CACHE_TTL", "10")),
+              flush_interval=float(os.environ.get("KV_FLUSH_INTERVAL", "1")))
+
 def _kv_get(key, default):
-    if _UPSTASH_URL and _UPSTASH_TOKEN:
-        try:
-            r = requests.get("%s/get/%s" % (_UPSTASH_URL, key),
-                             headers={"Authorization": "Bearer %s" % _UPSTASH_TOKEN}, timeout=12)
-            v = r.json().get("result")
-            return json.loads(v) if v else default
-        except Exception:
-            return default
-    if _KVDB_BUCKET:
-        try:
-            r = requests.get("https://kvdb.io/%s/%s" % (_KVDB_BUCKET, key), timeout=12)
-            if r.status_code == 200 and r.text.strip():
-                return json.loads(r.text)
-            return default
-        except Exception:
-            return default
-    try:
-        with open(_kv_file(key)) as f:
-            return json.load(f)
-    except Exception:
-        return default
+    return _KV.get(key, default)
 
-def _kv_set(key, value):
-    data = json.dumps(value)
-    if _UPSTASH_URL and _UPSTASH_TOKEN:
-        try:
-            requests.post("%s/set/%s" % (_UPSTASH_URL, key), data=data.encode("utf-8"),
-                          headers={"Authorization": "Bearer %s" % _UPSTASH_TOKEN}, timeout=12)
-            return
-        except Exception:
-            pass
-    if _KVDB_BUCKET:
-        try:
-            requests.put("https://kvdb.io/%s/%s" % (_KVDB_BUCKET, key), data=data.encode("utf-8"), timeout=12)
-            return
-        except Exception:
-            pass
-    try:
-        with open(_kv_file(key), "w") as f:
-            f.write(data)
-    except Exception:
-        pass
+def _kv_set(key, value, lease=None):
+    """Write-behind set; with a `lease` the write is immediate and fenced (False if the
+    lease was lost to a newer holder — nothing written)."""
+    if lease is not None:
+        return _KV.set_fenced(lease, {key: value})
+    _KV.set(key, value)
+    return True
 
 def _alerts_load(): return _kv_get("v3k_alerts", [])
-def _alerts_save(a): _kv_set("v3k_alerts", a)
+
+def _alerts_update(fn, lease=None):
+    """fn(alerts) -> alerts as one compare-and-set (KVStore.update): /alerts/add and the
+    scan's done-marking can't overwrite each other. None if `lease` was lost."""
+    return _KV.update("v3k_alerts", fn, [], lease)
+
+# ── Indicators ───────────────────────────────────────────────────────────────
+# The scan, ML and backtest paths compute every indicator for a whole history in one
+# vectorized call (indicators.py). The per-bar helpers below are the reference the kernel
+# is checked against (`python indicators.py`) and still back the single-bar _feat_vec.
+import indicators as _ind
+
+def _ohlcv(h):
+    """float64 close / high / low / volume arrays from a yfinance history frame."""
+    return tuple(h[k].to_numpy(dtype=np.float64) for k in ("Close", "High", "Low", "Volume"))
+
+# ── OHLCV bar store ──────────────────────────────────────────────────────────
+# Every daily/intraday history read goes through one on-disk cache (bar_store.py): the
+# first read downloads the span, later reads only fetch the bars since the last one
+# stored. Set BAR_CACHE_DIR to move it (default: .bar_cache next to this file).
+from bar_store import BarStore, INTERVALS as _BAR_INTERVALS, PERIODS as _BAR_PERIODS
+_BARS = BarStore(os.environ.get("BAR_CACHE_DIR") or
+                 os.path.join(os.path.dirname(os.path.abspath(__file__)), ".bar_cache"))
+_BARS.fetch = _M_EXT.wrap(_BARS.fetch, "yahoo_history")    # yfinance doesn't go through requests
+
+_BAR_ARGS_ERROR = {"error": "range must be one of %s and interval one of %s" %
+                   (",".join(sorted(_BAR_PERIODS)), ",".join(sorted(_BAR_INTERVALS)))}
+
+def _bars(sym, period="1mo", interval="1d"):
+    """Drop-in for yf.Ticker(sym).history(period=, interval=), served from the bar store."""
+    return _BARS.history(sym, period, interval)
 
 def _ema(vals, n):
     out = [None] * len(vals); k = 2.0 / (n + 1); prev = None
@@ -6433,64 +6419,32 @@ def _ema(vals, n):
         prev = v if prev is None else v * k + prev * (1 - k); out[i] = prev
     return out
 
-def _rsi_last(c, n=14):
-    ag = al = 0.0; out = None
-    for i in range(1, len(c)):
-        d = (c[i] or c[i - 1]) - (c[i - 1] or c[i]); g = max(d, 0); l = max(-d, 0)
-        if i <= n:
-            ag += g; al += l
-            if i == n:
-                ag /= n; al /= n; out = 100 if al == 0 else 100 - 100 / (1 + ag / al)
-        else:
-            ag = (ag * (n - 1) + g) / n; al = (al * (n - 1) + l) / n
-            out = 100 if al == 0 else 100 - 100 / (1 + ag / al)
-    return out if out is not None else 50
-
-def _atr_last(hi, lo, c, n=14):
-    i = len(c) - 1
-    if i < n:
-        return None
-    s = 0.0
-    for k in range(i - n + 1, i + 1):
-        s += max(hi[k] - lo[k], abs(hi[k] - c[k - 1]), abs(lo[k] - c[k - 1]))
-    return s / n
-
-def _signal_tf(sym, period="1y", interval="1d"):
-    """Multi-factor composite (same as the frontend) on any timeframe. Returns ATR too."""
-    h = yf.Ticker(sym).history(period=period, interval=interval)
+def _signal_tf(sym, period="1y", interval="1d", h=None, score=True):
+    """Multi-factor composite (same as the frontend) on any timeframe. Returns ATR too.
+    `h` is an already-loaded history frame (the scan preloads the whole watchlist).
+    score=False leaves ml_prob to the caller (batch the watchlist through _ml_score)."""
+    h = _bars(sym, period, interval) if h is None else h
     if len(h) < 60:
         return None
     ic = _aligned_idx_closes(h, sym, period, interval)
-    c = list(h["Close"]); hi = list(h["High"]); lo = list(h["Low"]); vol = list(h["Volume"])
+    c, hi, lo, vol = _ohlcv(h)
+    ind = _ind.compute(c, hi, lo, vol)
     i = len(c) - 1
-    e20 = _ema(c, 20); e50 = _ema(c, 50); e200 = _ema(c, 200)
-    e12 = _ema(c, 12); e26 = _ema(c, 26)
-    macd = [(e12[j] - e26[j]) if (e12[j] is not None and e26[j] is not None) else None for j in range(len(c))]
-    sig = _ema([0 if x is None else x for x in macd], 9)
-    hist = (macd[i] or 0) - (sig[i] or 0)
-    rsi = _rsi_last(c)
-    dh = max(hi[i - 20:i]) if i >= 20 else hi[i]
-    price = c[i]; s = 0
-    if e20[i] and e50[i]:  s += 1 if e20[i] > e50[i] else -1
-    if e50[i] and e200[i]: s += 1 if e50[i] > e200[i] else -1
-    if e20[i]:             s += 1 if price > e20[i] else -1
-    s += 1 if hist > 0 else -1
-    if rsi:
-        if 52 < rsi < 78: s += 1
-        elif 22 < rsi < 48: s -= 1
-    s += 1 if price >= dh else -1
+    s = int(_ind.score(c, hi, ind)[i])
+    price = float(c[i]); e200 = float(ind["ema200"][i])
     typ = "BULLISH" if s >= 3 else ("BEARISH" if s <= -3 else "NEUTRAL")
-    atr = _atr_last(hi, lo, c) or price * 0.02
+    atr = float(ind["atr"][i])
+    atr = atr if (atr == atr and atr) else price * 0.02
     # ML win-probability for this setup (real trained model; None until trained)
     ml = None; feat = None
     try:
         dr = 1 if s >= 0 else -1
-        feat = _feat_vec(c, hi, lo, vol, e20, e50, e200, macd, sig, _rsi_series(c), i, dr, ic)
-        ml = _ml_prob(feat)
+        feat = _feat_matrix(c, hi, lo, vol, ind, dr, ic)[i].tolist()
+        ml = _ml_prob(feat) if score else None
     except Exception:
         ml = None; feat = None
     # trend alignment (price vs EMA200) — used by high-conviction filtering
-    trend_ok = (e200[i] is not None) and ((s >= 0 and price > e200[i]) or (s < 0 and price < e200[i]))
+    trend_ok = (e200 == e200) and ((s >= 0 and price > e200) or (s < 0 and price < e200))
     out = {"sym": sym, "score": s, "type": typ, "price": round(price, 2), "atr": atr, "trend_ok": bool(trend_ok)}
     if feat is not None:
         out["feat"] = feat   # logged on trade-open so the model can learn from the live outcome
@@ -6514,6 +6468,19 @@ _FEATURES = ["ema20_50","ema50_200","px_ema20","macd_hist","rsi","atr_pct",
              "dist_52w_hi","dist_52w_lo","up_ratio10","atr_regime",
              "rs20_idx","rs60_idx"]   # relative strength vs the benchmark index (cross-sectional edge)
 _MODEL = {"ready": False}
+# Every fit is saved as a versioned JSON artifact (model_store.py) — in the KV store when
+# one is configured, so every instance shares it, else in MODEL_DIR / .model_store. Workers
+# load the latest artifact at boot and hot-swap to newer ones; only the holder of the
+# training lease ever trains. Samples are built in-process; only /model/evaluate's
+# (fold, model) fits fan out to a spawned process pool (_pool_map).
+from model_store import ModelStore, DirArtifacts, KVArtifacts, linear as _linear_weights
+_MODELS = ModelStore(KVArtifacts(_KV) if (_storage_kind() != "local(ephemeral)" and not os.environ.get("MODEL_DIR"))
+                     else DirArtifacts(os.environ.get("MODEL_DIR") or
+                                       os.path.join(os.path.dirname(os.path.abspath(__file__)), ".model_store")))
+_TRAIN_LEASE = Lease(_KV.backend, "v3k_train_lease", ttl=900)
+_MODEL_POLL = 60       # seconds between hot-swap checks for a newer artifact
+# /model/evaluate pool size (TRAIN_PROCS is the old name of EVAL_PROCS)
+_EVAL_PROCS = int(os.environ.get("EVAL_PROCS") or os.environ.get("TRAIN_PROCS") or 0) or min(4, os.cpu_count() or 1)
 _ML_HORIZON = 10
 _ML_ATR = 1.5          # (legacy) symmetric barrier — kept for reference
 # Label the model on the ACTUAL traded profile so historical + live outcomes are the
@@ -6547,16 +6514,15 @@ def _atr_at(hi, lo, c, i, n=14):
         s+=max(hi[k]-lo[k], abs(hi[k]-c[k-1]), abs(lo[k]-c[k-1]))
     return s/n
 
-_IDX_HIST_CACHE = {}   # (idx_sym,period,interval) -> (ts, DataFrame)
+# Frames aren't JSON — but they come from the bar store, whose mmap'd files are already host-wide.
+_IDX_HIST_CACHE = TTLCache("index_hist", 32, 3600)   # (idx_sym,period,interval) -> DataFrame
 def _index_hist(idx_sym, period, interval):
-    key = (idx_sym, period, interval); now = time_module.time(); c = _IDX_HIST_CACHE.get(key)
-    if c and now - c[0] < 3600:
-        return c[1]
-    try:
-        h = yf.Ticker(idx_sym).history(period=period, interval=interval)
-    except Exception:
-        h = None
-    _IDX_HIST_CACHE[key] = (now, h); return h
+    def _load():
+        try:
+            return _bars(idx_sym, period, interval)
+        except Exception:
+            return None
+    return _IDX_HIST_CACHE.get_or_set((idx_sym, period, interval), _load)
 
 def _aligned_idx_closes(h, sym, period, interval):
     """Index close series aligned (by date) to a stock's history — for per-bar relative strength."""
@@ -6611,31 +6577,69 @@ def _feat_vec(c, hi, lo, vol, e20, e50, e200, macd, sig, rsiS, i, dr, ic=None):
     f.append(_rs(60))
     return f
 
-def _signal_samples(sym):
-    """Build (features, win/loss) samples from 2y history for every signal bar."""
-    h = yf.Ticker(sym).history(period="2y", interval="1d")
-    if len(h) < 160: return [], []
-    ic=_aligned_idx_closes(h, sym, "2y", "1d")
-    c=list(h["Close"]); hi=list(h["High"]); lo=list(h["Low"]); vol=list(h["Volume"])
-    e20=_ema(c,20); e50=_ema(c,50); e200=_ema(c,200); e12=_ema(c,12); e26=_ema(c,26)
-    macd=[(e12[j]-e26[j]) if (e12[j] is not None and e26[j] is not None) else None for j in range(len(c))]
-    sig=_ema([0 if x is None else x for x in macd],9)
-    rsiS=_rsi_series(c)
-    X=[]; Y=[]; H=_ML_HORIZON; M=_ML_ATR
+def _feat_matrix(c, hi, lo, vol, ind, dr, ic=None):
+    """Whole-history _feat_vec: the (n_bars × len(_FEATURES)) matrix in one vectorized pass.
+    c/hi/lo/vol are float arrays, `ind` is _ind.compute(c, hi, lo, vol) and `dr` the trade
+    direction (scalar or per bar). Row i equals _feat_vec(..., i, dr[i], ic)."""
+    n = len(c); T = _ind.truthy
+    dr = np.broadcast_to(np.asarray(dr, dtype=np.float64), (n,))
+    e20, e50, e200, a = ind["ema20"], ind["ema50"], ind["ema200"], ind["atr"]
+    pz = c != 0
+    def _lag(x, k):
+        out = np.full(n, np.nan); out[k:] = x[:n - k]; return out
+    F = np.zeros((n, len(_FEATURES)))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        F[:, 0] = np.where(T(e20) & T(e50), ((e20 - e50) / e50) * dr, 0.0)
+        F[:, 1] = np.where(T(e50) & T(e200), ((e50 - e200) / e200) * dr, 0.0)
+        F[:, 2] = np.where(T(e20), (c / e20 - 1) * dr, 0.0)
+        F[:, 3] = np.where(pz, (ind["macd_hist"] / c) * dr, 0.0)
+        F[:, 4] = np.where(T(ind["rsi"]), ind["rsi"], 50) / 100.0
+        F[:, 5] = np.where(pz, np.where(T(a), a, c * 0.02) / c, 0.0)
+        F[:, 6] = np.where(pz, ((c - _ind.prior_high(hi)) / c) * dr, 0.0)
+        sv = ind["vol_sma20"]
+        F[:, 7] = np.where(T(sv) & T(vol), vol / sv - 1, 0.0)
+        for col, k in ((8, 10), (9, 20)):
+            p0 = _lag(c, k); F[:, col] = np.where(T(p0), (c / p0 - 1) * dr, 0.0)
+        # distance from 52-week high / low: expanding window until a full year of bars exists
+        hh = c.copy(); ll = c.copy()
+        hh[1:] = np.maximum.accumulate(hi)[:-1]; ll[1:] = np.minimum.accumulate(lo)[:-1]
+        if n > 252:
+            hh[252:] = _ind.rolling_max(hi, 252)[251:-1]; ll[252:] = _ind.rolling_min(lo, 252)[251:-1]
+        F[:, 10] = np.where(pz, (c - hh) / c, 0.0)
+        F[:, 11] = np.where(pz, (c - ll) / c, 0.0)
+        # up-day count over the last 10 bars, via a cumulative sum
+        up = np.zeros(n); up[1:] = c[1:] > c[:-1]
+        cs = np.cumsum(up); cs[10:] = cs[10:] - np.cumsum(up)[:-10]
+        F[:, 12] = cs / 10.0
+        # ATR regime: ATR now vs its mean over the last 60 bars (bars >= 15), via cumulative sums
+        ok = T(a) & (np.arange(n) >= 15)
+        sa = np.cumsum(np.where(ok, a, 0.0)); sn = np.cumsum(ok)
+        sa[60:] = sa[60:] - sa[:-60]; sn[60:] = sn[60:] - sn[:-60]
+        F[:, 13] = np.where((sn > 0) & (sa != 0), np.where(T(a), a, 0.0) / (sa / sn), 1.0)
+        # relative strength vs the benchmark index over 20 & 60 bars (× direction)
+        icv = np.full(n, np.nan) if ic is None else np.array([np.nan if x is None else x for x in ic], dtype=np.float64)
+        for col, k in ((14, 20), (15, 60)):
+            p0 = _lag(c, k); i0 = _lag(icv, k)
+            F[:, col] = np.where(T(p0) & T(icv) & T(i0), ((c / p0 - 1) - (icv / i0 - 1)) * dr, 0.0)
+    return F
+
+def _signal_samples(sym, h=None, ic=None, with_rows=False):
+    """Build (features, win/loss) samples from 2y history for every signal bar.
+    `h` / `ic` (aligned index closes) can be passed in pre-loaded, e.g. by _train_model.
+    with_rows=True also returns each sample's bar index (for time-ordered evaluation folds)."""
+    if h is None: h = _bars(sym, "2y", "1d")
+    if len(h) < 160: return ([], [], []) if with_rows else ([], [])
+    if ic is None: ic=_aligned_idx_closes(h, sym, "2y", "1d")
+    ca, hia, loa, vola = _ohlcv(h)
+    ind = _ind.compute(ca, hia, loa, vola); sc = _ind.score(ca, hia, ind)
+    F = _feat_matrix(ca, hia, loa, vola, ind, np.where(sc > 0, 1, -1), ic)
+    c=ca.tolist(); hi=hia.tolist(); lo=loa.tolist(); atrS=ind["atr"].tolist()
+    X=[]; Y=[]; H=_ML_HORIZON; M=_ML_ATR; rows=[]
     for i in range(200, len(c)-H):
-        price=c[i]; s=0
-        if e20[i] and e50[i]:  s+= 1 if e20[i]>e50[i] else -1
-        if e50[i] and e200[i]: s+= 1 if e50[i]>e200[i] else -1
-        if e20[i]:             s+= 1 if price>e20[i] else -1
-        hist=(macd[i] or 0)-(sig[i] or 0); s+= 1 if hist>0 else -1
-        rv=rsiS[i]
-        if rv is not None:
-            if 52<rv<78: s+=1
-            elif 22<rv<48: s-=1
-        dh=max(hi[i-20:i]); s+= 1 if price>=dh else -1
+        price=c[i]; s=int(sc[i])
         if abs(s) < 3: continue
         dr = 1 if s>0 else -1
-        atr=_atr_at(hi,lo,c,i) or price*0.02
+        atr=atrS[i]; atr=atr if (atr==atr and atr) else price*0.02
         tgt=price+dr*M*atr; stp=price-dr*M*atr   # validated symmetric barrier (AUC ~0.55)
         label=0
         for k in range(i+1, i+1+H):
@@ -6645,26 +6649,126 @@ def _signal_samples(sym):
             else:
                 if lo[k]<=tgt: label=1; break
                 if hi[k]>=stp: label=0; break
-        X.append(_feat_vec(c,hi,lo,vol,e20,e50,e200,macd,sig,rsiS,i,dr,ic)); Y.append(label)
-    return X, Y
+        rows.append(i); Y.append(label)
+    X = F[rows].tolist()
+    return (X, Y, rows) if with_rows else (X, Y)
 
 # ── Live outcome log — features of each fired trade + its realized win/loss ──
-def _ml_samples_load(): return _kv_get("v3k_ml_samples", []) or []
-def _ml_samples_save(s): _kv_set("v3k_ml_samples", s[-3000:])
+# Append-only: each sample is one O(1) list append (Upstash RPUSH+LTRIM / local segment
+# file), so concurrent scans and the alert loop never overwrite each other's samples.
+# Installs that predate the log keep their old v3k_ml_samples blob as a frozen prefix.
+_ML_LOG_KEY = "v3k_ml_log"
+_ML_LOG_CAP = 3000
+
+def _ml_samples_iter():
+    """Stream the newest _ML_LOG_CAP live samples, oldest first."""
+    legacy = _kv_get("v3k_ml_samples", []) or []
+    room = _ML_LOG_CAP - _KV.list_len(_ML_LOG_KEY)
+    for s in (legacy[-room:] if room > 0 else []):
+        yield s
+    for s in _KV.iter_list(_ML_LOG_KEY, _ML_LOG_CAP):
+        yield s
+
+def _ml_samples_count():
+    return min(_ML_LOG_CAP, len(_kv_get("v3k_ml_samples", []) or []) + _KV.list_len(_ML_LOG_KEY))
+
 def _ml_log_sample(feat, label):
     """Append one live-outcome sample (feature vector + 1=target/0=stop) for retraining."""
     if not feat or not isinstance(feat, list) or len(feat) != len(_FEATURES):
         return
     try:
-        s = _ml_samples_load(); s.append({"f": feat, "y": int(label)}); _ml_samples_save(s)
+        _KV.append(_ML_LOG_KEY, {"f": feat, "y": int(label)}, _ML_LOG_CAP)
     except Exception:
         pass
 
+def _ml_log_samples(samples, lease):
+    """_ml_log_sample for a scan's [(feat, label)], as one append fenced by the scan lease."""
+    rows = [{"f": f, "y": int(y)} for f, y in samples
+            if f and isinstance(f, list) and len(f) == len(_FEATURES)]
+    try:
+        _KV.append_fenced(lease, _ML_LOG_KEY, rows, _ML_LOG_CAP)
+    except Exception as e:
+        logging.warning("ml sample append failed: %s", e)
+
+def _samples_job(job):
+    """One symbol for _build_samples: (sym, bars, aligned index closes) → samples, ms and each
+    sample's calendar day (int days since epoch)."""
+    sym, h, ic = job; t0 = time_module.perf_counter()
+    try:
+        x, y, rows = _signal_samples(sym, h=h, ic=ic, with_rows=True)
+        t = np.asarray(h.index[rows].strftime("%Y-%m-%d"), dtype="datetime64[D]").astype(np.int64).tolist()
+    except Exception:
+        x, y, t = [], [], []
+    return sym, x, y, round((time_module.perf_counter() - t0) * 1000, 1), t
+
+def _pool_map(fn, jobs, procs=None, chunksize=4):
+    """list(map(fn, jobs)) on a pool of *spawned* processes. Never forked: this process runs
+    threads (KV flusher, scan loop, request threads) and a forked child can inherit one of
+    their locks held and deadlock. `fn` must live in a light module (not app.py — a worker
+    would re-import the whole app) and everything it needs travels with the job, e.g. bound
+    with functools.partial. Runs inline when a pool isn't worth it or can't be started."""
+    procs = min(procs or _EVAL_PROCS, len(jobs))
+    if procs > 1:
+        try:
+            import multiprocessing as mp
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=procs, mp_context=mp.get_context("spawn")) as ex:
+                return list(ex.map(fn, jobs, chunksize=chunksize))
+        except Exception as e:
+            logging.warning("process pool unavailable (%s) — running inline", e)
+    return [fn(j) for j in jobs]
+
+_SAMPLES_TTL = 6 * 3600
+_SAMPLES = TTLCache("samples", 1, _SAMPLES_TTL)   # tuple(syms) -> (ts, built, timings) — training + /model/evaluate
+
+def _build_samples(syms, fresh=False):
+    """Load every symbol's 2y bars on threads (I/O), then build the samples in-process: one
+    vectorized featurization per symbol, about 0.5 s for the 90-symbol watchlist (~2 s on a
+    process's first build). Returns ([(sym, X, Y, ms, days)], timings_ms); the last build
+    is reused for _SAMPLES_TTL unless `fresh`."""
+    key = tuple(syms)
+    if not fresh:
+        reused = key in _SAMPLES
+        _ts, out, timings = _SAMPLES.get_or_set(key, lambda: _build_samples_run(syms))
+        return out, (dict(timings, reused=True) if reused else dict(timings))
+    c0 = _build_samples_run(syms); _SAMPLES.set(key, c0)
+    return c0[1], dict(c0[2])
+
+def _build_samples_run(syms):
+    now = time_module.time(); t0 = time_module.perf_counter()
+    snap = _BARS.history_many(list(syms) + ["^NSEI", "^GSPC"], "2y", "1d", workers=_SCAN_WORKERS)
+    jobs = []
+    for sym in syms:
+        h = snap.get(sym)
+        if h is None or len(h) < 160: continue
+        ih = snap.get("^NSEI" if str(sym).endswith(".NS") else "^GSPC")
+        ic = list(ih["Close"].reindex(h.index).ffill().bfill()) if ih is not None and len(ih) else [None] * len(h)
+        jobs.append((sym, h, ic))
+    t1 = time_module.perf_counter()
+    out = [_samples_job(j) for j in jobs]
+    t2 = time_module.perf_counter()
+    timings = {"load_bars": round((t1 - t0) * 1000, 1), "samples": round((t2 - t1) * 1000, 1)}
+    return now, out, timings
+
 def _train_model():
-    """Train + out-of-sample validate the win-probability model. Stores it in _MODEL.
+    """Train + out-of-sample validate the win-probability model (see _fit_model). Only the
+    worker holding the training lease trains; the others keep serving their current model
+    and hot-swap to the new artifact once it is published (_model_refresh)."""
+    if not _TRAIN_LEASE.acquire():
+        return _MODEL if _MODEL.get("ready") else {"ready": False, "error": "training in progress in another worker"}
+    _TRAIN_LEASE.hold()
+    try:
+        return _fit_model()
+    finally:
+        _TRAIN_LEASE.release()
+
+def _fit_model():
+    """Fit the model and store it in _MODEL.
     Historical samples are labelled on the traded profile (0.75 ATR target / 2.0 ATR stop);
-    the LIVE fired-signal outcomes logged in v3k_ml_samples are folded into the training set
-    so the model genuinely learns from the app's own track record over time."""
+    the LIVE fired-signal outcomes in the append-only sample log are folded into the training set
+    so the model genuinely learns from the app's own track record over time.
+    The fit is saved to _MODELS as the next artifact version (unless the training data is
+    byte-identical to the latest artifact's)."""
     global _MODEL
     try:
         from sklearn.linear_model import LogisticRegression
@@ -6672,20 +6776,18 @@ def _train_model():
         from sklearn.metrics import roc_auc_score, accuracy_score
     except Exception as e:
         _MODEL = {"ready": False, "error": "sklearn unavailable: %s" % e}; return _MODEL
+    t_train = time_module.perf_counter()
     Xtr=[]; Ytr=[]; Xte=[]; Yte=[]
-    for sym in (_WATCH_IN + _WATCH_US):
-        try:
-            x,y=_signal_samples(sym)
-            if len(x) < 20: continue
-            cut=int(len(x)*0.8)
-            Xtr+=x[:cut]; Ytr+=y[:cut]; Xte+=x[cut:]; Yte+=y[cut:]
-        except Exception:
-            pass
+    built, timings = _build_samples(_WATCH_IN + _WATCH_US, fresh=True)
+    for sym, x, y, _ms, _t in built:
+        if len(x) < 20: continue
+        cut=int(len(x)*0.8)
+        Xtr+=x[:cut]; Ytr+=y[:cut]; Xte+=x[cut:]; Yte+=y[cut:]
     # Fold in the live track record (real fired-signal outcomes) — training set only, so the
     # historical hold-out AUC stays an honest out-of-sample check.
     n_live = 0
     try:
-        for s in _ml_samples_load():
+        for s in _ml_samples_iter():
             f = s.get("f"); y = s.get("y")
             if isinstance(f, list) and len(f) == len(_FEATURES) and y in (0, 1):
                 Xtr.append(f); Ytr.append(int(y)); n_live += 1
@@ -6694,7 +6796,9 @@ def _train_model():
     if len(Xtr) < 150 or len(set(Ytr)) < 2 or len(Xte) < 30:
         _MODEL = {"ready": False, "error": "insufficient data", "n_train": len(Xtr), "n_test": len(Xte)}
         return _MODEL
+    t_fit = time_module.perf_counter()
     Xtr_a=np.array(Xtr); Xte_a=np.array(Xte); Ytr_a=np.array(Ytr); Yte_a=np.array(Yte)
+    data_hash = hashlib.sha1(b"".join(a.tobytes() for a in (Xtr_a, Ytr_a, Xte_a, Yte_a))).hexdigest()[:16]
     sc=StandardScaler().fit(Xtr_a)
     clf=LogisticRegression(max_iter=1000, class_weight="balanced").fit(sc.transform(Xtr_a), Ytr_a)
     prob=clf.predict_proba(sc.transform(Xte_a))[:,1]
@@ -6702,28 +6806,138 @@ def _train_model():
     try: auc=round(float(roc_auc_score(Yte_a, prob)), 3)
     except Exception: auc=None
     imp=clf.coef_[0]
-    _MODEL = {"ready": True, "clf": clf, "scaler": sc,
-              "acc": round(float(accuracy_score(Yte_a, pred)), 3), "auc": auc,
-              "base_rate": round(float(np.mean(np.concatenate([Ytr_a, Yte_a]))), 3),
-              "n_train": len(Xtr), "n_test": len(Xte), "n_live": n_live, "features": _FEATURES,
-              "label_profile": "target/stop %.1f ATR / %dd (historical) + live traded outcomes" % (_ML_ATR, _ML_HORIZON),
-              "importance": {_FEATURES[i]: round(float(imp[i]), 3) for i in range(len(_FEATURES))},
-              "trained_at": datetime.utcnow().isoformat()}
+    timings["fit"] = round((time_module.perf_counter() - t_fit) * 1000, 1)
+    m = {"ready": True, "clf": clf, "scaler": sc,
+         "acc": round(float(accuracy_score(Yte_a, pred)), 3), "auc": auc,
+         "base_rate": round(float(np.mean(np.concatenate([Ytr_a, Yte_a]))), 3),
+         "n_train": len(Xtr), "n_test": len(Xte), "n_live": n_live, "features": _FEATURES,
+         "label_profile": "target/stop %.1f ATR / %dd (historical) + live traded outcomes" % (_ML_ATR, _ML_HORIZON),
+         "importance": {_FEATURES[i]: round(float(imp[i]), 3) for i in range(len(_FEATURES))},
+         "trained_at": datetime.utcnow().isoformat(), "data_hash": data_hash,
+         "train_wall_ms": round((time_module.perf_counter() - t_train) * 1000, 1),
+         "train_timings_ms": timings,
+         "per_symbol_ms": {sym: ms for sym, _x, _y, ms, _t in built}}
+    m["linear"] = _linear_weights(m)
+    try:
+        ptr = _MODELS.latest() or {}
+        if ptr.get("data_hash") == data_hash:
+            m["version"] = ptr["version"]          # same data → same fit; don't bump the version
+        else:
+            m["version"] = _MODELS.save(m, {"auc": auc, "acc": m["acc"], "trained_at": m["trained_at"],
+                                            "data_hash": data_hash})
+    except Exception as e:
+        logging.warning("model artifact save failed: %s", e)
+    _MODEL = m
     return _MODEL
 
+def _model_refresh():
+    """Hot-swap to the store's latest artifact when it differs from the live model. The swap
+    is a single reference assignment, so a concurrent _ml_prob sees the old or the new
+    model, never a mix. Returns True if a model was loaded."""
+    global _MODEL
+    v = (_MODELS.latest() or {}).get("version")
+    if not v or v == _MODEL.get("version"):
+        return False
+    m = _MODELS.load(v)
+    if not (m and m.get("ready") and m.get("features") == _FEATURES):
+        return False
+    _MODEL = dict(m, loaded_from="artifact v%s" % v)
+    return True
+
+# Inference is one matrix product on the model's folded weights (model_store.linear) —
+# the scan / /signals score the whole watchlist in a single call, no sklearn per row.
+_INFER_LAT = deque(maxlen=500)      # (rows, seconds) per batch
+_INFER_STATS = {"batches": 0, "rows": 0}
+
+def _ml_prob_batch(F):
+    """Win-probabilities for a (n × len(_FEATURES)) feature matrix → float array, or None
+    while no model is loaded."""
+    m = _MODEL
+    if not m.get("ready") or "linear" not in m:
+        if not _SUBS.ready("ml"): _SUBS.get("ml")    # first use with SUBSYSTEMS off: load in the background
+        return None
+    t0 = time_module.perf_counter()
+    w, b = m["linear"]
+    z = np.asarray(F, dtype=np.float64).reshape(-1, len(w)) @ w + b
+    p = 1.0 / (1.0 + np.exp(-np.clip(z, -500, 500)))
+    _INFER_LAT.append((len(p), time_module.perf_counter() - t0))
+    _INFER_STATS["batches"] += 1; _INFER_STATS["rows"] += len(p)
+    return p
+
 def _ml_prob(feat):
-    m=_MODEL
-    if not m.get("ready"): return None
     try:
-        return float(m["clf"].predict_proba(m["scaler"].transform(np.array([feat])))[0,1])
+        p = _ml_prob_batch([feat])
+        return None if p is None else float(p[0])
     except Exception:
         return None
 
+def _ml_score(rows):
+    """Fill ml_prob / conf on _signal_tf(..., score=False) results with one batched call."""
+    rows = [r for r in rows if r and r.get("feat") is not None]
+    if not rows: return
+    try:
+        p = _ml_prob_batch([r["feat"] for r in rows])
+    except Exception:
+        p = None
+    if p is None: return
+    for r, ml in zip(rows, p.tolist()):
+        r["ml_prob"] = round(ml, 3); r["conf"] = round(ml * 100)
+
+def _inference_stats():
+    v = sorted(s for _n, s in _INFER_LAT)
+    c = dict(_INFER_STATS)
+    c["batch_latency_ms"] = ({"n": len(v), "avg": round(sum(v) / len(v) * 1000, 3),
+                              "p95": round(v[int(0.95 * (len(v) - 1))] * 1000, 3),
+                              "max": round(v[-1] * 1000, 3)} if v else None)
+    c["last_batch"] = ({"rows": _INFER_LAT[-1][0], "ms": round(_INFER_LAT[-1][1] * 1000, 3)}
+                       if _INFER_LAT else None)
+    return c
+
+# ── Model evaluation — walk-forward / purged k-fold over the cached sample matrix ──
+# Reuses _build_samples' per-symbol matrices (no re-download / re-featurize), pools them by
+# calendar day and scores each (fold, model) pair as one job on a spawned pool. Training
+# rows whose label window reaches into the test block are purged (model_eval.folds).
+import model_eval as _me
+_EVAL_CACHE = TTLCache("model_eval", 8, _SAMPLES_TTL)   # (scheme, k, models, embargo, samples ts) -> result
+_EVAL_HORIZON_DAYS = int(math.ceil(_ML_HORIZON * 7 / 5.0)) + 3   # label horizon in calendar days (+ holidays)
+
+def _model_evaluate(scheme="walk_forward", k=5, models=_me.MODELS, embargo=5):
+    """Out-of-sample comparison of `models` on the historical samples (live outcomes carry no
+    bar date, so they are left out). Per-fold AUC / Brier / ECE / fit time + per-model summary.
+    Cached per samples build; concurrent identical requests share one evaluation."""
+    t0 = time_module.perf_counter()
+    built, timings = _build_samples(_WATCH_IN + _WATCH_US)
+    key = (scheme, k, tuple(models), embargo, (_SAMPLES.get(tuple(_WATCH_IN + _WATCH_US)) or (0,))[0])
+    cached = key in _EVAL_CACHE
+    out = _EVAL_CACHE.get_or_set(key, lambda: _model_evaluate_run(built, timings, scheme, k, models, embargo, t0))
+    return dict(out, cached=True) if cached else out
+
+def _model_evaluate_run(built, timings, scheme, k, models, embargo, t0):
+    X = np.array([f for _s, x, _y, _ms, _t in built for f in x], dtype=np.float64)
+    y = np.array([v for _s, _x, ys, _ms, _t in built for v in ys], dtype=np.int64)
+    t = np.array([d for _s, _x, _y, _ms, ts in built for d in ts], dtype=np.int64)
+    if len(X) < 500 or len(set(y.tolist())) < 2:
+        return {"error": "insufficient data", "n": len(X)}
+    fl = _me.folds(t, k, scheme, _EVAL_HORIZON_DAYS, embargo)
+    t1 = time_module.perf_counter()
+    jobs = [(fi, name) for fi in range(len(fl)) for name in models]
+    res = [r for r in _pool_map(functools.partial(_me.fold_job, (X, y, fl)), jobs, chunksize=1) if "error" not in r[2]]
+    day = lambda d: str(np.datetime64(int(d), "D"))
+    out = {"scheme": scheme, "k": k, "models": list(models), "n_samples": len(X), "n_symbols": len(built),
+           "horizon_days": _EVAL_HORIZON_DAYS, "embargo_days": embargo,
+           "folds": [dict(info, test_start=day(info["test_start"]), test_end=day(info["test_end"]), model=name, **met)
+                     for info, name, met, _y, _p in res],
+           "summary": _me.summarize(res, models), "procs": min(_EVAL_PROCS, len(jobs)),
+           "timings_ms": dict(timings, eval=round((time_module.perf_counter() - t1) * 1000, 1),
+                              total=round((time_module.perf_counter() - t0) * 1000, 1)),
+           "evaluated_at": datetime.utcnow().isoformat()}
+    return out
+
 # ── Server-side swing / intraday trade tracking (always-on, no client needed) ──
 _SWINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "v3k_swings.json")
 
 def _swings_load(): return _kv_get("v3k_swings", [])
-def _swings_save(s): _kv_set("v3k_swings", s)
+def _swings_save(s, lease=None): return _kv_set("v3k_swings", s, lease)
 
 def _market_open_now():
     """Returns 'india', 'us', or None based on IST clock + weekday."""
@@ -6744,26 +6958,24 @@ def _market_open_now():
 # ── Market regime (index vs its 200-day EMA) ─────────────────────────────────
 # Risk-ON when the benchmark index is above its 200-DMA → favour longs; risk-OFF
 # when below → avoid new longs (this is the single biggest filter for equity edge).
-_REGIME_CACHE = {}          # market -> (ts, dict)
 _REGIME_TTL   = 3600        # 1 h — the 200-DMA regime barely moves intraday
+_REGIME_CACHE = TTLCache("regime", 8, _REGIME_TTL, shared=_CACHE_TIER)          # market -> dict
 _INDEX_SYM  = {"india": "^NSEI", "us": "^GSPC"}
 _INDEX_NAME = {"india": "NIFTY 50", "us": "S&P 500"}
 
 def _market_regime(market):
     market = "us" if market == "us" else "india"
-    now = time_module.time()
-    c0 = _REGIME_CACHE.get(market)
-    if c0 and now - c0[0] < _REGIME_TTL:
-        return c0[1]
+    return _REGIME_CACHE.get_or_set(market, lambda: _market_regime_load(market))
+
+def _market_regime_load(market):
     out = {"market": market, "index": _INDEX_NAME[market], "regime": "unknown",
            "price": None, "ema200": None, "pct": None, "allow_buy": True, "allow_sell": True,
            "label": "Regime unavailable"}
     try:
-        h = yf.Ticker(_INDEX_SYM[market]).history(period="2y", interval="1d")
+        h = _bars(_INDEX_SYM[market], "2y", "1d")
         c = [x for x in list(h["Close"]) if x is not None]
         if len(c) >= 200:
-            e200 = _ema(c, 200)
-            price, ema = c[-1], e200[-1]
+            price, ema = c[-1], float(_ind.ema(c, 200)[-1])
             if ema:
                 pct = (price - ema) / ema * 100.0
                 risk_on = price >= ema
@@ -6778,15 +6990,14 @@ def _market_regime(market):
     except Exception as e:
         try: logging.warning("regime failed: %s", e)
         except Exception: pass
-    _REGIME_CACHE[market] = (now, out)
     return out
 
 # ── Cross-sectional relative strength (stock vs its index) ───────────────────
 # A stock outperforming the index has genuine relative strength — a stronger long
 # candidate; a laggard is a stronger short. This is a core cross-sectional edge.
-_RS_CACHE = {}          # "market:ysym" -> (ts, dict)
 _RS_TTL   = 3600
-_IDX_RET_CACHE = {}     # market -> (ts, {r20,r60})
+_RS_CACHE = TTLCache("relative_strength", 256, _RS_TTL, shared=_CACHE_TIER)     # "market:ysym" -> dict
+_IDX_RET_CACHE = TTLCache("index_returns", 8, _RS_TTL, shared=_CACHE_TIER)      # market -> {r20,r60}
 
 def _pct_ret(closes, n):
     c = [x for x in closes if x is not None]
@@ -6796,50 +7007,38 @@ def _pct_ret(closes, n):
 
 def _index_returns(market):
     market = "us" if market == "us" else "india"
-    now = time_module.time(); c = _IDX_RET_CACHE.get(market)
-    if c and now - c[0] < _RS_TTL:
-        return c[1]
-    out = {"r20": None, "r60": None}
-    try:
-        h = yf.Ticker(_INDEX_SYM[market]).history(period="6mo", interval="1d")
-        cl = list(h["Close"]); out = {"r20": _pct_ret(cl, 20), "r60": _pct_ret(cl, 60)}
-    except Exception:
-        pass
-    _IDX_RET_CACHE[market] = (now, out); return out
+    def _load():
+        try:
+            cl = list(_bars(_INDEX_SYM[market], "6mo", "1d")["Close"])
+            return {"r20": _pct_ret(cl, 20), "r60": _pct_ret(cl, 60)}
+        except Exception:
+            return {"r20": None, "r60": None}
+    return _IDX_RET_CACHE.get_or_set(market, _load)
 
 def _rs_one(sym, market):
     """Relative strength of one ticker vs its index over 20d & 60d (percentage points)."""
     market = "us" if market == "us" else "india"
     ysym = sym if (market == "us" or "." in sym) else sym + ".NS"
-    now = time_module.time(); key = market + ":" + ysym; c = _RS_CACHE.get(key)
-    if c and now - c[0] < _RS_TTL:
-        return c[1]
-    res = {"rs20": None, "rs60": None, "ret60": None}
-    try:
-        idx = _index_returns(market)
-        h = yf.Ticker(ysym).history(period="6mo", interval="1d")
-        cl = list(h["Close"]); s20 = _pct_ret(cl, 20); s60 = _pct_ret(cl, 60)
-        res = {"rs20": (round(s20 - idx["r20"], 2) if (s20 is not None and idx["r20"] is not None) else None),
-               "rs60": (round(s60 - idx["r60"], 2) if (s60 is not None and idx["r60"] is not None) else None),
-               "ret60": (round(s60, 2) if s60 is not None else None)}
-    except Exception:
-        pass
-    _RS_CACHE[key] = (now, res); return res
+    def _load():
+        try:
+            idx = _index_returns(market)
+            cl = list(_bars(ysym, "6mo", "1d")["Close"]); s20 = _pct_ret(cl, 20); s60 = _pct_ret(cl, 60)
+            return {"rs20": (round(s20 - idx["r20"], 2) if (s20 is not None and idx["r20"] is not None) else None),
+                    "rs60": (round(s60 - idx["r60"], 2) if (s60 is not None and idx["r60"] is not None) else None),
+                    "ret60": (round(s60, 2) if s60 is not None else None)}
+        except Exception:
+            return {"rs20": None, "rs60": None, "ret60": None}
+    return _RS_CACHE.get_or_set(market + ":" + ysym, _load)
 
 def _news_sentiment_one(sym_clean, market):
     """Cached single-ticker news sentiment (same store as /news-sentiment)."""
-    key = market + ":" + sym_clean
-    now = time_module.time()
-    c = _NEWS_SENT_CACHE.get(key)
-    if c and now - c[0] < _NEWS_SENT_TTL:
-        return c[1]
-    items = [{"sym": sym_clean, "headlines": _fetch_symbol_headlines(sym_clean, market)}]
-    scored = _score_news_claude(items) if _ANTHROPIC_KEY else None
-    if scored is None:
-        scored = {sym_clean: _score_news_keyword(sym_clean, items[0]["headlines"])}
-    res = scored.get(sym_clean) or _score_news_keyword(sym_clean, [])
-    _NEWS_SENT_CACHE[key] = (now, res)
-    return res
+    def _load():
+        items = [{"sym": sym_clean, "headlines": _fetch_symbol_headlines(sym_clean, market)}]
+        scored = _score_news_claude(items) if _ANTHROPIC_KEY else None
+        if scored is None:
+            scored = {sym_clean: _score_news_keyword(sym_clean, items[0]["headlines"])}
+        return scored.get(sym_clean) or _score_news_keyword(sym_clean, [])
+    return _NEWS_SENT_CACHE.get_or_set(market + ":" + sym_clean, _load)
 
 # News strongly opposing the trade direction vetoes the signal (|score| ≥ this).
 _NEWS_VETO = 0.4
@@ -6928,9 +7127,10 @@ _WATCH_US = [
 
 _RETRAIN_EVERY = 7 * 86400   # weekly
 
-def _maybe_weekly_retrain():
+def _maybe_weekly_retrain(wait=False):
     """Auto-retrain the model ~weekly, folding in the newest live outcomes. Piggybacks on the
-    scan heartbeat (internal loop + /cron/scan pings) so NO separate scheduler is needed."""
+    scan heartbeat (internal loop + /cron/scan pings) so NO separate scheduler is needed;
+    the job runner calls it with wait=True to train inline."""
     try:
         last = float(_kv_get("v3k_last_retrain", 0) or 0)
     except Exception:
@@ -6939,17 +7139,57 @@ def _maybe_weekly_retrain():
     if now - last >= _RETRAIN_EVERY:
         try:
             _kv_set("v3k_last_retrain", now)   # claim the slot first so pings don't double-fire
-            threading.Thread(target=_train_model, daemon=True).start()
+            if wait:
+                _train_model()
+            else:
+                threading.Thread(target=_train_model, daemon=True).start()
             return True
         except Exception:
             pass
     return False
 
-def _run_scan():
-    """One scan cycle: swing + intraday trade tracking + price alerts → Telegram."""
+_SCAN_WORKERS = 8      # concurrent history loads in the scan's data-loading stage
+
+def _first_touch(h, since, buy, tgt, stp):
+    """Did price touch the target or stop since `since` (epoch s)? Daily bars AFTER the entry
+    day are checked on their high/low in order (target first, like the backtest), so exits
+    between scans aren't missed; the entry day itself only on the latest close, since its
+    earlier range may predate the entry. Returns ("target"|"stop"|None, price)."""
+    if h is None or not len(h):
+        return None, None
+    if since:
+        day0 = pd.Timestamp(float(since), unit="s", tz="UTC").tz_convert(h.index.tz or "UTC").normalize()
+        after = h[h.index.normalize() > day0]
+        for hi, lo in zip(after["High"].tolist(), after["Low"].tolist()):
+            if buy:
+                if tgt and hi >= tgt: return "target", float(tgt)
+                if stp and lo <= stp: return "stop", float(stp)
+            else:
+                if tgt and lo <= tgt: return "target", float(tgt)
+                if stp and hi >= stp: return "stop", float(stp)
+    p = float(h["Close"].iloc[-1])
+    if tgt and ((p >= tgt) if buy else (p <= tgt)): return "target", p
+    if stp and ((p <= stp) if buy else (p >= stp)): return "stop", p
+    return None, p
+
+def _run_scan(lease=None):
+    """One scan cycle: swing + intraday trade tracking + price alerts → Telegram.
+    The watchlist's bars are loaded up front on a bounded pool; the signal logic then runs
+    on in-memory frames. Wall time and per-phase timings are returned in `timings_ms`.
+    With a `lease`, nothing is sent or saved once it is no longer valid (see _scan_once), and
+    trades, alerts and ML samples are written fenced by its token: a holder deposed mid-scan
+    has them rejected by the store and aborts before sending anything."""
     from datetime import timezone
-    retrained = _maybe_weekly_retrain()
-    _maybe_weekly_review()
+    t_scan = time_module.perf_counter(); timings = {}
+    def _lap(phase, t0):
+        now = time_module.perf_counter()
+        timings[phase] = round((now - t0) * 1000, 1); _M_SCAN.observe(now - t0, phase)
+        return time_module.perf_counter()
+    t0 = t_scan
+    retrained = False
+    if _BACKGROUND != "runner":      # the job runner schedules these as jobs of their own
+        retrained = _maybe_weekly_retrain()
+        _maybe_weekly_review()
     now = datetime.now(timezone.utc)
     istmin = (now.hour * 60 + now.minute + 330) % 1440
     us = (istmin >= 1140 or istmin <= 90)
@@ -6958,13 +7198,33 @@ def _run_scan():
     open_market = _market_open_now()   # 'india' | 'us' | None
     trades = _swings_load()
     opened_msgs, closed_msgs = [], []
+    t0 = _lap("housekeeping", t0)
+
+    pending = [x["sym"] for x in (_alerts_load() or []) if not x.get("done") and x.get("sym")]
+
+    # 0) LOAD — one price snapshot for the whole scan: every watchlist symbol, its index and
+    # every symbol with an open trade or a pending price alert, through the bar store concurrently
+    watched = [t["sym"] for t in trades if t["status"] == "open"] + pending
+    snap = _BARS.history_many(list(syms) + [_INDEX_SYM[market]] + watched, "1y", "1d", workers=_SCAN_WORKERS)
+    t0 = _lap("load_bars", t0)
 
     # 1) SWING scan (daily) — a new strong signal opens ONE swing trade.
     # The single alert per stock comes from _open_or_check_trade (deduped by the
     # persisted trades file, so it survives restarts and never re-sends).
+    sigs = []
     for sym in syms:
         try:
-            r = _signal_tf(sym, "1y", "1d")
+            sigs.append(_signal_tf(sym, "1y", "1d", h=snap.get(sym), score=False))
+        except Exception:
+            pass
+    _ml_score(sigs)
+    if lease is None or lease.valid():
+        try:
+            _signals_publish(market, sigs)
+        except Exception as e:
+            logging.warning("signal snapshot publish failed: %s", e)
+    for r in sigs:
+        try:
             if r:
                 _open_or_check_trade(r, market, "swing", trades, opened_msgs, closed_msgs)
         except Exception:
@@ -6989,83 +7249,128 @@ def _run_scan():
                 t["status"] = "session-end"; t["closed_at"] = time_module.time()
                 closed_msgs.append("🔔 Intraday auto-exit: %s squared off." % t["sym"].replace(".NS", ""))
 
-    # 3) MONITOR all open trades for 🎯 target / 🛑 stop-loss
+    t0 = _lap("signals", t0)
+
+    # 3) MONITOR all open trades for 🎯 target / 🛑 stop-loss (intrabar, from the snapshot)
+    learned = []    # (feat, 1=target / 0=stop) — logged for retraining once the trades are saved
     for t in trades:
         if t["status"] != "open":
             continue
-        try:
-            p = float(yf.Ticker(t["sym"]).history(period="1d")["Close"].iloc[-1])
-        except Exception:
-            continue
         buy = t["side"] == "buy"
-        hit_t = (p >= t["t1"]) if buy else (p <= t["t1"])
-        hit_s = (p <= t["sl"]) if buy else (p >= t["sl"])
+        hit, p = _first_touch(snap.get(t["sym"]), t.get("opened_at"), buy, t["t1"], t["sl"])
+        if p is None:
+            continue
         pnl = ((p - t["entry"]) / t["entry"] * 100) if buy else ((t["entry"] - p) / t["entry"] * 100)
-        if hit_t:
+        if hit == "target":
             t["status"] = "target"; t["exit"] = round(p, 4); t["closed_at"] = time_module.time()
-            _ml_log_sample(t.get("feat"), 1)   # learn: this setup reached target
+            learned.append((t.get("feat"), 1))   # learn: this setup reached target
             closed_msgs.append("🎯 TARGET HIT — %s %s (%s): booked %+.2f%%  ·  entry %.2f → exit %.2f  ✅ WIN" %
                                (t["sym"].replace(".NS", ""), t["side"].upper(), t["kind"], pnl, t["entry"], p))
-        elif hit_s:
+        elif hit == "stop":
             t["status"] = "stopped"; t["exit"] = round(p, 4); t["closed_at"] = time_module.time()
-            _ml_log_sample(t.get("feat"), 0)   # learn: this setup hit its stop
+            learned.append((t.get("feat"), 0))   # learn: this setup hit its stop
             closed_msgs.append("🛑 STOP-LOSS HIT — %s %s (%s): %+.2f%%  ·  entry %.2f → exit %.2f  ❌ LOSS" %
                                (t["sym"].replace(".NS", ""), t["side"].upper(), t["kind"], pnl, t["entry"], p))
 
-    for m in opened_msgs + closed_msgs:
-        _tg_send("V3K: " + m)
+    if lease is not None and not lease.valid():
+        return {"aborted": "scan lease lost before publishing", "fence": lease.fence}
     # keep open + a long history of closed trades (for the Reports tab)
     trades = [t for t in trades if t["status"] == "open"] + \
              [t for t in trades if t["status"] != "open"][-200:]
-    _swings_save(trades)
-
-    # price alerts
-    alerts = _alerts_load(); changed = False
-    for a in alerts:
-        if a.get("done"):
-            continue
-        try:
-            p = float(yf.Ticker(a["sym"]).history(period="1d")["Close"].iloc[-1])
-        except Exception:
-            continue
-        hit = None
-        if a.get("type") != "sell":
-            if a.get("target") and p >= a["target"]: hit = "🎯 Target reached"
-            elif a.get("stop") and p <= a["stop"]:   hit = "🛑 Support broken"
-        else:
-            if a.get("target") and p <= a["target"]: hit = "🎯 Target reached"
-            elif a.get("stop") and p >= a["stop"]:   hit = "🛑 Stop hit"
-        if hit:
-            a["done"] = True; changed = True
-            _tg_send("V3K Alert: %s %s at %.2f" % (a["sym"].replace(".NS", ""), hit, p), a.get("chat"))
-    if changed:
-        _alerts_save(alerts)
+    if not _swings_save(trades, lease):
+        return {"aborted": "scan lease fenced out by a newer holder", "fence": lease.fence}
+    if lease is None:
+        for f, y in learned:
+            _ml_log_sample(f, y)
+    else:
+        _ml_log_samples(learned, lease)
+    for m in opened_msgs + closed_msgs:
+        _tg_send("V3K: " + m)
+    t0 = _lap("monitor", t0)
+
+    # price alerts (same snapshot; bars after the alert was created count intrabar)
+    hits = []
+    def _mark(alerts):   # re-run on a fresh list if an /alerts/add landed in between
+        del hits[:]
+        for a in alerts:
+            if a.get("done"):
+                continue
+            buy = a.get("type") != "sell"
+            h = snap.get(a["sym"])
+            if h is None:   # added while this scan was running
+                h = snap[a["sym"]] = _bars(a["sym"], "5d")
+            hit, p = _first_touch(h, a.get("created_at"), buy, a.get("target"), a.get("stop"))
+            if hit:
+                hit = "🎯 Target reached" if hit == "target" else ("🛑 Support broken" if buy else "🛑 Stop hit")
+                a["done"] = True
+                hits.append(("V3K Alert: %s %s at %.2f" % (a["sym"].replace(".NS", ""), hit, p), a.get("chat")))
+        return alerts
+    if (lease is None or lease.valid()) and _alerts_update(_mark, lease) is not None:
+        for msg, chat in hits:
+            _tg_send(msg, chat)
+    t0 = _lap("price_alerts", t0)
     open_trades = len([t for t in trades if t["status"] == "open"])
     try:
         _last_rt = float(_kv_get("v3k_last_retrain", 0) or 0)
         next_rt_days = round(max(0, (_last_rt + _RETRAIN_EVERY - time_module.time())) / 86400, 1) if _last_rt else 0
     except Exception:
         next_rt_days = None
+    wall = time_module.perf_counter() - t_scan; _M_SCAN.observe(wall, "total")
     return {"scanned": len(syms), "new_signals": len(opened_msgs),
             "market": "US" if us else "India",
             "market_open": open_market or "closed",
             "intraday_active": bool(open_market),
             "open_trades": open_trades, "storage": _storage_kind(),
             "retrained_now": retrained, "next_retrain_in_days": next_rt_days,
+            "wall_ms": round(wall * 1000, 1), "timings_ms": timings,
             "events": opened_msgs + closed_msgs}
 
-_scan_busy = False
-def _run_scan_bg():
-    global _scan_busy
-    if _scan_busy:
-        return
-    _scan_busy = True
+# ── Scan coordinator ─────────────────────────────────────────────────────────
+# _alert_loop (in every gunicorn worker), /cron/scan pings and /cron/scan?sync=1 all go
+# through _scan_once. A KV lease with a fencing token lets one scan run at a time across
+# workers and instances, and a scan is skipped when another finished under _SCAN_MIN_GAP
+# seconds ago — N workers + an external pinger add up to one scan per interval.
+# (Upstash makes the lease global; kvdb / local storage use a lease file on this machine.)
+_SCAN_MIN_GAP = int(os.environ.get("SCAN_MIN_GAP", "600"))
+_SCAN_LEASE = Lease(_KV.backend, "v3k_scan_lease", ttl=300)
+_SCAN_STATE = {"triggers": 0, "ran": 0, "skipped_busy": 0, "skipped_recent": 0, "aborted": 0,
+               "running": None, "last": None}
+
+def _scan_once(source, force=False):
+    """Run one scan if this worker wins the scan lease and no scan finished in the last
+    _SCAN_MIN_GAP seconds (force=True ignores the gap, never the lease)."""
+    st = _SCAN_STATE; st["triggers"] += 1
+    fence = _SCAN_LEASE.acquire()
+    if not fence:
+        st["skipped_busy"] += 1
+        return {"skipped": "scan already running", "lease": _SCAN_LEASE.state()}
+    _SCAN_LEASE.hold()
     try:
-        _run_scan()
+        _KV.invalidate()   # read the previous holder's trades / alerts, not our cached copies
+        last = float(_kv_get("v3k_last_scan", 0) or 0)
+        ago = time_module.time() - last
+        if not force and ago < _SCAN_MIN_GAP:
+            st["skipped_recent"] += 1
+            return {"skipped": "scanned %ds ago" % ago, "min_gap_s": _SCAN_MIN_GAP}
+        st["running"] = {"source": source, "fence": fence, "started": time_module.time()}
+        r = _run_scan(lease=_SCAN_LEASE)
+        if r.get("aborted"):
+            st["aborted"] += 1
+        else:
+            st["ran"] += 1; _kv_set("v3k_last_scan", time_module.time(), _SCAN_LEASE)
+        st["last"] = {"source": source, "fence": fence, "at": time_module.time(),
+                      "wall_ms": r.get("wall_ms"), "new_signals": r.get("new_signals"), "aborted": r.get("aborted")}
+        return r
+    finally:
+        st["running"] = None
+        _KV.flush()        # the next holder must see this scan's writes before the lease frees
+        _SCAN_LEASE.release()
+
+def _run_scan_bg(source="cron"):
+    try:
+        _scan_once(source)
     except Exception:
         pass
-    finally:
-        _scan_busy = False
 
 @app.route("/cron/scan", methods=["GET", "POST"])
 def cron_scan():
@@ -7080,7 +7385,7 @@ def cron_scan():
     # ?sync=1 runs the scan inline and returns full results (for debugging).
     if request.args.get("sync") == "1":
         try:
-            return jsonify(_run_scan())
+            return jsonify(_scan_once("sync", force=True))
         except Exception as e:
             return jsonify({"error": str(e)}), 500
     # Default: run the scan in the BACKGROUND so the pinger gets a fast 200 and never
@@ -7096,21 +7401,169 @@ def ping_status():
         cnt = int(_kv_get("v3k_ping_count", 0) or 0)
         last = float(_kv_get("v3k_last_ping", 0) or 0)
         ago = round(time_module.time() - last, 1) if last else None
+        st = dict(_SCAN_STATE)
+        if st["running"]:
+            st["running"] = dict(st["running"], seconds=round(time_module.time() - st["running"]["started"], 1))
         return jsonify({"ping_count": cnt, "last_ping_seconds_ago": ago,
-                        "awake_heartbeat_ok": (ago is not None and ago < 600)}), 200
+                        "awake_heartbeat_ok": (ago is not None and ago < 600),
+                        "scan": st, "scan_lease": _SCAN_LEASE.state(),
+                        "kv_pending_writes": _KV.stats()["pending"]}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 200
 
+@app.route("/bars/stats", methods=["GET"])
+def bars_stats():
+    """OHLCV bar-store counters: hits / misses / tail fetches, bars downloaded vs served, bytes saved."""
+    return jsonify(_BARS.stats()), 200
+
+@app.route("/kv/stats", methods=["GET"])
+def kv_stats():
+    """KV layer counters: read-cache hit rate, coalesced writes, pending keys, get/flush latency."""
+    return jsonify(_KV.stats()), 200
+
+# ── Live tick stream ─────────────────────────────────────────────────────────
+# real_time_streamer is fed by a tick_stream source (_tick_source: Kite WebSocket with
+# today's token, or TICK_SOURCE=replay:<file>). The first start hooks the risk-manager and
+# smart-alert price callbacks in, so ticks reach them as well as the 1m / 5m bars.
+_STREAM_HOOKED = False
+
+# ── Live indicator state ──
+# One indicators.Live per streamed symbol, seeded from its daily history up to yesterday.
+# Each tick moves today's forming bar and re-scores it with Live.peek — a few µs, where
+# _signal_tf recomputes every indicator over the whole year. A new trading day commits the
+# previous bar. Symbols are seeded in the background; ticks before that are skipped.
+_LIVE = {}                       # sym -> {"ind": Live, "tz", "day", "bar": [o,h,l,c,v] | None, "x": last peek}
+_LIVE_LAT = LatencyMeter()
+
+def _live_seed(sym):
+    try:
+        h = _bars(sym, "1y", "1d")
+    except Exception:
+        return
+    if h is None or len(h) < 60:
+        return
+    c, hi, lo, vol = _ohlcv(h)
+    tz = getattr(h.index, "tz", None) or IST
+    last = h.index[-1].date()
+    st = {"tz": tz, "day": last, "bar": None, "x": None}
+    if last == datetime.now(tz).date():      # today's bar is still forming: don't commit it
+        c, hi, lo, vol = c[:-1], hi[:-1], lo[:-1], vol[:-1]
+        st["bar"] = [float(h["Open"].iloc[-1]), float(h["High"].iloc[-1]), float(h["Low"].iloc[-1]),
+                     float(h["Close"].iloc[-1]), float(h["Volume"].iloc[-1])]
+    st["ind"] = _ind.Live.from_arrays(c, hi, lo, vol)
+    if st["bar"] is not None:
+        b = st["bar"]; st["x"] = st["ind"].peek(b[3], b[1], b[2], b[4])
+    _LIVE[sym] = st
+
+def _live_on_updates(updates):
+    """Streamer callback: fold each tick into its symbol's forming daily bar and re-score."""
+    for u in updates:
+        st = _LIVE.get(u['symbol'])
+        if st is None:
+            continue
+        t0 = time_module.perf_counter()
+        day = datetime.fromtimestamp(u.get('ts') or time_module.time(), st["tz"]).date()
+        b = st["bar"]; px = float(u['price'])
+        if day < st["day"]:
+            continue
+        if b is not None and day > st["day"]:
+            st["ind"].update(b[3], b[1], b[2], b[4]); b = None
+        if b is None:
+            b = st["bar"] = [px, px, px, px, 0.0]; st["day"] = day
+        b[1] = max(b[1], px); b[2] = min(b[2], px); b[3] = px; b[4] += u.get('volume') or 0
+        st["x"] = st["ind"].peek(px, b[1], b[2], b[4])
+        _LIVE_LAT.add(time_module.perf_counter() - t0)
+
+def _live_signal(sym):
+    """_signal_tf's score / type / ATR / trend for the forming daily bar (no ML, no features)."""
+    st = _LIVE.get(sym)
+    x = st and st["x"]
+    if not x:
+        return None
+    s = int(x["score"]); price = x["close"]; e200 = x["ema200"]; atr = x["atr"]
+    atr = atr if (atr == atr and atr) else price * 0.02
+    trend_ok = (e200 == e200) and ((s >= 0 and price > e200) or (s < 0 and price < e200))
+    return {"sym": sym, "score": s, "type": "BULLISH" if s >= 3 else ("BEARISH" if s <= -3 else "NEUTRAL"),
+            "price": round(price, 2), "atr": atr, "trend_ok": bool(trend_ok),
+            "rsi": round(x["rsi"], 2) if x["rsi"] == x["rsi"] else None, "day": str(st["day"])}
+
+def _stream_start(symbols):
+    global _STREAM_HOOKED
+    if not _STREAM_HOOKED:
+        _STREAM_HOOKED = True
+        # price callbacks only — the monitor / delivery loops are jobs (jobs.py), never
+        # unsupervised threads started from a request or the streaming job
+        init_risk_management(start_monitor=False); init_smart_alert_system(start_processor=False)
+        real_time_streamer.add_callback(_live_on_updates)
+    ok = real_time_streamer.start_streaming(symbols)
+    if ok:
+        todo = [s for s in symbols if s not in _LIVE]
+        threading.Thread(target=lambda: [_live_seed(s) for s in todo], daemon=True).start()
+    return ok
+
+@app.route("/stream/start", methods=["POST"])
+def stream_start():
+    """Start tick streaming. Body: {symbols:[...]} (default: first 10 of the India watchlist)."""
+    d = request.get_json(force=True, silent=True) or {}
+    syms = [str(s).upper() for s in (d.get("symbols") or _WATCH_IN[:10])][:200]
+    syms = [s if ("." in s or s.startswith("^")) else s + ".NS" for s in syms]
+    ok = _stream_start(syms)
+    return jsonify({"streaming": ok, "symbols": syms,
+                    "source": real_time_streamer.source.stats() if ok else None}), (200 if ok else 503)
+
+@app.route("/stream/stop", methods=["POST"])
+def stream_stop():
+    real_time_streamer.stop_streaming()
+    return jsonify({"streaming": False}), 200
+
+@app.route("/stream/status", methods=["GET"])
+def stream_status():
+    """Source counters, tick → callback latency (ms), latest prices and movers."""
+    return jsonify(real_time_streamer.get_live_data_summary()), 200
+
+@app.route("/stream/bars", methods=["GET"])
+def stream_bars():
+    """1m / 5m OHLCV bars built from the ticks. ?symbol=INFY &interval=1m|5m &n=100"""
+    sym = (request.args.get("symbol") or "").upper()
+    if sym and sym not in real_time_streamer.streaming_symbols and sym + ".NS" in real_time_streamer.streaming_symbols:
+        sym += ".NS"
+    iv = {"1m": 60, "5m": 300}.get(request.args.get("interval", "1m"))
+    if not sym or iv is None:
+        return jsonify({"error": "symbol and interval=1m|5m required"}), 400
+    try:
+        n = max(1, min(500, int(request.args.get("n", 100))))
+    except Exception:
+        n = 100
+    return jsonify({"symbol": sym, "interval": request.args.get("interval", "1m"),
+                    "bars": real_time_streamer.bars.bars(sym, iv, n)}), 200
+
+@app.route("/stream/signals", methods=["GET"])
+def stream_signals():
+    """Composite score per streamed symbol, re-scored on every tick from the live indicator
+    state, plus the per-tick re-score cost (ms)."""
+    sigs = [x for x in (_live_signal(s) for s in real_time_streamer.streaming_symbols) if x]
+    sigs.sort(key=lambda x: -abs(x["score"]))
+    return jsonify({"signals": sigs, "seeded": len(_LIVE), "rescore_ms": _LIVE_LAT.stats()}), 200
+
+@app.route("/startup/report", methods=["GET"])
+def startup_report():
+    """Import cost per phase (ms), and per subsystem: lazy / ready / failed + construction ms."""
+    return jsonify(_SUBS.report()), 200
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    """In-process caches (ttl_cache.py): size, hits / misses, LRU evictions, expiries, coalesced loads."""
+    return jsonify(_ttl_cache.stats()), 200
+
 @app.route("/alerts/add", methods=["POST"])
 def alerts_add():
     a = request.json or {}
     if not a.get("sym"):
         return jsonify({"error": "sym required"}), 400
-    alerts = _alerts_load()
-    alerts.append({"sym": a["sym"], "type": a.get("type", "buy"),
-                   "target": a.get("target"), "stop": a.get("stop"),
-                   "chat": a.get("chat"), "done": False})
-    _alerts_save(alerts)
+    new = {"sym": a["sym"], "type": a.get("type", "buy"),
+           "target": a.get("target"), "stop": a.get("stop"),
+           "chat": a.get("chat"), "done": False, "created_at": time_module.time()}
+    alerts = _alerts_update(lambda cur: cur + [new])
     return jsonify({"status": "ok", "count": len(alerts)})
 
 @app.route("/alerts/list", methods=["GET"])
@@ -7119,44 +7572,135 @@ def alerts_list():
 
 @app.route("/alerts/clear", methods=["POST"])
 def alerts_clear():
-    _alerts_save([])
+    _alerts_update(lambda cur: [])
     return jsonify({"status": "ok"})
 
+# ── Quote service ────────────────────────────────────────────────────────────
+# /quotes, /watchlist-prices and /sector-performance all read through one QuoteService
+# (quote_service.py). Quotes are cached for QUOTE_TTL seconds, host-wide via the shared tier.
+# A request's misses load as one batch on the bar store's pool, re-checking each tail once
+# it's older than the TTL. Symbols another request is already loading are waited for.
+from quote_service import QuoteService
+_QUOTE_TTL = float(os.environ.get("QUOTE_TTL", "10"))
+_QUOTES = QuoteService(lambda syms: _BARS.history_many(syms, "5d", "1d", workers=_SCAN_WORKERS, retries=0,
+                                                       max_age=_QUOTE_TTL),
+                       ttl=_QUOTE_TTL, shared=_CACHE_TIER)
+
 @app.route("/quotes", methods=["GET"])
 def quotes():
     """Batch live quotes (price + % change) — reliable server-side, no CORS proxy.
     /quotes?syms=GC=F,SI=F,BTC-USD  →  {"quotes":{"GC=F":{"price":...,"change":...}}}"""
-    syms = [s for s in (request.args.get("syms", "").split(",")) if s]
-    out = {}
-    for s in syms:
-        try:
-            h = yf.Ticker(s).history(period="5d")
-            if len(h) >= 1:
-                price = float(h["Close"].iloc[-1])
-                prev = float(h["Close"].iloc[-2]) if len(h) >= 2 else price
-                chg = ((price - prev) / prev * 100) if prev else 0.0
-                out[s] = {"price": round(price, 4), "change": round(chg, 2)}
-        except Exception:
-            pass
+    syms = [s for s in (request.args.get("syms", "").split(",")) if s][:100]
+    out = {s: {"price": round(q["price"], 4), "change": round(q["change"], 2)}
+           for s, q in _QUOTES.get(syms).items() if q}
     return jsonify({"quotes": out})
 
+@app.route("/quotes/stats", methods=["GET"])
+def quotes_stats():
+    """Quote service counters: symbols asked for vs served from cache / fetched / coalesced."""
+    return jsonify(_QUOTES.stats()), 200
+
+# ── /metrics ─────────────────────────────────────────────────────────────────
+# The histograms are recorded where the work happens (see the Metrics section near the
+# top); everything below already keeps its own counters and is only read on a scrape.
+# Lazy subsystems that haven't been built report nothing rather than being built here.
+_STARTED_AT = time_module.time()
+
+def _thread_kind(name):
+    """'ThreadPoolExecutor-3_1' / 'Thread-7 (worker)' → the name without its sequence number."""
+    return re.split(r"[-_ ]\d", name, 1)[0] or name
+
+@_METRICS.collector
+def _metrics_app():
+    caches = {"ttl:" + n: (c["hits"], c["misses"], c["size"]) for n, c in _ttl_cache.stats().items()}
+    kv = _KV.stats(); caches["kv"] = (kv["hits"], kv["misses"], kv["cached_keys"])
+    bs = _BARS.stats(); caches["bar_store"] = (bs["hits"], bs["misses"], None)
+    qs = _QUOTES.stats(); caches["quotes"] = (qs["cached"], qs["fetched"] + qs["coalesced"], None)
+    ratio = lambda h, m: round(h / (h + m), 4) if h + m else None
+    queues = [({"queue": "kv_pending_writes"}, kv["pending"]), ({"queue": "quote_fetches_inflight"}, qs["inflight"])]
+    alerts = []
+    if _SUBS.ready("alerts"):
+        queues.append(({"queue": "alert_delivery"}, len(smart_alerts.delivery_queue)))
+        queues.append(({"queue": "alert_failed_deliveries"}, len(smart_alerts.failed_deliveries)))
+        alerts = [({"outcome": k}, v) for k, v in sorted(smart_alerts.filter_stats.items())]
+    if _SUBS.ready("streaming"):
+        queues.append(({"queue": "stream_updates"}, len(real_time_streamer.update_queue)))
+    threads = {}
+    for t in threading.enumerate():
+        k = _thread_kind(t.name); threads[k] = threads.get(k, 0) + 1
+    return [
+        ("cache_hits_total", "counter", "Cache hits.", [({"cache": n}, v[0]) for n, v in caches.items()]),
+        ("cache_misses_total", "counter", "Cache misses.", [({"cache": n}, v[1]) for n, v in caches.items()]),
+        ("cache_hit_ratio", "gauge", "Hits / (hits + misses) since start.",
+         [({"cache": n}, ratio(v[0], v[1])) for n, v in caches.items()]),
+        ("cache_entries", "gauge", "Entries held in memory.", [({"cache": n}, v[2]) for n, v in caches.items()]),
+        ("queue_depth", "gauge", "Items waiting in in-process queues.", queues),
+        ("alerts_total", "counter", "Smart-alert filter / delivery outcomes.", alerts),
+        ("threads", "gauge", "Live threads by name.", [({"name": k}, n) for k, n in sorted(threads.items())]),
+        ("scans_total", "counter", "Scan triggers by outcome (scan coordinator).",
+         [({"outcome": k}, _SCAN_STATE[k]) for k in ("ran", "skipped_busy", "skipped_recent", "aborted")]),
+        ("process_start_time_seconds", "gauge", "Unix time this process started.", [({}, round(_STARTED_AT, 3))]),
+        ("metrics_collector_errors_total", "counter", "Failed metric collectors.", [({}, _METRICS.collector_errors)]),
+    ]
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus text exposition: route / external-call / scan-phase latency histograms,
+    cache hit ratios, queue depths and thread counts for this process."""
+    return app.response_class(_METRICS.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+# ── Response encoding ────────────────────────────────────────────────────────
+# Large responses go out through _send (payload.py): gzip / brotli per Accept-Encoding, a
+# weak ETag (If-None-Match → 304) and Cache-Control. ?format=columnar switches to the
+# compact column encoding: delta-encoded base64 integer arrays and row lists as columns.
+import payload as _payload
+
+def _columnar():
+    return request.args.get("format") == "columnar"
+
+def _send(obj, max_age=60, pack=True, volatile=()):
+    """JSON response for `obj`. `volatile` top-level keys (e.g. a generated-at timestamp)
+    are left out of the ETag so an unchanged result still revalidates as 304."""
+    if pack and _columnar():
+        obj = _payload.pack(obj)
+    body = app.json.dumps(obj).encode()
+    tag = _payload.etag(app.json.dumps({k: v for k, v in obj.items() if k not in volatile}).encode()
+                        if volatile and isinstance(obj, dict) else body)
+    if request.if_none_match.contains_weak(tag):
+        resp = app.response_class(status=304)
+    else:
+        data, enc = _payload.compress(body, request.headers.get("Accept-Encoding", ""))
+        resp = app.response_class(data, mimetype="application/json")
+        if enc:
+            resp.headers["Content-Encoding"] = enc
+    resp.set_etag(tag, weak=True)
+    resp.headers["Cache-Control"] = "public, max-age=%d" % max_age
+    resp.vary.add("Accept-Encoding")
+    return resp
+
 @app.route("/history", methods=["GET"])
 def history():
-    """Server-side OHLCV history for signals / button colours (no CORS proxy)."""
+    """Server-side OHLCV history for signals / button colours (no CORS proxy).
+    ?format=columnar → close / high / low / vol as payload.py columns."""
     sym = request.args.get("sym", "")
     rng = request.args.get("range", "1y")
     itv = request.args.get("interval", "1d")
+    if rng not in _BAR_PERIODS or itv not in _BAR_INTERVALS:
+        return jsonify(_BAR_ARGS_ERROR), 400
     try:
-        h = yf.Ticker(sym).history(period=rng, interval=itv)
+        h = _bars(sym, rng, itv)
         if len(h) < 30:
             return jsonify({"error": "no data"}), 404
-        return jsonify({
-            "close": [None if x != x else round(float(x), 4) for x in h["Close"]],
-            "high":  [None if x != x else round(float(x), 4) for x in h["High"]],
-            "low":   [None if x != x else round(float(x), 4) for x in h["Low"]],
-            "vol":   [0 if x != x else int(x) for x in h["Volume"]],
-            "price": round(float(h["Close"].iloc[-1]), 4),
-        })
+        c, hi, lo, vol = _ohlcv(h)
+        vol = np.nan_to_num(vol)
+        if _columnar():
+            body = {"format": "columnar", "close": _payload.encode(c, 4), "high": _payload.encode(hi, 4),
+                    "low": _payload.encode(lo, 4), "vol": _payload.encode(vol, 0)}
+        else:
+            body = {"close": _payload.to_list(c, 4), "high": _payload.to_list(hi, 4),
+                    "low": _payload.to_list(lo, 4), "vol": vol.astype(np.int64).tolist()}
+        body["price"] = round(float(c[-1]), 4)
+        return _send(body, 60, pack=False)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -7166,12 +7710,16 @@ def index_chart():
     sym = request.args.get("sym", "^NSEI")
     rng = request.args.get("range", "6mo")
     itv = request.args.get("interval", "1d")
+    if rng not in _BAR_PERIODS or itv not in _BAR_INTERVALS:
+        return jsonify(_BAR_ARGS_ERROR), 400
     try:
-        h = yf.Ticker(sym).history(period=rng, interval=itv)
-        closes = [round(float(x), 2) for x in h["Close"] if x == x]  # drop NaN
-        if len(closes) < 2:
+        h = _bars(sym, rng, itv)
+        c = h["Close"].to_numpy(dtype=np.float64)
+        c = np.round(c[~np.isnan(c)], 2)  # drop NaN
+        if len(c) < 2:
             return jsonify({"error": "no data"}), 404
-        return jsonify({"sym": sym, "closes": closes, "price": closes[-1]})
+        closes = _payload.encode(c, 2) if _columnar() else c.tolist()
+        return _send({"sym": sym, "closes": closes, "price": float(c[-1])}, 60, pack=False)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -7187,8 +7735,13 @@ def model_stats():
     m = _MODEL
     if not m.get("ready"):
         return jsonify({"ready": False, "error": m.get("error", "training"), "n_train": m.get("n_train", 0)})
-    keys = ("ready","acc","auc","base_rate","n_train","n_test","n_live","label_profile","features","importance","trained_at")
-    return jsonify({k: m[k] for k in keys if k in m})
+    keys = ("ready","acc","auc","base_rate","n_train","n_test","n_live","label_profile","features","importance","trained_at",
+            "version","loaded_from","data_hash","train_wall_ms","train_timings_ms","per_symbol_ms")
+    out = {k: m[k] for k in keys if k in m}
+    out["inference"] = _inference_stats()
+    if "linear" in m:
+        out["linear"] = {"w": [round(float(x), 6) for x in m["linear"][0]], "b": round(m["linear"][1], 6)}
+    return jsonify(out)
 
 def _journal_closed():
     try:
@@ -7256,8 +7809,9 @@ def _journal_review(force=False):
     rev = {"text": text, "engine": engine, "generated_at": now, "n": f["n"], "stats": f}
     _kv_set("v3k_journal", rev); return rev
 
-def _maybe_weekly_review():
-    """Auto-generate + Telegram-send the weekly journal review (piggybacks on the scan heartbeat)."""
+def _maybe_weekly_review(wait=False):
+    """Auto-generate + Telegram-send the weekly journal review (piggybacks on the scan heartbeat;
+    the job runner calls it with wait=True)."""
     try:
         last = float(_kv_get("v3k_last_review", 0) or 0)
     except Exception:
@@ -7269,7 +7823,10 @@ def _maybe_weekly_review():
                 rev = _journal_review(force=True)
                 if rev.get("n"):
                     _tg_send("📓 V3K Weekly Review\n" + rev.get("text", ""))
-            threading.Thread(target=_job, daemon=True).start()
+            if wait:
+                _job()
+            else:
+                threading.Thread(target=_job, daemon=True).start()
             return True
         except Exception:
             pass
@@ -7304,7 +7861,7 @@ def track_record():
                 "avg_loss": round(sum(p for p in pnls if p <= 0) / max(1, sum(1 for p in pnls if p <= 0)), 2),
                 "expectancy": round(sum(pnls) / n, 2)}
     try:
-        n_live = len(_ml_samples_load())
+        n_live = _ml_samples_count()
     except Exception:
         n_live = 0
     return jsonify({"overall": _agg(closed),
@@ -7313,37 +7870,29 @@ def track_record():
                     "ml_samples_logged": n_live,
                     "note": "Live results from the app's own closed trades. Small samples are noisy — treat as directional."}), 200
 
-_BT_CACHE = {}          # market -> (ts, result)
 _BT_TTL   = 6 * 3600
+_BT_CACHE = TTLCache("backtest", 64, _BT_TTL, shared=_CACHE_TIER)   # "market:profile" / "pf:market:profile" -> result
 _BT_H     = 10          # max holding bars
 _BT_COST  = 0.15        # round-trip cost % (brokerage + slippage), applied per trade
 
 def _backtest_symbol(sym, market, tgt_m=0.75, stp_m=2.0, H=None):
+    """Per-bar reference for one symbol — the vectorized engine (_bt_block / backtest.py) is
+    checked against it trade-for-trade by `python backtest.py`."""
     H = H or _BT_H
-    h = yf.Ticker(sym).history(period="2y", interval="1d")
+    h = _bars(sym, "2y", "1d")
     if len(h) < 220:
         return []
     ic = _aligned_idx_closes(h, sym, "2y", "1d")
-    c = list(h["Close"]); hi = list(h["High"]); lo = list(h["Low"]); vol = list(h["Volume"])
-    e20 = _ema(c, 20); e50 = _ema(c, 50); e200 = _ema(c, 200)
-    e12 = _ema(c, 12); e26 = _ema(c, 26)
-    macd = [(e12[j]-e26[j]) if (e12[j] is not None and e26[j] is not None) else None for j in range(len(c))]
-    sig = _ema([0 if x is None else x for x in macd], 9)
-    rsiS = _rsi_series(c)
-    ie200 = _ema([x if x is not None else 0 for x in ic], 200)   # index 200-DMA aligned to this stock
+    ca, hia, loa, vola = _ohlcv(h)
+    ind = _ind.compute(ca, hia, loa, vola); sc = _ind.score(ca, hia, ind); atrS = ind["atr"].tolist()
+    rsS = _feat_matrix(ca, hia, loa, vola, ind, np.where(sc > 0, 1, -1), ic)[:, _FEATURES.index("rs60_idx")].tolist()
+    c = ca.tolist(); hi = hia.tolist(); lo = loa.tolist()
+    e200 = _ind.to_list(ind["ema200"])
+    ie200 = _ind.to_list(_ind.ema([x if x is not None else 0 for x in ic], 200))   # index 200-DMA aligned to this stock
     dates = list(h.index)
     trades = []; i = 210
     while i < len(c) - 1:
-        price = c[i]; s = 0
-        if e20[i] and e50[i]:  s += 1 if e20[i] > e50[i] else -1
-        if e50[i] and e200[i]: s += 1 if e50[i] > e200[i] else -1
-        if e20[i]:             s += 1 if price > e20[i] else -1
-        hist = (macd[i] or 0) - (sig[i] or 0); s += 1 if hist > 0 else -1
-        rv = rsiS[i]
-        if rv is not None:
-            if 52 < rv < 78: s += 1
-            elif 22 < rv < 48: s -= 1
-        dh = max(hi[i-20:i]); s += 1 if price >= dh else -1
+        price = c[i]; s = int(sc[i])
         if abs(s) < 6:        # high-conviction gate (max score)
             i += 1; continue
         dr = 1 if s > 0 else -1
@@ -7355,13 +7904,12 @@ def _backtest_symbol(sym, market, tgt_m=0.75, stp_m=2.0, H=None):
             risk_on = ic[i] >= ie200[i]
             if (dr > 0 and not risk_on) or (dr < 0 and risk_on):
                 i += 1; continue
-        # relative-strength gate (60-bar RS vs index)
-        if i >= 60 and c[i-60] and ic[i] and ic[i-60]:
-            rs60 = ((price/c[i-60]-1) - (ic[i]/ic[i-60]-1)) * 100
-            if (dr > 0 and rs60 <= -6) or (dr < 0 and rs60 >= 6):
-                i += 1; continue
+        # relative-strength gate (60-bar RS vs index; the feature is 0 when RS is undefined)
+        rs60 = rsS[i] * dr * 100
+        if (dr > 0 and rs60 <= -6) or (dr < 0 and rs60 >= 6):
+            i += 1; continue
         # enter — traded profile: 0.75 ATR target / 2.0 ATR stop
-        atr = _atr_at(hi, lo, c, i) or price * 0.02
+        atr = atrS[i]; atr = atr if (atr == atr and atr) else price * 0.02
         tgt = price + dr*tgt_m*atr; stp = price - dr*stp_m*atr
         outcome = None; exitp = None; held = 0
         for k in range(i+1, min(len(c), i+1+H)):
@@ -7380,24 +7928,70 @@ def _backtest_symbol(sym, market, tgt_m=0.75, stp_m=2.0, H=None):
         i = i + held + 1   # no overlapping trades on the same symbol
     return trades
 
-def _strategy_backtest(market, tgt_m=0.75, stp_m=2.0, H=None):
+# The vectorized engine (backtest.py) replays _backtest_symbol trade-for-trade. Its Block —
+# bars + gate directions for a whole watchlist — is independent of the exit profile, so it
+# is built once per market (cached like the results) and a new tgt/stp/h only re-resolves exits.
+import backtest as _bt
+_BT_DATA = TTLCache("backtest_block", 2, _BT_TTL)   # market -> backtest.Block
+
+def _bt_block(market, fresh=False):
+    """The market's Block — built once per _BT_TTL, however many backtests ask at once."""
     market = "us" if market == "us" else "india"
-    ck = "%s:%.2f:%.2f:%s" % (market, tgt_m, stp_m, H or _BT_H)
-    now = time_module.time(); c0 = _BT_CACHE.get(ck)
-    if c0 and now - c0[0] < _BT_TTL:
-        return c0[1]
+    if fresh:
+        blk = _bt_block_run(market); _BT_DATA.set(market, blk)
+        return blk
+    return _BT_DATA.get_or_set(market, lambda: _bt_block_run(market))
+
+def _bt_block_run(market):
     syms = _WATCH_US if market == "us" else _WATCH_IN
-    allt = []
+    snap = _BARS.history_many(list(syms) + ["^NSEI", "^GSPC"], "2y", "1d", workers=_SCAN_WORKERS)
+    parts = []
     for sym in syms:
         try:
-            allt += _backtest_symbol(sym, market, tgt_m, stp_m, H)
+            h = snap.get(sym)
+            if h is None or len(h) < 220:
+                continue
+            ih = snap.get("^NSEI" if str(sym).endswith(".NS") else "^GSPC")
+            ic = list(ih["Close"].reindex(h.index).ffill().bfill()) if ih is not None and len(ih) else [None] * len(h)
+            ca, hia, loa, vola = _ohlcv(h)
+            ind = _ind.compute(ca, hia, loa, vola); sc = _ind.score(ca, hia, ind)
+            rs60 = _feat_matrix(ca, hia, loa, vola, ind, np.where(sc > 0, 1, -1), ic)[:, _FEATURES.index("rs60_idx")]
+            ica = np.array([x if x is not None else 0 for x in ic], dtype=np.float64)
+            gates = _bt.gate_arrays(ca, sc, ind["ema200"], ica, _ind.ema(ica, 200), rs60)
+            parts.append((sym, list(h.index.strftime("%Y-%m-%d")), ca, hia, loa, ind["atr"], gates))
         except Exception:
             pass
+    return _bt.Block(parts)
+
+def _strategy_backtest(market, tgt_m=0.75, stp_m=2.0, H=None):
+    market = "us" if market == "us" else "india"
+    ck = "%s:%.2f:%.2f:%s" % (market, tgt_m, stp_m, H or _BT_H)
+    return _BT_CACHE.get_or_set(ck, lambda: _strategy_backtest_run(market, tgt_m, stp_m, H))
+
+def _strategy_backtest_run(market, tgt_m, stp_m, H):
+    syms = _WATCH_US if market == "us" else _WATCH_IN
+    allt = _bt_block(market).run(tgt_m, stp_m, H or _BT_H, _BT_COST)
     allt.sort(key=lambda t: t["date"])
     n = len(allt)
     if not n:
-        res = {"market": market, "trades": 0, "note": "Not enough qualifying setups in 2y history."}
-        _BT_CACHE[ck] = (now, res); return res
+        return {"market": market, "trades": 0, "note": "Not enough qualifying setups in 2y history."}
+    res = {
+        "market": market, "period": "2y", "watchlist": len(syms),
+        "profile": "%.2f ATR target / %.2f ATR stop / %dd" % (tgt_m, stp_m, H or _BT_H)}
+    res.update(_bt_stats(allt))
+    res.update({
+        "cost_per_trade_pct": _BT_COST,
+        "buys": sum(1 for t in allt if t["dir"] == "BUY"),
+        "sells": sum(1 for t in allt if t["dir"] == "SELL"),
+        "recent": allt[-8:],
+        "note": "Full stacked strategy (conviction + trend + regime + relative strength), net of %.2f%%/trade "
+                "costs. One position per symbol at a time. Past performance is not indicative of future results." % _BT_COST,
+    })
+    return res
+
+def _bt_stats(allt):
+    """Headline numbers for a date-sorted, non-empty trade list."""
+    n = len(allt)
     wins = [t for t in allt if t["pnl"] > 0]; pnls = [t["pnl"] for t in allt]
     # equity curve (one position at a time, compounding) → max drawdown
     eq = 1.0; peak = 1.0; mdd = 0.0
@@ -7412,9 +8006,7 @@ def _strategy_backtest(market, tgt_m=0.75, stp_m=2.0, H=None):
     except Exception:
         months = 24.0
     gross_win = sum(p for p in pnls if p > 0); gross_loss = -sum(p for p in pnls if p <= 0)
-    res = {
-        "market": market, "period": "2y", "watchlist": len(syms),
-        "profile": "%.2f ATR target / %.2f ATR stop / %dd" % (tgt_m, stp_m, H or _BT_H),
+    return {
         "trades": n, "wins": len(wins), "losses": n - len(wins),
         "win_rate": round(len(wins)/n*100, 1),
         "expectancy_pct": round(sum(pnls)/n, 3),          # avg net P&L per trade
@@ -7424,14 +8016,107 @@ def _strategy_backtest(market, tgt_m=0.75, stp_m=2.0, H=None):
         "total_return_pct": round((eq-1)*100, 1),         # compounded, 1 position at a time
         "max_drawdown_pct": round(mdd*100, 1),
         "trades_per_month": round(n/months, 1),
-        "cost_per_trade_pct": _BT_COST,
-        "buys": sum(1 for t in allt if t["dir"] == "BUY"),
-        "sells": sum(1 for t in allt if t["dir"] == "SELL"),
-        "recent": allt[-8:],
-        "note": "Full stacked strategy (conviction + trend + regime + relative strength), net of %.2f%%/trade "
-                "costs. One position per symbol at a time. Past performance is not indicative of future results." % _BT_COST,
     }
-    _BT_CACHE[ck] = (now, res); return res
+
+# ── Portfolio backtest ───────────────────────────────────────────────────────
+# Same signals and exits as /strategy-backtest, but traded the way the live scan does: many
+# swing positions at once out of one capital pool, sized and capped by the risk manager's
+# limits (risk per trade, single-position / sector / portfolio-risk caps, max positions),
+# with equity marked to market every day — so drawdown reflects overlapping positions.
+def _portfolio_backtest(market, tgt_m, stp_m, H=None, capital=100000.0, level="moderate"):
+    market = "us" if market == "us" else "india"; H = H or _BT_H
+    try: lvl = RiskLevel(level)
+    except Exception: lvl = RiskLevel.MODERATE
+    ck = "pf:%s:%.2f:%.2f:%s:%.0f:%s" % (market, tgt_m, stp_m, H, capital, lvl.value)
+    return _BT_CACHE.get_or_set(ck, lambda: _portfolio_backtest_run(market, tgt_m, stp_m, H, capital, lvl))
+
+def _portfolio_backtest_run(market, tgt_m, stp_m, H, capital, lvl):
+    t0 = time_module.perf_counter()
+    blk = _bt_block(market); limits = AdvancedRiskManager.RISK_PARAMS[lvl]
+    # unmapped symbols (all of the US list) count as their own sector, not one "Unknown" bucket
+    sectors = [AdvancedRiskManager.SECTOR_MAPPINGS.get(s) or s for s in blk.syms]
+    r = blk.portfolio(tgt_m, stp_m, H, _BT_COST, capital, limits, sectors)
+    eq = r["equity"]; tp = r["trade_pnl_pct"]
+    if not len(eq):
+        return {"market": market, "trades": 0, "note": "Not enough history."}
+    peak = np.maximum.accumulate(eq); dd = eq / peak - 1
+    rets = np.diff(eq) / eq[:-1] if len(eq) > 1 else np.zeros(0)
+    seq = blk.run(tgt_m, stp_m, H, _BT_COST); seq.sort(key=lambda t: t["date"])
+    seq_st = _bt_stats(seq) if seq else {}
+    step = max(1, len(eq) // 260)
+    res = {
+        "market": market, "period": "2y", "watchlist": len(blk.syms), "capital": capital,
+        "risk_level": lvl.value, "limits": limits,
+        "profile": "%.2f ATR target / %.2f ATR stop / %dd" % (tgt_m, stp_m, H),
+        "total_return_pct": round(float(eq[-1] / capital - 1) * 100, 1),
+        "max_drawdown_pct": round(float(dd.min()) * 100, 1),
+        "sharpe": round(float(rets.mean() / rets.std() * np.sqrt(252)), 2) if len(rets) and rets.std() else None,
+        "trades": int(len(tp)), "still_open": r["still_open"],
+        "win_rate": round(float((tp > 0).mean()) * 100, 1) if len(tp) else None,
+        "avg_trade_pnl_pct": round(float(tp.mean()), 2) if len(tp) else None,   # of each trade's notional
+        "avg_positions": round(float(r["open"].mean()), 2), "max_positions_held": int(r["open"].max()),
+        "avg_gross_exposure_pct": round(float(r["gross"].mean()) * 100, 1),
+        "rejected": r["rejected"],
+        "sequential": {k: seq_st.get(k) for k in ("trades", "total_return_pct", "max_drawdown_pct")},
+        "equity_curve": [[blk.days[i], round(float(eq[i]), 2)] for i in range(0, len(eq), step)] +
+                        ([[blk.days[-1], round(float(eq[-1]), 2)]] if (len(eq) - 1) % step else []),
+        "cost_per_trade_pct": _BT_COST, "wall_ms": round((time_module.perf_counter() - t0) * 1000, 1),
+        "note": "Concurrent positions from one capital pool, sized by the risk manager's limits and marked "
+                "to market daily. `sequential` is the one-position-at-a-time view of /strategy-backtest.",
+    }
+    return res
+
+# ── Strategy sweep ───────────────────────────────────────────────────────────
+# One grid point = one Block.run on the market's cached block (bars + indicators + gate
+# arrays are shared by every point), so a few hundred points take about a second. Points run
+# in-process: the block is too big to ship to pool workers per request, and forking a
+# threaded web worker isn't safe.
+_SWEEP_MAX = 2000       # grid points per request
+_SWEEP_KEYS = ("tgt", "stp", "h", "score", "rs")
+
+def _sweep_points(blk, pts):
+    out = []
+    for tgt, stp, H, ms, rc in pts:
+        allt = blk.run(tgt, stp, int(H), _BT_COST, ms, rc)
+        allt.sort(key=lambda t: t["date"])
+        p = {"tgt": tgt, "stp": stp, "h": int(H), "score": ms, "rs": rc}
+        if allt:
+            st = _bt_stats(allt)
+            p.update({k: st[k] for k in ("trades", "win_rate", "expectancy_pct", "profit_factor",
+                                         "max_drawdown_pct", "total_return_pct", "trades_per_month")})
+        else:
+            p["trades"] = 0
+        out.append(p)
+    return out
+
+def _strategy_sweep(market, grid, min_trades=30):
+    """Run every combination of grid[tgt|stp|h|score|rs] → surface + best point by expectancy."""
+    import itertools
+    t0 = time_module.perf_counter()
+    market = "us" if market == "us" else "india"
+    blk = _bt_block(market)
+    t1 = time_module.perf_counter()
+    surface = _sweep_points(blk, itertools.product(*(grid[k] for k in _SWEEP_KEYS)))
+    ok = [p for p in surface if p["trades"] >= min_trades]
+    best = max(ok, key=lambda p: p["expectancy_pct"]) if ok else None
+    return {"market": market, "grid": grid, "points": len(surface), "min_trades_for_best": min_trades,
+            "best": best, "surface": surface, "cost_per_trade_pct": _BT_COST,
+            "timings_ms": {"block": round((t1 - t0) * 1000, 1),
+                           "sweep": round((time_module.perf_counter() - t1) * 1000, 1)}}
+
+def _bt_h_arg():
+    """?h= holding bars (default _BT_H), or None when outside 1.._bt.MAX_H."""
+    try: H = int(request.args.get("h", _BT_H))
+    except Exception: H = _BT_H
+    return H if 1 <= H <= _bt.MAX_H else None
+
+_BT_H_ERROR = {"error": "h (holding bars) must be 1..%d" % _bt.MAX_H}
+
+def _bt_mult_ok(*xs):
+    """ATR target / stop multipliers must be finite and > 0 (nan / inf / 0 / negative → 400)."""
+    return all(math.isfinite(x) and x > 0 for x in xs)
+
+_BT_MULT_ERROR = {"error": "tgt and stp (ATR multipliers) must be finite and > 0"}
 
 @app.route("/strategy-backtest", methods=["GET"])
 def strategy_backtest():
@@ -7443,9 +8128,78 @@ def strategy_backtest():
         try: return float(request.args.get(name, d))
         except Exception: return d
     tgt = _f("tgt", dt); stp = _f("stp", ds)
-    try: H = int(request.args.get("h", _BT_H))
-    except Exception: H = _BT_H
-    return jsonify(_strategy_backtest(mkt, tgt, stp, H)), 200
+    H = _bt_h_arg()
+    if H is None:
+        return jsonify(_BT_H_ERROR), 400
+    if not _bt_mult_ok(tgt, stp):
+        return jsonify(_BT_MULT_ERROR), 400
+    return _send(_strategy_backtest(mkt, tgt, stp, H), 600)
+
+@app.route("/portfolio-backtest", methods=["GET"])
+def portfolio_backtest():
+    """2-year portfolio simulation of the stacked strategy: ?market=india|us &tgt=&stp=&h=
+    (as /strategy-backtest) &capital= &risk=conservative|moderate|aggressive (limit set)."""
+    mkt = (request.args.get("market") or "india").lower()
+    dt, ds = (2.0, 1.0) if mkt == "us" else (2.5, 1.5)   # live per-market defaults
+    def _f(name, d):
+        try: return float(request.args.get(name, d))
+        except Exception: return d
+    H = _bt_h_arg()
+    if H is None:
+        return jsonify(_BT_H_ERROR), 400
+    tgt = _f("tgt", dt); stp = _f("stp", ds); capital = _f("capital", 100000.0)
+    if not _bt_mult_ok(tgt, stp):
+        return jsonify(_BT_MULT_ERROR), 400
+    if not (math.isfinite(capital) and capital > 0):
+        return jsonify({"error": "capital must be finite and > 0"}), 400
+    return _send(_portfolio_backtest(mkt, tgt, stp, H, capital,
+                                     (request.args.get("risk") or "moderate").lower()), 600)
+
+@app.route("/strategy-sweep", methods=["GET"])
+def strategy_sweep():
+    """Grid sweep of the stacked strategy over shared cached bars / indicators.
+    ?market=india|us and comma lists for tgt, stp (ATR multipliers), h (holding bars),
+    score (min |score|, gate) and rs (RS60 cutoff %, gate); &min_trades= for `best`.
+    Returns the expectancy / profit-factor / drawdown surface, one entry per combination."""
+    mkt = (request.args.get("market") or "india").lower()
+    dflt = {"tgt": [0.75, 1.0, 1.5, 2.0, 2.5], "stp": [1.0, 1.5, 2.0], "h": [5, 10, 15],
+            "score": [5, 6], "rs": [4, 6, 8]}
+    grid = {}
+    try:
+        for k in _SWEEP_KEYS:
+            v = request.args.get(k)
+            grid[k] = sorted(set(float(x) for x in v.split(",") if x.strip())) if v else dflt[k]
+        grid["h"] = sorted(set(int(x) for x in grid["h"]))
+        min_trades = int(request.args.get("min_trades", 30))
+    except Exception:
+        return jsonify({"error": "grid values must be comma-separated numbers"}), 400
+    if not all(1 <= h <= _bt.MAX_H for h in grid["h"]):
+        return jsonify(_BT_H_ERROR), 400
+    if not _bt_mult_ok(*grid["tgt"], *grid["stp"]):
+        return jsonify(_BT_MULT_ERROR), 400
+    n = 1
+    for k in _SWEEP_KEYS: n *= max(1, len(grid[k]))
+    if not all(grid[k] for k in _SWEEP_KEYS) or n > _SWEEP_MAX:
+        return jsonify({"error": "grid must have 1..%d points (got %d)" % (_SWEEP_MAX, n)}), 400
+    return jsonify(_strategy_sweep(mkt, grid, min_trades)), 200
+
+@app.route("/model/evaluate", methods=["GET"])
+def model_evaluate():
+    """Walk-forward / purged k-fold comparison of the production logistic regression against
+    alternative models: ?scheme=walk_forward|purged_kfold &k=5 &models=logreg,hgb,rf &embargo=5
+    (days). Reuses the cached training samples; results cached until the samples change."""
+    scheme = request.args.get("scheme", "walk_forward")
+    if scheme not in ("walk_forward", "purged_kfold"):
+        return jsonify({"error": "scheme must be walk_forward or purged_kfold"}), 400
+    models = tuple(m for m in (request.args.get("models") or ",".join(_me.MODELS)).split(",") if m)
+    if not models or any(m not in _me.MODELS for m in models):
+        return jsonify({"error": "models must be a subset of %s" % ",".join(_me.MODELS)}), 400
+    try:
+        k = max(2, min(10, int(request.args.get("k", 5))))
+        embargo = max(0, min(60, int(request.args.get("embargo", 5))))
+    except Exception:
+        return jsonify({"error": "k and embargo must be integers"}), 400
+    return jsonify(_model_evaluate(scheme, k, models, embargo)), 200
 
 @app.route("/model/train", methods=["POST", "GET"])
 def model_train():
@@ -7454,50 +8208,209 @@ def model_train():
     return jsonify({"ready": m.get("ready"), "acc": m.get("acc"), "auc": m.get("auc"),
                     "n_train": m.get("n_train"), "n_test": m.get("n_test"), "error": m.get("error")})
 
-@app.route("/signals", methods=["GET"])
-def signals():
-    """Live watchlist signals WITH the ML win-probability (conf) for the app."""
-    mkt = request.args.get("market", "india")
-    syms = _WATCH_US if mkt == "us" else _WATCH_IN
+# ── Signal snapshot — computed by the scan, served by /signals ───────────────
+# Each scan publishes its market's scored watchlist as a versioned snapshot (memory + KV,
+# so every worker serves the newest one). /signals never computes in the request thread
+# except on a cold start; a snapshot older than _SIGNALS_STALE (the scan only publishes the
+# market it just scanned) or ?refresh=1 recomputes in the background.
+_SIGNALS_STALE = int(os.environ.get("SIGNALS_STALE", "1800"))   # seconds before a snapshot is flagged stale
+# market -> snapshot. A snapshot a day old is dropped here (KV still has the newest one).
+_SIGNALS = TTLCache("signals", 2, 86400)
+_SIGNALS_BUSY = set()    # markets with a background recompute running
+_SIGNALS_LOCK = threading.Lock()
+
+def _signals_compute(market):
+    """Score the whole watchlist for `market` from one bar-store snapshot (unfiltered)."""
+    syms = _WATCH_US if market == "us" else _WATCH_IN
+    snap = _BARS.history_many(list(syms) + [_INDEX_SYM[market]], "1y", "1d", workers=_SCAN_WORKERS)
     out = []
     for sym in syms:
         try:
-            r = _signal_tf(sym, "1y", "1d")
-            if r and abs(r["score"]) >= 3:
-                out.append(r)
+            out.append(_signal_tf(sym, "1y", "1d", h=snap.get(sym), score=False))
         except Exception:
             pass
-    out.sort(key=lambda x: (abs(x["score"]), x.get("ml_prob", 0)), reverse=True)
-    return jsonify({"market": mkt, "model_ready": _MODEL.get("ready", False), "signals": out})
+    _ml_score(out)
+    return out
+
+def _signals_shared(market):
+    """The snapshot in KV (another worker may have published it), or None."""
+    try:
+        return _kv_get("v3k_signals_" + market, None)
+    except Exception:
+        return None
+
+def _signals_newest(market, shared):
+    """Caller holds _SIGNALS_LOCK. This worker's snapshot, or `shared` if it is newer."""
+    mine = _SIGNALS.get(market)
+    if shared and shared.get("version", 0) > (mine or {}).get("version", 0):
+        _SIGNALS.set(market, shared); mine = shared
+    return mine
+
+def _signals_current(market):
+    """Newest snapshot for `market` — this worker's or the one another worker published."""
+    shared = _signals_shared(market)
+    with _SIGNALS_LOCK:
+        return _signals_newest(market, shared)
+
+def _signals_publish(market, sigs, source="scan"):
+    """Filter (|score| >= 3), rank and publish the next snapshot version for `market`."""
+    out = sorted((r for r in sigs if r and abs(r["score"]) >= 3),
+                 key=lambda x: (abs(x["score"]), x.get("ml_prob", 0)), reverse=True)
+    shared = _signals_shared(market)     # may be a network read: not under the lock
+    with _SIGNALS_LOCK:
+        version = int((_signals_newest(market, shared) or {}).get("version", 0)) + 1
+        body = json.dumps(out, sort_keys=True, default=str).encode()
+        snap = {"market": market, "version": version, "computed_at": time_module.time(), "source": source,
+                "model_ready": bool(_MODEL.get("ready", False)), "model_version": _MODEL.get("version"),
+                "signals": out,
+                "etag": "%s-%d-%s" % (market, version, hashlib.sha1(body).hexdigest()[:12])}
+        _SIGNALS.set(market, snap)
+        _kv_set("v3k_signals_" + market, snap)
+    return snap
+
+def _signals_refresh_bg(market):
+    """Recompute + publish `market` on a daemon thread (one at a time per market)."""
+    with _SIGNALS_LOCK:
+        if market in _SIGNALS_BUSY:
+            return False
+        _SIGNALS_BUSY.add(market)
+    def _run():
+        try:
+            _signals_publish(market, _signals_compute(market), "refresh")
+        except Exception as e:
+            logging.warning("signal refresh %s failed: %s", market, e)
+        finally:
+            _SIGNALS_BUSY.discard(market)
+    threading.Thread(target=_run, daemon=True).start()
+    return True
+
+@app.route("/signals", methods=["GET"])
+def signals():
+    """Live watchlist signals WITH the ML win-probability (conf) for the app, from the latest
+    scan snapshot. ETag / If-None-Match → 304; a stale snapshot or ?refresh=1 recomputes in
+    the background."""
+    mkt = "us" if request.args.get("market", "india") == "us" else "india"
+    snap = _signals_current(mkt)
+    if snap is None:   # cold start: one compute however many requests arrive at once
+        snap = _SIGNALS.get_or_set(mkt, lambda: _signals_publish(mkt, _signals_compute(mkt), "request"))
+    age = time_module.time() - snap["computed_at"]
+    if request.args.get("refresh") in ("1", "true") or age > _SIGNALS_STALE:
+        refreshing = _signals_refresh_bg(mkt) or mkt in _SIGNALS_BUSY
+    else:
+        refreshing = mkt in _SIGNALS_BUSY
+    if request.if_none_match.contains(snap["etag"]):
+        resp = app.response_class(status=304)
+    else:
+        resp = jsonify({"market": mkt, "model_ready": snap["model_ready"], "signals": snap["signals"],
+                        "version": snap["version"], "source": snap["source"],
+                        "computed_at": datetime.utcfromtimestamp(snap["computed_at"]).isoformat(),
+                        "age_s": round(age, 1), "stale": age > _SIGNALS_STALE, "refreshing": bool(refreshing)})
+    resp.set_etag(snap["etag"]); resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Snapshot-Age"] = str(int(age))
+    return resp
+
+# ── Background jobs ──────────────────────────────────────────────────────────
+# BACKGROUND_JOBS=web (default): the scan loop, model thread and gunicorn's post_fork
+# scanner run inside the web process, as before. BACKGROUND_JOBS=runner: one `python jobs.py`
+# process runs them all (jobs.py) and the web workers only serve requests. They load model
+# artifacts but never train, and read the live scanner's results and the runner's status
+# from the KV store. Either way the jobs whose state lives in the web worker — risk
+# monitoring of its positions, delivery of its smart-alert queue — run here, supervised by
+# a jobs.Runner of their own ("web_jobs").
+_BACKGROUND = "runner" if os.environ.get("BACKGROUND_JOBS", "web").lower() == "runner" else "web"
+_LEGACY_SYNC = {"at": 0.0, "version": None}
+
+def _legacy_publish():
+    """Runner side: the live scanner's bot_state → KV for the web workers."""
+    snap = {"signals": bot_state.cached_signals, "options": bot_state.cached_options,
+            "scalping": bot_state.cached_scalping, "metrics": bot_state.performance_metrics,
+            "status": bot_state.scan_status, "version": time_module.time(),
+            "last_scan": bot_state.last_scan_time.isoformat() if bot_state.last_scan_time else None}
+    _kv_set("v3k_legacy_scan", json.loads(json.dumps(snap, default=str)))
+
+@app.before_request
+def _legacy_sync():
+    """Web side (runner mode): refresh bot_state from the runner's snapshot at most every 15 s."""
+    if _BACKGROUND != "runner" or time_module.time() - _LEGACY_SYNC["at"] < 15:
+        return
+    _LEGACY_SYNC["at"] = time_module.time()
+    try:
+        snap = _kv_get("v3k_legacy_scan", None)
+    except Exception:
+        return
+    if not snap or snap.get("version") == _LEGACY_SYNC["version"]:
+        return
+    _LEGACY_SYNC["version"] = snap.get("version")
+    bot_state.cached_signals = snap.get("signals") or []; bot_state.cached_options = snap.get("options") or []
+    bot_state.cached_scalping = snap.get("scalping") or []; bot_state.performance_metrics = snap.get("metrics") or {}
+    bot_state.scan_status = snap.get("status") or "idle"
+    bot_state.last_scan_time = datetime.fromisoformat(snap["last_scan"]) if snap.get("last_scan") else None
+
+@app.route("/jobs/status", methods=["GET"])
+def jobs_status():
+    """The job runner's last heartbeat (per-job schedule, failures and recent runs), and the
+    same for this worker's local jobs."""
+    local = _web_jobs.status() if _SUBS.ready("web_jobs") else None
+    st = _kv_get("v3k_jobs_status", None)
+    if not st:
+        return jsonify({"mode": _BACKGROUND, "runner": None, "local": local}), 200
+    return jsonify({"mode": _BACKGROUND, "runner": st, "local": local,
+                    "heartbeat_age_s": round(time_module.time() - st.get("at", 0), 1)}), 200
 
 def _alert_loop():
     # Runs while the instance is awake. On Render free tier, also ping /cron/scan
     # from a free external scheduler (cron-job.org) every 15 min for true 24/7.
     while True:
         try:
-            _run_scan()
+            _scan_once("loop")
         except Exception:
             pass
         time_module.sleep(900)
 
-try:
-    threading.Thread(target=_alert_loop, daemon=True).start()
-except Exception:
-    pass
+def _start_daemon(target):
+    t = threading.Thread(target=target, daemon=True); t.start()
+    return t
+
+_SUBS.register("scan_loop", lambda: _start_daemon(_alert_loop), "15-min scan + alert loop thread")
+
+def _start_web_jobs():
+    import jobs
+    r = jobs.local_runner(sys.modules[__name__])
+    threading.Thread(target=r.run_forever, name="web-jobs", daemon=True).start()
+    return r
+
+_web_jobs = _SUBS.register("web_jobs", _start_web_jobs, "risk monitor + alert delivery jobs for this worker's state")
 
 # Train the ML model in the background at startup (non-blocking). The app serves
 # signals with the heuristic confidence until the model is ready, then uses it.
 def _model_bootstrap():
     try:
-        _train_model()
-        # Starting the weekly clock here means each deploy's startup train counts as the
-        # weekly retrain; the scan-timer only fires if the service runs 7+ days without a deploy.
-        try: _kv_set("v3k_last_retrain", time_module.time())
-        except Exception: pass
+        # Load the latest artifact (another worker's or an earlier deploy's) — train only if
+        # there is none yet.
+        if not _model_refresh() and _BACKGROUND != "runner":
+            _train_model()
+            # Starting the weekly clock here means each deploy's startup train counts as the
+            # weekly retrain; the scan-timer only fires if the service runs 7+ days without a deploy.
+            try: _kv_set("v3k_last_retrain", time_module.time())
+            except Exception: pass
     except Exception:
         pass
+    # then follow retrains done elsewhere (weekly scan retrain, /model/train in another worker)
+    while True:
+        time_module.sleep(_MODEL_POLL)
+        try: _model_refresh()
+        except Exception: pass
 
-try:
-    threading.Thread(target=_model_bootstrap, daemon=True).start()
-except Exception:
-    pass
+_SUBS.register("ml", lambda: _start_daemon(_model_bootstrap), "model load / startup train + hot-swap poll thread")
+_SUBS.mark("V3K engine + routes")
+
+# Subsystems built at import (the rest on first use). The default keeps the scan loop,
+# model thread and local jobs running in the web process (with BACKGROUND_JOBS=runner only
+# the model poll and the local jobs);
+# SUBSYSTEMS=none gives a bare, side-effect-free import (tests, one-off scripts, jobs.py)
+# and "all" builds everything up front.
+# A spawned _pool_map worker re-imports the parent's main script — this file under
+# `python app.py` — and must not start anything.
+import multiprocessing as _mp
+_SUBS.start("none" if _mp.current_process().name != "MainProcess" else
+            os.environ.get("SUBSYSTEMS", "scan_loop,ml,web_jobs" if _BACKGROUND == "web" else "ml,web_jobs"))
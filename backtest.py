@@ -0,0 +1,222 @@
+# backtest.py – Vectorized engine behind /strategy-backtest
+#
+# A Block holds every watchlist symbol's daily bars concatenated into flat arrays, with the
+# stacked entry gates (score ±6, EMA200 trend, index regime, RS60) already resolved into a
+# per-bar direction: +1 / -1 where a setup fires, 0 elsewhere. The gates don't depend on the
+# exit profile, so a Block is built once per market and every (target, stop, horizon) run
+# only resolves exits: first touch of target / stop for all candidate entries of all
+# symbols at once, on an (entries × horizon) window. Only the one-position-per-symbol
+# walk over the (few) candidate entries stays a Python loop — it is inherently sequential.
+#
+# app._backtest_symbol is the per-bar reference; `python backtest.py` checks trade-for-trade
+# parity and times both.
+
+import numpy as np
+
+import indicators as _ind
+
+START = 210            # first bar that may open a trade (EMA200 warm-up)
+MAX_H = 60             # longest holding window; exits() allocates (entries × H) arrays
+
+
+def gate_arrays(c, sc, e200, ic, ie200, rs60):
+    """Per-bar inputs of the stacked gates for one symbol: trade direction, |score|, the
+    parameter-free gates (EMA200 trend, index regime, warm-up) and the direction-signed
+    60-bar relative strength in %. `ic` is the aligned index close with missing values as 0."""
+    n = len(c)
+    dr = np.where(sc > 0, 1.0, -1.0)
+    with np.errstate(invalid="ignore"):
+        trend = _ind.truthy(e200) & np.where(dr > 0, c > e200, c < e200)    # price vs 200-EMA
+        known = (ic != 0) & _ind.truthy(ie200)
+        risk_on = ic >= ie200
+        regime = ~known | np.where(dr > 0, risk_on, ~risk_on)               # index vs its 200-DMA
+    base = trend & regime
+    base[:START] = False; base[max(0, n - 1):] = False
+    return {"dr": dr, "score": np.abs(np.asarray(sc, dtype=np.float64)), "base": base, "rs": rs60 * dr * 100}
+
+
+def entry_dirs(g, min_score=6, rs_cut=6):
+    """Per-bar trade direction (0 = no entry) for gate arrays `g`, gate for gate as the
+    per-bar loop: conviction |score| >= min_score, and no long lagging (short leading) the
+    index by rs_cut % or more over 60 bars."""
+    with np.errstate(invalid="ignore"):
+        weak = np.where(g["dr"] > 0, g["rs"] <= -rs_cut, g["rs"] >= rs_cut)
+    return np.where(g["base"] & (g["score"] >= min_score) & ~weak, g["dr"], 0.0)
+
+
+class Block:
+    """Concatenated per-symbol arrays for one market (see module docstring)."""
+
+    def __init__(self, parts):
+        """parts: [(sym, "YYYY-MM-DD" dates, c, hi, lo, atr, gate_arrays)] in watchlist order."""
+        self.syms = [p[0] for p in parts]
+        lens = [len(p[2]) for p in parts]
+        self.start = np.concatenate([[0], np.cumsum(lens)[:-1]]).astype(np.int64) if parts else np.zeros(0, np.int64)
+        self.seg = np.repeat(np.arange(len(parts)), lens)
+        self.end = np.repeat(self.start + np.asarray(lens, dtype=np.int64), lens)   # per bar: its symbol's end
+        cat = lambda k: np.concatenate([np.asarray(p[k], dtype=np.float64) for p in parts]) if parts else np.zeros(0)
+        self.c, self.hi, self.lo, self.atr = cat(2), cat(3), cat(4), cat(5)
+        self.gates = {k: (np.concatenate([p[6][k] for p in parts]) if parts else np.zeros(0))
+                      for k in ("dr", "score", "base", "rs")}
+        self.dates = [d for p in parts for d in p[1]]
+        self._dirs = {}                 # (min_score, rs_cut) -> (dirs, candidate bars)
+        # shared calendar across symbols: each bar's day index, and a forward-filled
+        # (days × symbols) close matrix for marking positions to market
+        self.days = sorted(set(self.dates))
+        self.didx = np.searchsorted(np.array(self.days), np.array(self.dates)) if self.dates else np.zeros(0, np.int64)
+        C = np.full((len(self.days), len(parts)), np.nan)
+        C[self.didx, self.seg] = self.c
+        ok = ~np.isnan(C)
+        last = np.maximum.accumulate(np.where(ok, np.arange(len(self.days))[:, None], 0), axis=0)
+        self.closes = C[last, np.arange(len(parts))[None, :]] if len(parts) else C
+
+    def entries(self, min_score=6, rs_cut=6):
+        key = (float(min_score), float(rs_cut))
+        if key not in self._dirs:
+            dirs = entry_dirs(self.gates, min_score, rs_cut)
+            self._dirs[key] = (dirs, np.flatnonzero(dirs))   # every gated entry bar, symbol-major
+        return self._dirs[key]
+
+    def exits(self, g, dr, tgt_m, stp_m, H, cost):
+        """First-touch exits for entry bars `g` (directions `dr`): per entry the target and
+        stop prices, bars held, exit price and net P&L %."""
+        if not 1 <= H <= MAX_H:
+            raise ValueError("holding bars must be 1..%d (got %r)" % (MAX_H, H))
+        price = self.c[g]; end = self.end[g]
+        atr = self.atr[g]
+        atr = np.where((atr == atr) & (atr != 0), atr, price * 0.02)
+        tgt = price + dr * tgt_m * atr; stp = price - dr * stp_m * atr
+        # (entries × H) window of the bars after each entry, clipped at the symbol's last bar
+        off = np.arange(1, H + 1)
+        idx = g[:, None] + off[None, :]
+        valid = idx < end[:, None]
+        idx = np.minimum(idx, len(self.c) - 1)
+        hw, lw = self.hi[idx], self.lo[idx]
+        up = (dr > 0)[:, None]
+        hit_t = valid & np.where(up, hw >= tgt[:, None], lw <= tgt[:, None])
+        hit_s = valid & np.where(up, lw <= stp[:, None], hw >= stp[:, None])
+        ft = np.where(hit_t.any(1), hit_t.argmax(1), H)
+        fs = np.where(hit_s.any(1), hit_s.argmax(1), H)
+        win = (ft < H) & (ft <= fs)                       # target checked first on a shared bar
+        loss = (fs < H) & ~win
+        k_end = np.minimum(end - 1, g + H)                # no touch → exit on the horizon close
+        held = np.where(win, ft + 1, np.where(loss, fs + 1, k_end - g))
+        exitp = np.where(win, tgt, np.where(loss, stp, self.c[k_end]))
+        pnl = (exitp - price) / price * 100.0 * dr - cost
+        return tgt, stp, held, exitp, pnl
+
+    def run(self, tgt_m, stp_m, H, cost, min_score=6, rs_cut=6):
+        """Trades for one exit profile and gate setting, in symbol order then time — the same
+        list (and order) as concatenating the per-bar loop's output over the watchlist."""
+        dirs, g = self.entries(min_score, rs_cut)
+        if not len(g):
+            return []
+        dr = dirs[g]
+        _tgt, _stp, held, _exitp, pnl = self.exits(g, dr, tgt_m, stp_m, H, cost)
+        # one position per symbol: walk the candidates, skipping entries inside a held trade
+        trades = []; seg = self.seg[g]; nxt = -1; cur = -1
+        for gi, s, h, p, d in zip(g.tolist(), seg.tolist(), held.tolist(), pnl.tolist(), dr.tolist()):
+            if s != cur:
+                cur = s; nxt = -1
+            if gi < nxt:
+                continue
+            trades.append({"date": self.dates[gi], "sym": self.syms[s].replace(".NS", ""),
+                           "dir": "BUY" if d > 0 else "SELL", "pnl": round(p, 2), "held": h})
+            nxt = gi + h + 1
+        return trades
+
+    def portfolio(self, tgt_m, stp_m, H, cost, capital, limits, sectors, min_score=6, rs_cut=6):
+        """Shared-capital simulation: step the common calendar, close positions whose first-
+        touch exit falls on the day, open that day's gated entries (watchlist order) sized and
+        capped like AdvancedRiskManager, then mark every open position to the day's close.
+
+        limits: AdvancedRiskManager.RISK_PARAMS for one level (percent of current equity:
+        max_position_risk, max_single_position, max_sector_concentration, max_portfolio_risk;
+        plus max_positions). sectors: one label per symbol. No leverage — a position's full
+        notional (long or short) is reserved from cash. Returns a dict of arrays and counts;
+        trade_pnl is in capital's currency, trade_pnl_pct is each trade's P&L as % of its notional."""
+        dirs, g = self.entries(min_score, rs_cut)
+        nd = len(self.days); P = int(limits["max_positions"])
+        equity = np.full(nd, float(capital)); cash = float(capital)
+        # open-position slots (array bookkeeping; `live` marks the used ones)
+        live = np.zeros(P, bool); s_sym = np.zeros(P, np.int64); s_qty = np.zeros(P)
+        s_px = np.zeros(P); s_dr = np.zeros(P); s_exit = np.zeros(P, np.int64); s_xpx = np.zeros(P)
+        s_risk = np.zeros(P); s_sec = np.zeros(P, np.int64)
+        sec_ids = {s: i for i, s in enumerate(dict.fromkeys(sectors))}
+        sym_sec = np.array([sec_ids[s] for s in sectors], dtype=np.int64)
+        trades = []; trade_pct = []; rejected = {}; n_open = np.zeros(nd, np.int64); gross = np.zeros(nd)
+        if len(g):
+            dr = dirs[g]
+            tgt, stp, held, exitp, _pnl = self.exits(g, dr, tgt_m, stp_m, H, cost)
+            day_of = self.didx[g]; exit_day = self.didx[g + held]
+            order = np.lexsort((self.seg[g], day_of))          # by day, then watchlist order
+            bounds = np.searchsorted(day_of[order], np.arange(nd + 1))
+        pct = lambda k: float(limits[k]) / 100.0
+        for t in range(nd):
+            # 1) exits due today, at their target / stop / horizon-close price
+            done = live & (s_exit == t)
+            if done.any():
+                for j in np.flatnonzero(done).tolist():
+                    pl = s_qty[j] * s_dr[j] * (s_xpx[j] - s_px[j]) - s_qty[j] * s_px[j] * cost / 100.0
+                    cash += s_qty[j] * s_px[j] + pl
+                    trades.append(pl); trade_pct.append(pl / (s_qty[j] * s_px[j]) * 100.0)
+                live[done] = False
+            # 2) mark to market on today's closes (before sizing new entries)
+            mark = self.closes[t, s_sym]
+            mark = np.where(np.isnan(mark), s_px, mark)
+            eq = cash + float(np.sum(np.where(live, s_qty * s_px + s_qty * s_dr * (mark - s_px), 0.0)))
+            # 3) today's entries, sized off current equity
+            if len(g):
+                for k in order[bounds[t]:bounds[t + 1]].tolist():
+                    sym = int(self.seg[g[k]])
+                    if (live & (s_sym == sym)).any():
+                        continue                                    # already holding it
+                    why = None; px = float(self.c[g[k]]); risk_ps = abs(px - float(stp[k]))
+                    if live.sum() >= P:
+                        why = "max_positions"
+                    elif risk_ps <= 0:
+                        why = "invalid_stop"
+                    else:
+                        qty = eq * pct("max_position_risk") / risk_ps
+                        caps = {"max_single_position": eq * pct("max_single_position") / px,
+                                "max_sector_concentration": (eq * pct("max_sector_concentration") -
+                                    float(np.sum(np.where(live & (s_sec == sym_sec[sym]), s_qty * s_px, 0.0)))) / px,
+                                "max_portfolio_risk": (eq * pct("max_portfolio_risk") -
+                                    float(np.sum(np.where(live, s_risk, 0.0)))) / risk_ps,
+                                "cash": cash / px}
+                        binding = min(caps, key=caps.get)
+                        qty = int(min(qty, caps[binding]))
+                        if qty < 1:
+                            why = binding
+                    if why:
+                        rejected[why] = rejected.get(why, 0) + 1; continue
+                    j = int(np.flatnonzero(~live)[0])
+                    live[j] = True; s_sym[j] = sym; s_qty[j] = qty; s_px[j] = px; s_dr[j] = dr[k]
+                    s_exit[j] = exit_day[k]; s_xpx[j] = exitp[k]; s_risk[j] = qty * risk_ps; s_sec[j] = sym_sec[sym]
+                    cash -= qty * px
+            equity[t] = eq
+            n_open[t] = int(live.sum())
+            gross[t] = float(np.sum(np.where(live, s_qty * s_px, 0.0))) / eq if eq else 0.0
+        return {"equity": equity, "open": n_open, "gross": gross, "trade_pnl": np.array(trades),
+                "trade_pnl_pct": np.array(trade_pct),
+                "rejected": rejected, "still_open": int(live.sum())}
+
+
+if __name__ == "__main__":
+    import time
+
+    import app
+    for market, syms in (("india", app._WATCH_IN), ("us", app._WATCH_US)):
+        t0 = time.perf_counter(); blk = app._bt_block(market, fresh=True); t1 = time.perf_counter()
+        for prof in ((0.75, 2.0, 10), (2.5, 1.5, 10), (2.0, 1.0, 5), (1.0, 1.0, 20)):
+            t2 = time.perf_counter(); new = blk.run(prof[0], prof[1], prof[2], app._BT_COST); t3 = time.perf_counter()
+            ref = []
+            for s in syms:
+                try:
+                    ref += app._backtest_symbol(s, market, *prof)
+                except Exception:
+                    pass
+            t4 = time.perf_counter()
+            print("%-5s %-16s trades %4d  identical %s  engine %.1f ms  per-bar loop %.1f ms"
+                  % (market, prof, len(new), new == ref, (t3 - t2) * 1000, (t4 - t3) * 1000))
+        print("%-5s block build %.1f ms" % (market, (t1 - t0) * 1000))
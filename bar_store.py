@@ -0,0 +1,297 @@
+# bar_store.py – Persistent OHLCV bar cache in front of yfinance history downloads
+#
+# One NumPy file per (symbol, interval): a structured array of UTC timestamps + OHLCV,
+# opened memory-mapped, plus a tiny JSON sidecar (exchange tz, span fetched, last check).
+# A cache miss downloads the full span once; a hit only fetches the tail from the last
+# stored bar and merges it, so a warm scan does no full-history downloads at all.
+# Files are replaced atomically, so several gunicorn workers can share one directory.
+# Only yfinance's own period / interval strings are accepted (they end up in file names),
+# and files no read has refreshed for `max_idle` seconds are swept, oldest first past
+# `max_files`, so ad-hoc symbols don't pile up.
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ("Open", "High", "Low", "Close", "Volume")
+_DTYPE = np.dtype([("ts", "<i8")] + [(c.lower(), "<f8") for c in COLUMNS])
+
+# What yfinance accepts; anything else is rejected before it reaches a file name.
+INTERVALS = frozenset(("1m", "2m", "5m", "15m", "30m", "60m", "90m", "1h", "1d", "5d", "1wk", "1mo", "3mo"))
+PERIODS = frozenset(("1d", "5d", "1mo", "3mo", "6mo", "1y", "2y", "5y", "10y", "ytd", "max"))
+
+# Daily history is always fetched at least this far back: the ML / backtest paths want 2y,
+# so a scan's 1y request must not force a second full download later.
+_MIN_SPAN = {"1d": "2y"}
+
+
+def _offset(period):
+    """yfinance period string → pandas DateOffset (None = everything)."""
+    p = (period or "1mo").lower()
+    if p == "max":
+        return None
+    if p == "ytd":
+        return "ytd"
+    num = "".join(ch for ch in p if ch.isdigit()) or "1"; unit = p[len(num):]
+    n = int(num)
+    return {"d": pd.DateOffset(days=n), "wk": pd.DateOffset(weeks=n), "mo": pd.DateOffset(months=n),
+            "y": pd.DateOffset(years=n)}.get(unit, pd.DateOffset(months=1))
+
+
+def _span_days(period):
+    off = _offset(period)
+    if off is None:
+        return float("inf")
+    if off == "ytd":
+        return 366.0
+    ref = pd.Timestamp("2000-01-01")
+    return float(((ref + off) - ref).days)
+
+
+def _empty():
+    return pd.DataFrame(columns=list(COLUMNS), dtype=np.float64)
+
+
+def _yf_fetch(sym, interval, period=None, start=None):
+    import yfinance as yf
+    if start is not None:
+        return yf.Ticker(sym).history(start=start, interval=interval)
+    return yf.Ticker(sym).history(period=period, interval=interval)
+
+
+class BarStore:
+    """history(sym, period, interval) with the yfinance signature, served from disk."""
+
+    def __init__(self, root, fetch=None, refresh=60, max_files=2000, max_idle=30 * 86400, sweep_every=3600):
+        self.root = root
+        self.fetch = fetch or _yf_fetch
+        self.refresh = refresh            # min seconds between tail checks per file
+        self.max_files = max_files; self.max_idle = max_idle; self.sweep_every = sweep_every
+        self._swept = 0.0
+        self._locks = [threading.Lock() for _ in range(64)]   # striped by file: bounded
+        self._guard = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "tail_fetches": 0, "fresh_hits": 0,
+                         "bars_downloaded": 0, "bars_served": 0, "errors": 0}
+        os.makedirs(root, exist_ok=True)
+
+    # ── files ────────────────────────────────────────────────────────────────
+    def _path(self, sym, interval):
+        return os.path.join(self.root, "%s__%s.npy" % (quote(sym, safe=""), quote(interval, safe="")))
+
+    def _lock(self, key):
+        return self._locks[hash(key) % len(self._locks)]
+
+    def _count(self, **kw):
+        with self._guard:
+            for k, v in kw.items():
+                self.counters[k] += v
+
+    def _load(self, path):
+        try:
+            arr = np.load(path, mmap_mode="r")
+            with open(path + ".json") as f:
+                return arr, json.load(f)
+        except Exception:
+            return None, None
+
+    def _save(self, path, arr, meta):
+        tmp = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+        with open(tmp, "wb") as f:
+            np.save(f, arr)
+        os.replace(tmp, path)
+        self._save_meta(path, meta)
+
+    def _save_meta(self, path, meta):
+        tmp = "%s.json.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, path + ".json")
+
+    # ── frame <-> array ──────────────────────────────────────────────────────
+    @staticmethod
+    def _to_array(h):
+        arr = np.empty(len(h), dtype=_DTYPE)
+        idx = h.index if h.index.tz is not None else h.index.tz_localize("UTC")
+        arr["ts"] = idx.tz_convert("UTC").tz_localize(None).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+        for c in COLUMNS:
+            arr[c.lower()] = h[c].to_numpy(dtype=np.float64) if c in h else np.nan
+        return arr
+
+    @staticmethod
+    def _to_frame(arr, tz):
+        idx = pd.DatetimeIndex(pd.to_datetime(np.asarray(arr["ts"]), utc=True)).tz_convert(tz)
+        return pd.DataFrame({c: np.array(arr[c.lower()]) for c in COLUMNS}, index=idx)
+
+    @staticmethod
+    def _tz(h):
+        return str(h.index.tz) if getattr(h.index, "tz", None) is not None else "UTC"
+
+    # ── public ───────────────────────────────────────────────────────────────
+    def history(self, sym, period="1mo", interval="1d", max_age=None):
+        """max_age overrides `refresh` for this read (e.g. a few seconds for live quotes).
+        ValueError for a period / interval yfinance doesn't know."""
+        if interval not in INTERVALS:
+            raise ValueError("unknown interval %r" % interval)
+        if period not in PERIODS:
+            raise ValueError("unknown period %r" % period)
+        path = self._path(sym, interval)
+        with self._lock(path):
+            arr, meta = self._load(path)
+            want = period
+            floor = _MIN_SPAN.get(interval)
+            if floor and _span_days(floor) > _span_days(want):
+                want = floor
+            if arr is None or not len(arr) or _span_days(meta.get("span")) < _span_days(period):
+                full, fmeta = self._full(sym, interval, want, path)
+                if full is not None:
+                    arr, meta = full, fmeta
+                elif arr is None or not len(arr):
+                    return _empty()
+            else:
+                arr, meta = self._tail(sym, interval, arr, meta, path, max_age)
+            out = self._slice(arr, meta["tz"], period)
+        if time.time() - self._swept > self.sweep_every:   # not under a file lock: sweep takes them
+            self.sweep()
+        return out
+
+    def history_many(self, syms, period="1mo", interval="1d", workers=8, retries=2, backoff=0.5, max_age=None):
+        """history() for many symbols on a bounded thread pool. An empty result (download
+        failed, nothing cached) is retried with exponential backoff. Returns {sym: frame}."""
+        def _one(sym):
+            h = _empty()
+            for attempt in range(retries + 1):
+                try:
+                    h = self.history(sym, period, interval, max_age)
+                except Exception as e:
+                    logging.warning("bar store load %s failed: %s", sym, e)
+                if len(h):
+                    break
+                if attempt < retries:
+                    time.sleep(backoff * 2 ** attempt)
+            return h
+        syms = list(dict.fromkeys(syms))
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(syms)))) as ex:
+            return dict(zip(syms, ex.map(_one, syms)))
+
+    def _full(self, sym, interval, period, path):
+        self._count(misses=1)
+        try:
+            h = self.fetch(sym, interval, period=period)
+        except Exception as e:
+            logging.warning("bar store fetch %s failed: %s", sym, e)
+            self._count(errors=1)
+            return None, None
+        if h is None or not len(h):
+            return None, None
+        arr = self._to_array(h)
+        meta = {"tz": self._tz(h), "span": period, "checked": time.time()}
+        self._count(bars_downloaded=len(arr))
+        try:
+            self._save(path, arr, meta)
+        except Exception as e:
+            logging.warning("bar store write %s failed: %s", path, e)
+        return arr, meta
+
+    def sweep(self):
+        """Remove files whose sidecar no read has rewritten for max_idle seconds, then the
+        least recently checked ones past max_files. Returns how many were removed. Call it
+        without holding a file lock."""
+        now = time.time(); self._swept = now
+        try:
+            names = [n for n in os.listdir(self.root) if n.endswith(".npy")]
+        except OSError:
+            return 0
+        seen = []
+        for n in names:
+            p = os.path.join(self.root, n)
+            try:
+                seen.append((os.path.getmtime(p + ".json"), p))
+            except OSError:
+                seen.append((0.0, p))
+        seen.sort()
+        over = max(0, len(seen) - self.max_files)
+        gone = [p for i, (m, p) in enumerate(seen) if i < over or now - m > self.max_idle]
+        for p in gone:
+            with self._lock(p):
+                for f in (p, p + ".json"):
+                    try:
+                        os.unlink(f)
+                    except OSError:
+                        pass
+        return len(gone)
+
+    def _tail(self, sym, interval, arr, meta, path, max_age=None):
+        now = time.time()
+        if now - float(meta.get("checked", 0)) < (self.refresh if max_age is None else max_age):
+            self._count(hits=1, fresh_hits=1)
+            return arr, meta
+        # Re-fetch from the second-to-last stored bar: that bar was complete when stored,
+        # so if it changed, yfinance re-adjusted history (split / dividend) → full reload.
+        k = max(0, len(arr) - 2)
+        start = pd.Timestamp(int(arr["ts"][k]), tz="UTC").tz_convert(meta["tz"])
+        try:
+            t = self.fetch(sym, interval, start=start.date() if interval.endswith(("d", "wk", "mo")) else start.to_pydatetime())
+        except Exception as e:
+            logging.warning("bar store tail %s failed: %s", sym, e)
+            self._count(hits=1, errors=1)
+            return arr, meta
+        self._count(hits=1, tail_fetches=1)
+        if t is None or not len(t):
+            meta = dict(meta, checked=now); self._save_meta(path, meta)
+            return arr, meta
+        tail = self._to_array(t)
+        self._count(bars_downloaded=len(tail))
+        ov = np.searchsorted(tail["ts"], arr["ts"][k])
+        if len(arr) >= 2 and ov < len(tail) and tail["ts"][ov] == arr["ts"][k]:
+            a, b = float(arr["close"][k]), float(tail["close"][ov])
+            if a == a and b == b and abs(a - b) > 1e-6 * max(abs(a), 1.0):
+                full, fmeta = self._full(sym, interval, meta.get("span") or "2y", path)
+                if full is not None:
+                    return full, fmeta
+        keep = np.asarray(arr[arr["ts"] < tail["ts"][0]])
+        arr = np.concatenate([keep, tail])
+        meta = dict(meta, checked=now)
+        try:
+            self._save(path, arr, meta)
+        except Exception as e:
+            logging.warning("bar store write %s failed: %s", path, e)
+        return arr, meta
+
+    def _slice(self, arr, tz, period):
+        """Bars within `period` of the latest stored bar (not of `now`, so a "1d" request
+        before the open still returns the last session, like yfinance). "Nd" periods are N
+        sessions — the last N trading dates in the file — as yfinance counts them."""
+        off = _offset(period)
+        h = self._to_frame(arr, tz)
+        p = (period or "").lower()
+        if len(h) and p.endswith("d") and p[:-1].isdigit():
+            days = h.index.normalize(); sessions = days.unique()
+            if len(sessions) > int(p[:-1]):
+                h = h[days >= sessions[-int(p[:-1])]]
+        elif len(h) and off is not None:
+            last = h.index[-1].normalize()
+            h = h[h.index >= (last.replace(month=1, day=1) if off == "ytd" else last - off)]
+        self._count(bars_served=len(h))
+        return h
+
+    def stats(self):
+        with self._guard:
+            c = dict(self.counters)
+        # bytes the served bars would have cost to download again (one row per bar)
+        c["bytes_saved"] = max(0, c["bars_served"] - c["bars_downloaded"]) * _DTYPE.itemsize
+        lookups = c["hits"] + c["misses"]
+        c["hit_rate"] = round(c["hits"] / lookups, 3) if lookups else None
+        try:
+            files = [f for f in os.listdir(self.root) if f.endswith(".npy")]
+            c["files"] = len(files)
+            c["disk_bytes"] = sum(os.path.getsize(os.path.join(self.root, f)) for f in files)
+        except Exception:
+            pass
+        return c
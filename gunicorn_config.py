@@ -1,3 +1,9 @@
+import os
+
+
 def post_fork(server, worker):
+    # With BACKGROUND_JOBS=runner the live scanner runs in the job runner (jobs.py) instead.
+    if os.environ.get("BACKGROUND_JOBS", "web").lower() == "runner":
+        return
     from app import start_background_scanner
     start_background_scanner()
@@ -0,0 +1,367 @@
+# indicators.py – Vectorized indicator kernel for the V3K scan / ML / backtest paths
+#
+# Every function works on float64 NumPy arrays along the LAST axis, so the same call
+# handles one symbol (shape (n_bars,)) or a whole aligned block (shape (n_syms, n_bars)).
+# Bars where an indicator is not yet defined are NaN (the pure-Python helpers in app.py
+# used None); values match those helpers to within float rounding (< 1e-9).
+#
+# Live is the incremental form of compute() + score() for one symbol: fold in one bar at a
+# time, or evaluate a still-forming bar from live ticks, in O(1).
+#
+#   python indicators.py      → microbenchmark + parity check vs the per-bar Python helpers
+#                               (indicators, and app._feat_matrix vs app._feat_vec)
+
+import importlib.util
+from collections import deque
+
+import numpy as np
+
+# scipy.signal is ~0.1 s to import, so it's only loaded by the first recursion that needs it.
+SCIPY_AVAILABLE = importlib.util.find_spec("scipy") is not None
+
+
+def _arr(x):
+    return np.asarray(x, dtype=np.float64)
+
+
+def _first_valid(x2):
+    """Index of the first non-NaN value per row (row width if the row is all NaN)."""
+    valid = ~np.isnan(x2)
+    return np.where(valid.any(axis=-1), valid.argmax(axis=-1), x2.shape[-1])
+
+
+def _recur(x2, a, b):
+    """y[t] = a*y[t-1] + b*x[t] along the last axis, seeded with y[0] = x[0]."""
+    if SCIPY_AVAILABLE:
+        from scipy.signal import lfilter
+        return lfilter([b], [1.0, -a], x2[:, 1:], axis=-1, zi=a * x2[:, :1])[0]
+    y = np.empty_like(x2[:, 1:]); prev = x2[:, 0]
+    for t in range(1, x2.shape[-1]):
+        prev = x2[:, t] * b + prev * a; y[:, t - 1] = prev
+    return y
+
+
+def ema(x, n):
+    """EMA with k = 2/(n+1), seeded with the first value (same recursion as app._ema).
+    Leading NaNs are treated as padding; a NaN inside the series propagates."""
+    x = _arr(x); x2 = np.atleast_2d(x); out = np.full(x2.shape, np.nan)
+    k = 2.0 / (n + 1); first = _first_valid(x2)
+    for s in np.unique(first):
+        if s >= x2.shape[-1]:
+            continue
+        rows = first == s; seg = x2[rows, s:]
+        out[rows, s] = seg[:, 0]
+        if seg.shape[-1] > 1:
+            out[rows, s + 1:] = _recur(seg, 1.0 - k, k)
+    return out.reshape(x.shape)
+
+
+def _fill_leading(x, value):
+    x2 = np.atleast_2d(_arr(x)).copy(); first = _first_valid(x2)
+    x2[np.arange(x2.shape[-1]) < first[:, None]] = value
+    return x2.reshape(np.shape(x))
+
+
+def macd(close, fast=12, slow=26, signal=9):
+    """(macd, signal, hist). The signal line runs over macd with its padding zeroed,
+    like the `[0 if x is None else x ...]` list app.py fed to _ema."""
+    m = ema(close, fast) - ema(close, slow)
+    s = ema(_fill_leading(m, 0.0), signal)
+    return m, s, np.nan_to_num(m) - np.nan_to_num(s)
+
+
+def rsi(close, n=14):
+    """Wilder RSI series; NaN for the first n bars. A zero price falls back to its
+    neighbour, exactly like the `(c[i] or c[i-1])` guard in app._rsi_series."""
+    c = np.atleast_2d(_arr(close)); w = c.shape[-1]
+    out = np.full(c.shape, np.nan)
+    if w <= n:
+        return out.reshape(np.shape(close))
+    cur, prv = c[:, 1:], c[:, :-1]
+    d = np.where(cur != 0, cur, prv) - np.where(prv != 0, prv, cur)
+    g = np.maximum(d, 0.0); l = np.maximum(-d, 0.0)
+    g[np.isnan(d)] = np.nan; l[np.isnan(d)] = np.nan
+    ag = np.empty((c.shape[0], w - n)); al = np.empty_like(ag)
+    ag[:, 0] = np.cumsum(g[:, :n], axis=-1)[:, -1] / n
+    al[:, 0] = np.cumsum(l[:, :n], axis=-1)[:, -1] / n
+    if w - n > 1:
+        seed_g = np.concatenate([ag[:, :1], g[:, n:]], axis=-1)
+        seed_l = np.concatenate([al[:, :1], l[:, n:]], axis=-1)
+        ag[:, 1:] = _recur(seed_g, (n - 1) / n, 1.0 / n)
+        al[:, 1:] = _recur(seed_l, (n - 1) / n, 1.0 / n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = 100 - 100 / (1 + ag / al)
+    out[:, n:] = np.where(al == 0, 100.0, r)
+    return out.reshape(np.shape(close))
+
+
+def _windows(x2, n):
+    return np.lib.stride_tricks.sliding_window_view(x2, n, axis=-1)
+
+
+def rolling_sum(x, n):
+    """Sum of the n bars ending at each bar; NaN before the window fills."""
+    x2 = np.atleast_2d(_arr(x)); out = np.full(x2.shape, np.nan)
+    if x2.shape[-1] >= n:
+        out[:, n - 1:] = _windows(x2, n).sum(axis=-1)
+    return out.reshape(np.shape(x))
+
+
+def rolling_max(x, n):
+    x2 = np.atleast_2d(_arr(x)); out = np.full(x2.shape, np.nan)
+    if x2.shape[-1] >= n:
+        out[:, n - 1:] = _windows(x2, n).max(axis=-1)
+    return out.reshape(np.shape(x))
+
+
+def rolling_min(x, n):
+    x2 = np.atleast_2d(_arr(x)); out = np.full(x2.shape, np.nan)
+    if x2.shape[-1] >= n:
+        out[:, n - 1:] = _windows(x2, n).min(axis=-1)
+    return out.reshape(np.shape(x))
+
+
+def sma(x, n):
+    """NaN-skipping mean of the n bars ending at each bar (app._sma_at semantics)."""
+    x2 = np.atleast_2d(_arr(x)); ok = ~np.isnan(x2)
+    s = rolling_sum(np.where(ok, x2, 0.0), n); cnt = rolling_sum(ok.astype(np.float64), n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = np.where(cnt > 0, s / cnt, np.nan)
+    return out.reshape(np.shape(x))
+
+
+def true_range(high, low, close):
+    """TR per bar; NaN on the first bar (it has no previous close)."""
+    hi = np.atleast_2d(_arr(high)); lo = np.atleast_2d(_arr(low)); c = np.atleast_2d(_arr(close))
+    tr = np.full(c.shape, np.nan)
+    pc = c[:, :-1]; h1 = hi[:, 1:]; l1 = lo[:, 1:]
+    tr[:, 1:] = np.maximum(np.maximum(h1 - l1, np.abs(h1 - pc)), np.abs(l1 - pc))
+    return tr.reshape(np.shape(close))
+
+
+def atr(high, low, close, n=14):
+    """Simple-mean ATR over the last n true ranges (app._atr_at); NaN for bar < n."""
+    tr = np.atleast_2d(true_range(high, low, close))
+    out = np.full(tr.shape, np.nan)
+    if tr.shape[-1] > n:
+        out[:, n:] = _windows(tr[:, 1:], n).sum(axis=-1) / n
+    return out.reshape(np.shape(close))
+
+
+def compute(close, high, low, volume=None):
+    """Every indicator the scan / ML / backtest paths read, for a whole OHLCV block."""
+    close = _arr(close)
+    m, s, h = macd(close)
+    out = {"ema20": ema(close, 20), "ema50": ema(close, 50), "ema200": ema(close, 200),
+           "macd": m, "macd_sig": s, "macd_hist": h,
+           "rsi": rsi(close), "atr": atr(high, low, close)}
+    if volume is not None:
+        out["vol_sma20"] = sma(volume, 20)
+    return out
+
+
+def prior_high(high, n=20):
+    """max(high[i-n:i]) — the n bars BEFORE each bar (breakout reference); falls back
+    to the bar's own high while fewer than n bars exist, like app._signal_tf."""
+    hi = _arr(high); out = hi.copy()
+    rm = rolling_max(hi, n)
+    out[..., n:] = rm[..., n - 1:-1]
+    return out
+
+
+def truthy(x):
+    """Python truthiness of an indicator slot: None (NaN here) and 0.0 are both false."""
+    return ~np.isnan(x) & (x != 0)
+
+
+def score(close, high, ind):
+    """Composite conviction score (-6..+6) per bar — the rule app._signal_tf applies
+    to the last bar, evaluated for every bar at once. `ind` is compute()'s output."""
+    c = _arr(close)
+    e20, e50, e200 = ind["ema20"], ind["ema50"], ind["ema200"]
+    r = ind["rsi"]
+
+    def _vote(ok, up):
+        return np.where(ok, np.where(up, 1, -1), 0)
+    with np.errstate(invalid="ignore"):
+        s = (_vote(truthy(e20) & truthy(e50), e20 > e50)
+             + _vote(truthy(e50) & truthy(e200), e50 > e200)
+             + _vote(truthy(e20), c > e20)
+             + np.where(ind["macd_hist"] > 0, 1, -1)
+             + np.where(np.isnan(r), 0, np.where((r > 52) & (r < 78), 1, np.where((r > 22) & (r < 48), -1, 0)))
+             + np.where(c >= prior_high(high), 1, -1))
+    return s
+
+
+def to_list(a):
+    """Array → list with None where NaN, for code that still walks bars in Python."""
+    return [None if v != v else v for v in np.asarray(a, dtype=np.float64).tolist()]
+
+
+class Live:
+    """Incremental compute() + score() for one symbol. update() folds in a closed bar;
+    peek() evaluates a still-forming bar (today's, as ticks arrive) without committing it.
+    Both cost the same handful of float ops whatever the history length, and give the batch
+    kernel's values for the same bars (< 1e-9). Inputs are assumed finite except volume."""
+
+    EMAS = (("ema20", 20), ("ema50", 50), ("ema200", 200), ("ema12", 12), ("ema26", 26))
+    N_RSI = N_ATR = 14
+    N_HI = N_VOL = 20
+
+    def __init__(self):
+        self.n = 0                                   # bars committed
+        self.ema = {}; self.sig = 0.0; self.prev_close = None
+        self.ag = self.al = 0.0                      # RSI gain / loss (sums until bar N_RSI)
+        self.trs = deque(maxlen=self.N_ATR); self.vols = deque(maxlen=self.N_VOL)
+        self.highs = deque(maxlen=self.N_HI)
+
+    @classmethod
+    def from_arrays(cls, close, high, low, volume=None):
+        st = cls()
+        vol = [np.nan] * len(close) if volume is None else list(volume)
+        for c, h, l, v in zip(list(close), list(high), list(low), vol):
+            st.update(c, h, l, v)
+        return st
+
+    def _step(self, c, h, l, v):
+        """(values, new scalar state, tr) for bar number self.n closing at c / h / l / v."""
+        i = self.n; c = float(c); h = float(h); l = float(l)
+        v = np.nan if v is None else float(v)
+        em = {k: c if i == 0 else c * (2.0 / (n + 1)) + self.ema[k] * (1 - 2.0 / (n + 1)) for k, n in self.EMAS}
+        m = em["ema12"] - em["ema26"]
+        sig = m if i == 0 else m * 0.2 + self.sig * 0.8
+        ag, al, tr = self.ag, self.al, np.nan
+        if i:
+            p = self.prev_close
+            d = (c if c != 0 else p) - (p if p != 0 else c)
+            g = max(d, 0.0); lo = max(-d, 0.0); n = self.N_RSI
+            if i < n:
+                ag += g; al += lo
+            elif i == n:
+                ag = (ag + g) / n; al = (al + lo) / n
+            else:
+                ag = ag * ((n - 1) / n) + g / n; al = al * ((n - 1) / n) + lo / n
+            tr = max(h - l, abs(h - p), abs(l - p))
+        rsi = np.nan if i < self.N_RSI else (100.0 if al == 0 else 100 - 100 / (1 + ag / al))
+        atr = np.nan
+        if i >= self.N_ATR:
+            atr = (sum(list(self.trs)[1 - self.N_ATR:]) + tr) / self.N_ATR
+        vol_sma = np.nan
+        if i + 1 >= self.N_VOL:
+            w = [x for x in list(self.vols)[1 - self.N_VOL:] + [v] if x == x]
+            vol_sma = sum(w) / len(w) if w else np.nan
+        ph = max(self.highs) if i >= self.N_HI else h
+        out = {"close": c, "ema20": em["ema20"], "ema50": em["ema50"], "ema200": em["ema200"],
+               "macd": m, "macd_sig": sig, "macd_hist": m - sig, "rsi": rsi, "atr": atr,
+               "vol_sma20": vol_sma, "prior_high": ph}
+        out["score"] = self._score(out)
+        return out, (em, sig, ag, al), tr
+
+    @staticmethod
+    def _score(x):
+        """score() for one bar."""
+        def t(a):
+            return a == a and a != 0
+        c, e20, e50, e200, r = x["close"], x["ema20"], x["ema50"], x["ema200"], x["rsi"]
+        s = (1 if e20 > e50 else -1) if t(e20) and t(e50) else 0
+        s += (1 if e50 > e200 else -1) if t(e50) and t(e200) else 0
+        s += (1 if c > e20 else -1) if t(e20) else 0
+        s += 1 if x["macd_hist"] > 0 else -1
+        if r == r:
+            s += 1 if 52 < r < 78 else (-1 if 22 < r < 48 else 0)
+        s += 1 if c >= x["prior_high"] else -1
+        return s
+
+    def update(self, close, high, low, volume=None):
+        """Commit a closed bar; returns its indicator values."""
+        out, (self.ema, self.sig, self.ag, self.al), tr = self._step(close, high, low, volume)
+        if self.n:
+            self.trs.append(tr)
+        self.vols.append(np.nan if volume is None else float(volume))
+        self.highs.append(float(high)); self.prev_close = out["close"]; self.n += 1
+        return out
+
+    def peek(self, close, high, low, volume=None):
+        """Values as if a bar closed now at these prices — the state is left unchanged."""
+        return self._step(close, high, low, volume)[0]
+
+
+if __name__ == "__main__":
+    # Microbenchmark: 2y of daily bars × 90 symbols, per-bar Python helpers vs this kernel.
+    # app is imported only for its reference helpers: SUBSYSTEMS=none keeps it from starting
+    # the scan loop, model thread or any other background / network work.
+    import os
+    import time
+    os.environ.setdefault("SUBSYSTEMS", "none")
+    import app
+
+    def best(fn, repeat=5):
+        """fn() after one warm-up call (scipy / first-call setup), best of `repeat` runs."""
+        out = fn(); ts = []
+        for _ in range(repeat):
+            t0 = time.perf_counter(); out = fn(); ts.append(time.perf_counter() - t0)
+        return out, min(ts)
+
+    rng = np.random.default_rng(7)
+    n_syms, n_bars = 90, 504
+    c = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, (n_syms, n_bars)), axis=-1))
+    hi = c * (1 + rng.uniform(0, 0.02, c.shape)); lo = c * (1 - rng.uniform(0, 0.02, c.shape))
+    vol = rng.integers(10_000, 5_000_000, c.shape).astype(np.float64)
+
+    t0 = time.perf_counter()
+    ref = []
+    for j in range(n_syms):
+        cl, hl, ll, vl = c[j].tolist(), hi[j].tolist(), lo[j].tolist(), vol[j].tolist()
+        e12, e26 = app._ema(cl, 12), app._ema(cl, 26)
+        mc = [a - b for a, b in zip(e12, e26)]
+        ref.append({"ema20": app._ema(cl, 20), "ema50": app._ema(cl, 50), "ema200": app._ema(cl, 200),
+                    "macd": mc, "macd_sig": app._ema(mc, 9), "rsi": app._rsi_series(cl),
+                    "atr": [app._atr_at(hl, ll, cl, i) for i in range(n_bars)],
+                    "vol_sma20": [app._sma_at(vl, 20, i) for i in range(n_bars)]})
+    t_py = time.perf_counter() - t0
+
+    got, t_np = best(lambda: compute(c, hi, lo, vol))
+
+    err = 0.0
+    for j in range(n_syms):
+        for k, v in ref[j].items():
+            a = np.array([np.nan if x is None else x for x in v])
+            err = max(err, float(np.nanmax(np.abs(a - got[k][j]))))
+            assert np.array_equal(np.isnan(a), np.isnan(got[k][j])), k
+    print("python helpers : %8.1f ms" % (t_py * 1e3))
+    print("numpy kernel   : %8.1f ms   (%.0fx faster)" % (t_np * 1e3, t_py / t_np))
+    print("max |diff|     : %.2e" % err)
+
+    # Feature matrix: one vectorized pass vs _feat_vec per bar (what _signal_samples used to do).
+    L = to_list; t_vec = t_mat = 0.0; ferr = 0.0
+    for j in range(10):
+        ind = {k: v[j] for k, v in got.items()}
+        dr = np.where(score(c[j], hi[j], ind) > 0, 1, -1); ic = (c[(j + 1) % n_syms] * 3).tolist()
+        F, t = best(lambda: app._feat_matrix(c[j], hi[j], lo[j], vol[j], ind, dr, ic)); t_mat += t
+        args = (c[j].tolist(), hi[j].tolist(), lo[j].tolist(), vol[j].tolist(), L(ind["ema20"]), L(ind["ema50"]),
+                L(ind["ema200"]), L(ind["macd"]), L(ind["macd_sig"]), L(ind["rsi"]))
+        t0 = time.perf_counter()
+        ref = [app._feat_vec(*args, i, int(dr[i]), ic) for i in range(n_bars)]
+        t_vec += time.perf_counter() - t0
+        ferr = max(ferr, float(np.max(np.abs(np.array(ref) - F))))
+    print("_feat_vec x bar: %8.1f ms   (10 symbols)" % (t_vec * 1e3))
+    print("_feat_matrix   : %8.1f ms   (%.0fx faster)" % (t_mat * 1e3, t_vec / t_mat))
+    print("max |diff|     : %.2e" % ferr)
+
+    # Live: bar-at-a-time state vs the batch kernel on the same bars.
+    lerr = 0.0; nup = 0
+    for j in range(10):
+        st = Live(); ref_s = score(c[j], hi[j], {k: v[j] for k, v in got.items()})
+        for i in range(n_bars):
+            o = st.update(c[j, i], hi[j, i], lo[j, i], vol[j, i]); nup += 1
+            for k in ("ema20", "ema50", "ema200", "macd", "macd_sig", "rsi", "atr", "vol_sma20"):
+                a, b = o[k], got[k][j, i]
+                assert (a != a) == (b != b), (k, i)
+                if a == a:
+                    lerr = max(lerr, abs(a - b))
+            assert o["score"] == ref_s[i], i
+    t0 = time.perf_counter()
+    for i in range(10000):
+        st.peek(c[9, -1] * (1 + i * 1e-6), hi[9, -1], lo[9, -1], vol[9, -1])
+    print("Live.peek      : %8.1f us / tick" % ((time.perf_counter() - t0) / 10000 * 1e6))
+    print("max |diff|     : %.2e   (Live vs kernel, %d bars)" % (lerr, nup))
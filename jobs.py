@@ -0,0 +1,242 @@
+# jobs.py – Supervised background job runner, one process beside the gunicorn web workers
+#
+# Everything that used to run on threads inside every web worker is a Job here: the V3K
+# scan, the weekly model retrain and journal review, the live dashboard scanner, risk
+# monitoring, smart-alert delivery and (opt-in) tick streaming. A Job is a function with
+# its own interval, run on its own thread so a slow retrain never holds up alert delivery.
+# Jobs marked `local` work on state that lives in the web worker (its risk manager's
+# positions, its smart-alert queue, its tick streamer), so they run there, on a Runner of
+# their own (local_runner(), started by app.py as the "web_jobs" subsystem), never here.
+# A failing job retries with exponential backoff instead of waiting its normal interval.
+# Each job keeps its recent runs (duration, result, error); the runner publishes them with
+# every heartbeat to the KV store ("v3k_jobs_status" → GET /jobs/status on the web side)
+# and restarts any job thread that dies.
+#
+#   python jobs.py                 → run the enabled jobs until SIGTERM / Ctrl-C
+#   python jobs.py --list          → the registry
+#   python jobs.py --once scan     → run one job now, print its result and exit
+#
+# JOBS=scan,retrain,...  picks this process's jobs (default: every non-local one) and
+# WEB_JOBS the web worker's (default: risk_monitor,alert_delivery; add "streaming" to keep
+# a tick stream connected); JOB_<NAME>_EVERY=<s> overrides one job's interval. Run the web
+# service with BACKGROUND_JOBS=runner so its workers leave the rest to this process.
+
+import argparse
+import json
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from collections import deque
+
+def _brief(result):
+    """Scalars of a job's result, for the run history (lists / nested dicts → their size)."""
+    if not isinstance(result, dict):
+        return result if isinstance(result, (int, float, str, bool, type(None))) else str(result)[:200]
+    return {k: (v if isinstance(v, (int, float, str, bool, type(None))) else len(v) if hasattr(v, "__len__") else str(v))
+            for k, v in list(result.items())[:20]}
+
+
+class Job:
+    def __init__(self, name, fn, every, retry=30, max_backoff=1800, doc="", local=False):
+        self.name = name
+        self.fn = fn
+        self.every = every                # seconds, or a callable returning seconds
+        self.retry = retry                # first backoff after a failure; doubles per failure
+        self.max_backoff = max_backoff
+        self.doc = doc
+        self.local = local                # runs in the web worker that owns its state
+        self.history = deque(maxlen=20)
+        self.runs = self.failures = self.consecutive_failures = 0
+        self.running = False
+        self.next_at = None
+
+    def interval(self):
+        return float(self.every() if callable(self.every) else self.every)
+
+    def delay(self):
+        """Seconds until the next run: the interval, or the backoff after a failure."""
+        if not self.consecutive_failures:
+            return self.interval()
+        return min(self.max_backoff, self.retry * 2 ** (self.consecutive_failures - 1))
+
+    def run(self):
+        """Run once; never raises. Returns (ok, result)."""
+        at = time.time(); t0 = time.perf_counter(); self.running = True
+        ok, result, err = True, None, None
+        try:
+            result = self.fn()
+        except Exception as e:
+            ok, err = False, "%s: %s" % (type(e).__name__, e)
+            logging.warning("job %s failed: %s", self.name, err)
+        finally:
+            self.running = False
+        self.runs += 1
+        if ok:
+            self.consecutive_failures = 0
+        else:
+            self.failures += 1; self.consecutive_failures += 1
+        self.history.append({"at": at, "ms": round((time.perf_counter() - t0) * 1000, 1), "ok": ok,
+                             "error": err, "result": _brief(result)})
+        return ok, result
+
+    def status(self):
+        return {"doc": self.doc, "local": self.local, "interval_s": self.interval(), "runs": self.runs, "failures": self.failures,
+                "consecutive_failures": self.consecutive_failures, "running": self.running,
+                "next_at": self.next_at, "history": list(self.history)}
+
+
+class Runner:
+    def __init__(self, jobs, publish=None, heartbeat=30):
+        self.jobs = {j.name: j for j in jobs}
+        self.publish = publish            # callable(status dict), e.g. a KV write
+        self.heartbeat = heartbeat
+        self.started = time.time()
+        self._threads = {}
+        self._stop = threading.Event()
+
+    def _loop(self, job):
+        while not self._stop.is_set():
+            job.run()
+            d = job.delay(); job.next_at = time.time() + d
+            if self._stop.wait(d):
+                break
+
+    def _spawn(self, job):
+        t = threading.Thread(target=self._loop, args=(job,), name="job-" + job.name, daemon=True)
+        t.start(); self._threads[job.name] = t
+
+    def status(self):
+        return {"at": time.time(), "host": socket.gethostname(), "pid": os.getpid(), "started": self.started,
+                "jobs": {n: j.status() for n, j in self.jobs.items()}}
+
+    def _publish(self):
+        if self.publish is None:
+            return
+        try:
+            self.publish(self.status())
+        except Exception as e:
+            logging.warning("job status publish failed: %s", e)
+
+    def run_forever(self):
+        """Start every job and supervise: restart dead job threads, publish the heartbeat."""
+        for job in self.jobs.values():
+            self._spawn(job)
+        while not self._stop.is_set():
+            for name, t in list(self._threads.items()):
+                if not t.is_alive() and not self._stop.is_set():
+                    logging.warning("job thread %s died; restarting", name)
+                    self._spawn(self.jobs[name])
+            self._publish()
+            self._stop.wait(self.heartbeat)
+        self._publish()
+
+    def stop(self, *_):
+        self._stop.set()
+
+
+def registry(app):
+    """Every job the runner knows, bound to the loaded app module."""
+
+    def retrain():
+        # Web workers in runner mode never train, so the first model comes from here too.
+        if not app._MODEL.get("ready") and not app._model_refresh():
+            m = app._train_model()              # a failed train returns its error, it doesn't raise
+            if not m.get("ready"):
+                raise RuntimeError("bootstrap train failed: %s" % m.get("error", "no model"))
+            app._kv_set("v3k_last_retrain", time.time())
+            return {"trained": "bootstrap"}
+        return {"trained": "weekly" if app._maybe_weekly_retrain(wait=True) else None}
+
+    def live_scan():
+        r = app._legacy_scan_once()
+        if r.get("status") == "error":
+            raise RuntimeError("live scan failed (see log)")
+        return r
+
+    def risk_monitor():
+        if not app._SUBS.ready("risk"):       # nothing built it, so there are no positions
+            return {"positions": 0}
+        return app.risk_check_once()
+
+    def alert_delivery():
+        if not app._SUBS.ready("alerts"):
+            return {"queued": 0, "left": 0}
+        q = len(app.smart_alerts.delivery_queue)
+        if q:
+            app.smart_alerts.process_delivery_queue()
+        return {"queued": q, "left": len(app.smart_alerts.delivery_queue)}
+
+    def streaming():
+        s = app.real_time_streamer
+        if not s.streaming:
+            syms = [x.strip().upper() for x in os.environ.get("STREAM_SYMBOLS", "").split(",") if x.strip()]
+            syms = [x if ("." in x or x.startswith("^")) else x + ".NS" for x in syms] or app._WATCH_IN[:10]
+            if not app._stream_start(syms):
+                raise RuntimeError("no tick source (Kite token or TICK_SOURCE=replay:...)")
+        return {"streaming": s.streaming, "symbols": len(s.streaming_symbols), **(s.source.stats() if s.source else {})}
+
+    return [
+        Job("scan", lambda: app._scan_once("jobs"), 900, doc="V3K swing / intraday scan → trades, alerts, /signals"),
+        Job("retrain", retrain, 3600, retry=300, doc="startup model if none, then the weekly retrain"),
+        Job("weekly_review", lambda: {"sent": app._maybe_weekly_review(wait=True)}, 3600, doc="weekly journal review → Telegram"),
+        Job("live_scan", live_scan, lambda: 30 if app.is_market_open() else 120, doc="dashboard scanner (/get-signals)"),
+        Job("risk_monitor", risk_monitor, 30, doc="mark positions, warn on risk utilization", local=True),
+        Job("alert_delivery", alert_delivery, 5, retry=10, max_backoff=300, doc="smart-alert delivery queue", local=True),
+        Job("streaming", streaming, 60, doc="keep the tick stream connected (opt-in)", local=True),
+    ]
+
+
+def _select(jobs, spec, local=False):
+    names = [n.strip() for n in (spec or "").split(",") if n.strip()]
+    picked = [j for j in jobs if j.local == local and (j.name in names if names else j.name != "streaming")]
+    for j in picked:
+        env = os.environ.get("JOB_%s_EVERY" % j.name.upper())
+        if env:
+            j.every = float(env)
+    return picked
+
+
+def local_runner(app):
+    """The web worker's Runner: the WEB_JOBS subset of the local jobs, without a KV heartbeat
+    (each worker has its own)."""
+    return Runner(_select(registry(app), os.environ.get("WEB_JOBS", "risk_monitor,alert_delivery"), local=True))
+
+
+def main():
+    # Before `import app`: no web-process threads in here, and the scan leaves the weekly
+    # retrain / review to their own jobs.
+    os.environ.setdefault("BACKGROUND_JOBS", "runner")
+    os.environ.setdefault("SUBSYSTEMS", "none")
+    ap = argparse.ArgumentParser(description="V3K background job runner")
+    ap.add_argument("--list", action="store_true", help="list the jobs and exit")
+    ap.add_argument("--once", metavar="JOB", help="run one job now and exit")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    import app
+    jobs = registry(app)
+    if args.list:
+        for j in jobs:
+            print("%-15s %-8s %-6s %s" % (j.name, "dynamic" if callable(j.every) else "%ds" % j.every,
+                                          "web" if j.local else "runner", j.doc))
+        return
+    if args.once:
+        job = {j.name: j for j in jobs}.get(args.once)
+        if job is None:
+            raise SystemExit("unknown job %r" % args.once)
+        ok, result = job.run()
+        print(json.dumps(job.history[-1], indent=2, default=str))
+        raise SystemExit(0 if ok else 1)
+
+    runner = Runner(_select(jobs, os.environ.get("JOBS")), publish=lambda st: app._kv_set("v3k_jobs_status", st))
+    signal.signal(signal.SIGTERM, runner.stop); signal.signal(signal.SIGINT, runner.stop)
+    logging.info("job runner: %s", ", ".join(runner.jobs))
+    runner.run_forever()
+    app._KV.flush()
+
+
+if __name__ == "__main__":
+    main()
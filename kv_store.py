@@ -0,0 +1,752 @@
+# kv_store.py – Cached, write-behind key/value layer behind app._kv_get / _kv_set
+#
+# Reads go through an in-process TTL cache; writes land in that cache immediately (so the
+# writing process reads its own writes) and are flushed to the backend in coalesced
+# batches by one background thread — one MSET-style round trip for everything written in
+# the last `flush_interval` seconds. Values are cached serialized, so callers that mutate
+# what they read can never corrupt the cache.
+#
+# Append-only lists (append / iter_list) ride the same flusher: Upstash RPUSH + LTRIM, an
+# flock'd JSON-lines segment file with amortized compaction for local storage, and a
+# read-modify-write of a JSON array for stores with no list commands (kvdb.io).
+#
+# Leases (Lease) give one holder at a time per name across workers, with a fencing token
+# that grows on every acquisition: Upstash via Lua scripts, otherwise an flock'd lease file
+# (which covers every worker on one machine). Writes made under a lease (set_fenced /
+# append_fenced) are synchronous and the backend compares the token with the write in one
+# atomic step — the same Lua call, or under the lease file's lock — so a holder deposed by
+# a newer acquisition has its writes rejected however long it stalled.
+#
+# Read-modify-write of a shared value (update) skips the cache and write-behind: it reads
+# the backend and writes back with a compare-and-set, re-running the caller's function
+# whenever another writer got in between — optionally fenced by a lease as well.
+#
+# Backends: Upstash Redis REST (pipelined MGET / MSET), kvdb.io, local JSON files, and an
+# in-memory fake for tests.
+
+import atexit
+import fcntl
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+
+import requests
+
+
+class _FileLeases:
+    """Lease records in <root>/<name>.lease, read-modify-written under an exclusive flock."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _update(self, name, fn):
+        with open(os.path.join(self.root, name + ".lease"), "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            try:
+                rec = json.loads(f.read() or "{}")
+            except Exception:
+                rec = {}
+            out, new = fn(rec, time.time())
+            if new is not None:
+                f.seek(0); f.truncate(); f.write(json.dumps(new)); f.flush()
+            return out
+
+    def acquire(self, name, owner, ttl):
+        def fn(rec, now):
+            if rec.get("owner") and rec.get("expires", 0) > now:
+                return None, None
+            fence = int(rec.get("fence", 0)) + 1
+            return fence, {"owner": owner, "fence": fence, "expires": now + ttl}
+        return self._update(name, fn)
+
+    def renew(self, name, owner, fence, ttl):
+        def fn(rec, now):
+            if rec.get("owner") != owner or rec.get("fence") != fence or rec.get("expires", 0) <= now:
+                return False, None
+            return True, dict(rec, expires=now + ttl)
+        return self._update(name, fn)
+
+    def release(self, name, owner, fence):
+        def fn(rec, now):
+            if rec.get("owner") != owner or rec.get("fence") != fence:
+                return False, None
+            return True, {"owner": None, "fence": fence, "expires": 0}
+        return self._update(name, fn)
+
+    def fenced(self, name, fence, write):
+        """Run write() while holding the lease file's lock, only if `fence` is still the
+        newest token for `name`. True if it ran."""
+        def fn(rec, now):
+            if int(rec.get("fence", 0)) != fence:
+                return False, None
+            write()
+            return True, None
+        return self._update(name, fn)
+
+    def state(self, name):
+        def fn(rec, now):
+            live = bool(rec.get("owner")) and rec.get("expires", 0) > now
+            return {"holder": rec.get("owner") if live else None, "fence": rec.get("fence", 0),
+                    "expires_in": round(rec["expires"] - now, 1) if live else None}, None
+        return self._update(name, fn)
+
+
+class KVBackend:
+    """Storage interface: raw (JSON string) values in, raw values out."""
+    name = "base"
+    _leases = _FileLeases(tempfile.gettempdir())
+
+    # Leases. The default is a lease file in the temp dir: exclusive across every worker on
+    # this machine, not across machines — backends with atomic server-side ops override it.
+    def lease_acquire(self, name, owner, ttl):
+        """Fencing token (int, grows per acquisition) if `owner` now holds `name`, else None."""
+        return self._leases.acquire(name, owner, ttl)
+
+    def lease_renew(self, name, owner, fence, ttl):
+        return self._leases.renew(name, owner, fence, ttl)
+
+    def lease_release(self, name, owner, fence):
+        return self._leases.release(name, owner, fence)
+
+    def lease_state(self, name):
+        return self._leases.state(name)
+
+    def set_many_fenced(self, items, name, fence):
+        """set_many only if `fence` is still the newest token for lease `name`, checked
+        atomically with the write. False (nothing written) once a newer holder exists."""
+        return self._leases.fenced(name, fence, lambda: self.set_many(items))
+
+    def list_append_fenced(self, key, raws, cap, name, fence):
+        return self._leases.fenced(name, fence, lambda: self.list_append(key, raws, cap))
+
+    def compare_and_set(self, key, expect, raw, name=None, fence=None):
+        """Set `key` to `raw` only if it still holds `expect` (None: absent) and, given a lease
+        `name`, only while `fence` is its newest token. True if written, False if the value
+        changed underneath (re-read and retry), None if fenced out. The default serializes
+        compare-and-set callers with a per-key lock file, so it is atomic on this machine."""
+        def cas():
+            with open(os.path.join(self._leases.root, key + ".cas"), "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                if self.get_many([key]).get(key) != expect:
+                    return False
+                self.set_many({key: raw})
+                return True
+        if name is None:
+            return cas()
+        out = []
+        return out[0] if self._leases.fenced(name, fence, lambda: out.append(cas())) else None
+
+    def get_many(self, keys):
+        """{key: raw or None} for every key."""
+        raise NotImplementedError
+
+    def set_many(self, items):
+        """Persist {key: raw}. Raise on failure so the batch is retried."""
+        raise NotImplementedError
+
+    def delete_many(self, keys):
+        """Remove keys (absent ones are fine). Raise on failure."""
+        raise NotImplementedError
+
+    # Lists. The defaults keep the list as one JSON-array value — correct within a process
+    # (one flusher), but racy across processes; backends with real list ops override them.
+    def _blob(self, key):
+        raw = self.get_many([key]).get(key)
+        try:
+            v = json.loads(raw) if raw else []
+            return v if isinstance(v, list) else []
+        except Exception:
+            return []
+
+    def list_append(self, key, raws, cap):
+        """Append raw items and keep only the newest `cap`."""
+        items = self._blob(key) + [json.loads(r) for r in raws]
+        self.set_many({key: json.dumps(items[-cap:])})
+
+    def list_len(self, key):
+        return len(self._blob(key))
+
+    def list_iter(self, key, n):
+        """Yield the newest `n` raw items, oldest first."""
+        items = self._blob(key)
+        for v in (items[-n:] if n > 0 else []):
+            yield json.dumps(v)
+
+
+class UpstashBackend(KVBackend):
+    name = "upstash"
+
+    def __init__(self, url, token, timeout=12):
+        self.url = url.rstrip("/"); self.timeout = timeout
+        self.headers = {"Authorization": "Bearer %s" % token}
+
+    def _pipeline(self, cmds):
+        r = requests.post(self.url + "/pipeline", json=cmds, headers=self.headers, timeout=self.timeout)
+        r.raise_for_status()
+        return r.json()
+
+    def get_many(self, keys):
+        res = self._pipeline([["MGET"] + list(keys)])[0].get("result") or [None] * len(keys)
+        return dict(zip(keys, res))
+
+    def set_many(self, items):
+        cmd = ["MSET"]
+        for k, v in items.items():
+            cmd += [k, v]
+        out = self._pipeline([cmd])[0]
+        if out.get("error"):
+            raise RuntimeError(out["error"])
+
+    def delete_many(self, keys):
+        out = self._pipeline([["DEL"] + list(keys)])[0]
+        if out.get("error"):
+            raise RuntimeError(out["error"])
+
+    def list_append(self, key, raws, cap):
+        out = self._pipeline([["RPUSH", key] + list(raws), ["LTRIM", key, str(-cap), "-1"]])
+        for o in out:
+            if o.get("error"):
+                raise RuntimeError(o["error"])
+
+    def list_len(self, key):
+        return int(self._pipeline([["LLEN", key]])[0].get("result") or 0)
+
+    _ACQUIRE = ("if redis.call('EXISTS', KEYS[1]) == 1 then return 0 end "
+                "local f = redis.call('INCR', KEYS[2]) "
+                "redis.call('SET', KEYS[1], ARGV[1] .. '|' .. f, 'PX', ARGV[2]) return f")
+    _RENEW = ("if redis.call('GET', KEYS[1]) == ARGV[1] then "
+              "return redis.call('PEXPIRE', KEYS[1], ARGV[2]) end return 0")
+    _RELEASE = "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end return 0"
+    _FENCED_SET = ("if redis.call('GET', KEYS[1]) ~= ARGV[1] then return 0 end "
+                   "for i = 2, #KEYS do redis.call('SET', KEYS[i], ARGV[i]) end return 1")
+    _FENCED_APPEND = ("if redis.call('GET', KEYS[1]) ~= ARGV[1] then return 0 end "
+                      "redis.call('RPUSH', KEYS[2], unpack(ARGV, 3)) "
+                      "redis.call('LTRIM', KEYS[2], -tonumber(ARGV[2]), -1) return 1")
+    _CAS = ("if ARGV[3] ~= '' and redis.call('GET', KEYS[2]) ~= ARGV[3] then return 2 end "
+            "if (redis.call('GET', KEYS[1]) or '') ~= ARGV[1] then return 0 end "
+            "redis.call('SET', KEYS[1], ARGV[2]) return 1")
+
+    def _eval(self, script, keys, args):
+        out = self._pipeline([["EVAL", script, str(len(keys))] + list(keys) + [str(a) for a in args]])[0]
+        if out.get("error"):
+            raise RuntimeError(out["error"])
+        return out.get("result")
+
+    def lease_acquire(self, name, owner, ttl):
+        f = int(self._eval(self._ACQUIRE, [name, name + ":fence"], [owner, int(ttl * 1000)]) or 0)
+        return f or None
+
+    def lease_renew(self, name, owner, fence, ttl):
+        return bool(self._eval(self._RENEW, [name], ["%s|%d" % (owner, fence), int(ttl * 1000)]))
+
+    def lease_release(self, name, owner, fence):
+        return bool(self._eval(self._RELEASE, [name], ["%s|%d" % (owner, fence)]))
+
+    def set_many_fenced(self, items, name, fence):
+        keys = list(items)
+        return bool(self._eval(self._FENCED_SET, [name + ":fence"] + keys, [fence] + [items[k] for k in keys]))
+
+    def list_append_fenced(self, key, raws, cap, name, fence):
+        return bool(self._eval(self._FENCED_APPEND, [name + ":fence", key], [fence, cap] + list(raws)))
+
+    def compare_and_set(self, key, expect, raw, name=None, fence=None):
+        r = int(self._eval(self._CAS, [key, (name or key) + ":fence"], [expect or "", raw, fence or ""]) or 0)
+        return None if r == 2 else bool(r)
+
+    def lease_state(self, name):
+        cur, pttl, fence = [o.get("result") for o in self._pipeline(
+            [["GET", name], ["PTTL", name], ["GET", name + ":fence"]])]
+        return {"holder": cur.rsplit("|", 1)[0] if cur else None, "fence": int(fence or 0),
+                "expires_in": round(int(pttl) / 1000.0, 1) if cur and int(pttl) > 0 else None}
+
+    def list_iter(self, key, n, chunk=500):
+        start = max(0, self.list_len(key) - n) if n > 0 else None
+        while start is not None:
+            page = self._pipeline([["LRANGE", key, str(start), str(start + chunk - 1)]])[0].get("result") or []
+            for raw in page:
+                yield raw
+            start = start + chunk if len(page) == chunk else None
+
+
+class KvdbBackend(KVBackend):
+    name = "kvdb"
+
+    def __init__(self, bucket, timeout=12):
+        self.base = "https://kvdb.io/%s/" % bucket; self.timeout = timeout
+
+    def get_many(self, keys):
+        out = {}
+        for k in keys:
+            r = requests.get(self.base + k, timeout=self.timeout)
+            out[k] = r.text if (r.status_code == 200 and r.text.strip()) else None
+        return out
+
+    def set_many(self, items):
+        for k, v in items.items():
+            requests.put(self.base + k, data=v.encode("utf-8"), timeout=self.timeout).raise_for_status()
+
+    def delete_many(self, keys):
+        for k in keys:
+            r = requests.delete(self.base + k, timeout=self.timeout)
+            if r.status_code != 404:
+                r.raise_for_status()
+
+
+class FileBackend(KVBackend):
+    name = "local(ephemeral)"
+
+    def __init__(self, root):
+        self.root = root
+        self._compact_at = {}       # list key -> segment size that triggers the next compaction
+        self._leases = _FileLeases(root)
+
+    def _path(self, key):
+        return os.path.join(self.root, key + ".json")
+
+    def get_many(self, keys):
+        out = {}
+        for k in keys:
+            try:
+                with open(self._path(k)) as f:
+                    out[k] = f.read()
+            except Exception:
+                out[k] = None
+        return out
+
+    def set_many(self, items):
+        for k, v in items.items():
+            tmp = self._path(k) + ".%d.tmp" % os.getpid()
+            with open(tmp, "w") as f:
+                f.write(v)
+            os.replace(tmp, self._path(k))
+
+    def delete_many(self, keys):
+        for k in keys:
+            try:
+                os.remove(self._path(k))
+            except FileNotFoundError:
+                pass
+
+    # Lists: one JSON object per line in <key>.jsonl, appended under an exclusive flock.
+    # Once the segment doubles in size since the last compaction it is rewritten down to the
+    # newest `cap` lines — O(1) amortized per append.
+    def _lpath(self, key):
+        return os.path.join(self.root, key + ".jsonl")
+
+    def _open_locked(self, path):
+        while True:
+            f = open(path, "a+")
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+                    return f
+            except FileNotFoundError:
+                pass
+            f.close()                       # compacted (replaced) while we waited — reopen
+
+    def list_append(self, key, raws, cap):
+        path = self._lpath(key)
+        with self._open_locked(path) as f:
+            f.write("".join(r + "\n" for r in raws)); f.flush()
+            size = os.fstat(f.fileno()).st_size
+            limit = self._compact_at.setdefault(key, 2 * size)
+            if size > limit:
+                f.seek(0); keep = f.readlines()[-cap:]
+                tmp = path + ".%d.tmp" % os.getpid()
+                with open(tmp, "w") as g:
+                    g.writelines(keep)
+                os.replace(tmp, path)
+                self._compact_at[key] = 2 * max(1, sum(len(x) for x in keep))
+
+    def list_len(self, key):
+        try:
+            with open(self._lpath(key)) as f:
+                return sum(1 for line in f if line.strip())
+        except FileNotFoundError:
+            return 0
+
+    def list_iter(self, key, n):
+        skip = self.list_len(key) - n
+        try:
+            with open(self._lpath(key)) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    if skip > 0:
+                        skip -= 1; continue
+                    yield line.rstrip("\n")
+        except FileNotFoundError:
+            return
+
+
+class MemoryBackend(KVBackend):
+    """In-process fake (tests / local runs): counts round trips like a remote store."""
+    name = "memory"
+
+    def __init__(self):
+        self.data = {}; self.lists = {}; self.reads = 0; self.writes = 0
+        self._leases = _FileLeases(tempfile.mkdtemp(prefix="kvmem"))
+
+    def get_many(self, keys):
+        self.reads += 1
+        return {k: self.data.get(k) for k in keys}
+
+    def set_many(self, items):
+        self.writes += 1
+        self.data.update(items)
+
+    def delete_many(self, keys):
+        self.writes += 1
+        for k in keys:
+            self.data.pop(k, None)
+
+    def list_append(self, key, raws, cap):
+        self.writes += 1
+        self.lists[key] = (self.lists.get(key, []) + list(raws))[-cap:]
+
+    def list_len(self, key):
+        return len(self.lists.get(key, []))
+
+    def list_iter(self, key, n):
+        self.reads += 1
+        for raw in (self.lists.get(key, [])[-n:] if n > 0 else []):
+            yield raw
+
+
+class KVStore:
+    def __init__(self, backend, ttl=30.0, flush_interval=1.0):
+        self.backend = backend
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self._cache = {}            # key -> (fetched_at, raw)
+        self._dirty = {}            # key -> raw, waiting for the next flush
+        self._inflight = {}         # key -> raw, being written by the current flush
+        self._appends = {}          # list key -> ([raw, ...], cap), waiting for the next flush
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()   # a flush() returns only once earlier writes landed
+        self._wake = threading.Event()
+        self._flusher = None
+        self._lat = {"get": deque(maxlen=500), "flush": deque(maxlen=500)}
+        self.counters = {"hits": 0, "misses": 0, "sets": 0, "flushes": 0, "keys_flushed": 0,
+                         "flush_errors": 0, "read_errors": 0,
+                         "appends": 0, "items_appended": 0, "fenced_writes": 0, "fenced_rejects": 0,
+                         "cas_retries": 0, "deletes": 0}
+        atexit.register(self.flush)
+
+    # ── reads ────────────────────────────────────────────────────────────────
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            raw = self._dirty.get(key, self._inflight.get(key))
+            c = self._cache.get(key)
+            if raw is None and c and now - c[0] < self.ttl:
+                raw = c[1]
+            if raw is not None or (c and now - c[0] < self.ttl):
+                self.counters["hits"] += 1
+                return self._decode(raw, default)
+            self.counters["misses"] += 1
+        t0 = time.perf_counter()
+        try:
+            raw = self.backend.get_many([key]).get(key)
+        except Exception as e:
+            logging.warning("kv get %s failed: %s", key, e)
+            with self._lock:
+                self.counters["read_errors"] += 1
+            return default
+        finally:
+            self._lat["get"].append(time.perf_counter() - t0)
+        with self._lock:
+            pending = self._dirty.get(key, self._inflight.get(key))
+            if pending is None:                 # a write raced the read — keep the write
+                self._cache[key] = (time.time(), raw)
+            else:
+                raw = pending
+        return self._decode(raw, default)
+
+    @staticmethod
+    def _decode(raw, default):
+        if raw is None or not str(raw).strip():
+            return default
+        try:
+            return json.loads(raw)
+        except Exception:
+            return default
+
+    # ── writes ───────────────────────────────────────────────────────────────
+    def set(self, key, value):
+        raw = json.dumps(value)
+        with self._lock:
+            self._dirty[key] = raw
+            self._cache[key] = (time.time(), raw)
+            self.counters["sets"] += 1
+        self._ensure_flusher()
+        self._wake.set()
+
+    def delete(self, key):
+        """Remove `key` from the backend now, dropping any unflushed write of it. False (key
+        left as it was) if the backend is unreachable."""
+        with self._flush_lock:              # no flush in flight that could re-create it
+            with self._lock:
+                self._dirty.pop(key, None)
+            try:
+                self.backend.delete_many([key])
+            except Exception as e:
+                logging.warning("kv delete %s failed: %s", key, e)
+                with self._lock:
+                    self._cache.pop(key, None)
+                return False
+            with self._lock:
+                self._cache[key] = (time.time(), None)
+                self.counters["deletes"] += 1
+        return True
+
+    def append(self, key, value, cap):
+        """Queue one item onto the append-only list `key` (trimmed to the newest `cap`)."""
+        raw = json.dumps(value)
+        with self._lock:
+            self._appends.setdefault(key, ([], cap))[0].append(raw)
+            self.counters["appends"] += 1
+        self._ensure_flusher()
+        self._wake.set()
+
+    def set_fenced(self, lease, items):
+        """Write {key: value} now, only while `lease` holds the newest fencing token (the
+        backend checks it atomically with the write). False — nothing written — once the
+        lease is gone or a newer holder exists; raises if the backend is unreachable."""
+        raws = {k: json.dumps(v) for k, v in items.items()}
+        with self._flush_lock:              # no flush in flight that could land after this
+            ok = lease.fence is not None and self.backend.set_many_fenced(raws, lease.name, lease.fence)
+            with self._lock:
+                for k, raw in raws.items():
+                    if ok:
+                        self._dirty.pop(k, None)        # superseded by the fenced write
+                        self._cache[k] = (time.time(), raw)
+                    else:
+                        self._cache.pop(k, None)
+                self.counters["fenced_writes" if ok else "fenced_rejects"] += 1
+        return ok
+
+    def append_fenced(self, lease, key, values, cap):
+        """append() for a batch of values, written now under `lease`'s fencing token."""
+        raws = [json.dumps(v) for v in values]
+        if not raws:
+            return True
+        with self._flush_lock:
+            ok = lease.fence is not None and self.backend.list_append_fenced(key, raws, cap, lease.name, lease.fence)
+            with self._lock:
+                self.counters["fenced_writes" if ok else "fenced_rejects"] += 1
+                if ok:
+                    self.counters["items_appended"] += len(raws)
+        return ok
+
+    def update(self, key, fn, default=None, lease=None):
+        """Read-modify-write `key`: new value = fn(current value), written with a
+        compare-and-set against a fresh backend read (never the cache) and re-run if another
+        writer got in between, so concurrent updaters keep each other's changes. With a
+        `lease` the write is fenced too. Returns the value now stored, or None (nothing
+        written) once the lease is lost; raises if the backend is unreachable."""
+        with self._flush_lock:
+            self._flush()                       # our own write-behind lands first, not after
+            while True:
+                raw = self.backend.get_many([key]).get(key)
+                value = fn(self._decode(raw, default))
+                new = json.dumps(value)
+                if new == raw:
+                    return value
+                if lease is None:
+                    ok = self.backend.compare_and_set(key, raw, new)
+                elif lease.fence is None:
+                    ok = None
+                else:
+                    ok = self.backend.compare_and_set(key, raw, new, lease.name, lease.fence)
+                if ok is not False:
+                    break
+                with self._lock:
+                    self.counters["cas_retries"] += 1
+            with self._lock:
+                if ok:
+                    self._dirty.pop(key, None)
+                    self._cache[key] = (time.time(), new)
+                else:
+                    self._cache.pop(key, None)
+                if lease is not None:
+                    self.counters["fenced_writes" if ok else "fenced_rejects"] += 1
+        return value if ok else None
+
+    def list_len(self, key):
+        with self._lock:
+            pending = len(self._appends.get(key, ([], 0))[0])
+        return self.backend.list_len(key) + pending
+
+    def iter_list(self, key, cap):
+        """Stream the newest `cap` items of list `key`, oldest first, including unflushed appends."""
+        with self._lock:
+            pending = list(self._appends.get(key, ([], 0))[0])[-cap:]
+        for raw in self.backend.list_iter(key, cap - len(pending)):
+            yield json.loads(raw)
+        for raw in pending:
+            yield json.loads(raw)
+
+    def _ensure_flusher(self):
+        if self._flusher is None or not self._flusher.is_alive():
+            with self._lock:
+                if self._flusher is None or not self._flusher.is_alive():
+                    self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                    self._flusher.start()
+
+    def _flush_loop(self):
+        backoff = 0.0
+        while True:
+            self._wake.wait()
+            time.sleep(self.flush_interval + backoff)   # let writes in the window coalesce
+            self._wake.clear()
+            backoff = 0.0 if self.flush() else min(60.0, max(1.0, backoff * 2))
+
+    def flush(self):
+        """Write every pending key (one batch) and list append (one call per list) to the
+        backend. Anything that fails stays pending for the next flush."""
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        with self._lock:
+            batch, self._dirty = self._dirty, {}
+            self._inflight = batch              # still visible to get() until it lands
+            appends, self._appends = self._appends, {}
+        if not batch and not appends:
+            return True
+        t0 = time.perf_counter()
+        ok = True
+        if batch:
+            try:
+                self.backend.set_many(batch)
+                with self._lock:
+                    self._inflight = {}
+                    self.counters["keys_flushed"] += len(batch)
+            except Exception as e:
+                logging.warning("kv flush of %d keys failed: %s", len(batch), e)
+                ok = False
+                with self._lock:
+                    self._inflight = {}
+                    for k, v in batch.items():
+                        self._dirty.setdefault(k, v)   # newer writes win over the failed batch
+        for key, (raws, cap) in appends.items():
+            try:
+                self.backend.list_append(key, raws, cap)
+                with self._lock:
+                    self.counters["items_appended"] += len(raws)
+            except Exception as e:
+                logging.warning("kv append of %d items to %s failed: %s", len(raws), key, e)
+                ok = False
+                with self._lock:
+                    later = self._appends.get(key, ([], cap))[0]
+                    self._appends[key] = (raws + later, cap)   # keep order: failed batch first
+        self._lat["flush"].append(time.perf_counter() - t0)
+        with self._lock:
+            self.counters["flushes" if ok else "flush_errors"] += 1
+        if not ok:
+            self._wake.set()
+        return ok
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(key, None)
+
+    # ── metrics ──────────────────────────────────────────────────────────────
+    def stats(self):
+        with self._lock:
+            c = dict(self.counters); c["pending"] = len(self._dirty) + len(self._inflight); c["cached_keys"] = len(self._cache)
+            c["pending_appends"] = sum(len(v[0]) for v in self._appends.values())
+        lookups = c["hits"] + c["misses"]
+        c["hit_rate"] = round(c["hits"] / lookups, 3) if lookups else None
+        c["coalesced_writes"] = max(0, c["sets"] - c["keys_flushed"] - c["pending"])
+        for op, lat in self._lat.items():
+            v = sorted(lat)
+            c[op + "_latency_ms"] = ({"n": len(v), "avg": round(sum(v) / len(v) * 1000, 1),
+                                      "p95": round(v[int(0.95 * (len(v) - 1))] * 1000, 1),
+                                      "max": round(v[-1] * 1000, 1)} if v else None)
+        c["backend"] = self.backend.name; c["ttl_s"] = self.ttl
+        return c
+
+
+class Lease:
+    """Named lease held by at most one process at a time across every worker sharing the
+    backend. acquire() returns a fencing token; hold() keeps it renewed from a heartbeat
+    thread, and valid() tells the holder whether it may still act — a holder that stalled
+    past the TTL (and may have been superseded) must not publish results. valid() is only a
+    local clock check; writes that must not land from a deposed holder go through
+    KVStore.set_fenced / append_fenced, which the backend checks against the token."""
+
+    def __init__(self, backend, name, ttl=300.0):
+        self.backend = backend; self.name = name; self.ttl = ttl
+        self.owner = "%s:%d:%s" % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self.fence = None
+        self._renewed = 0.0
+        self._local = threading.Lock()       # one holder per process, too
+        self._stop = threading.Event()
+
+    def acquire(self):
+        if not self._local.acquire(blocking=False):
+            return None
+        try:
+            fence = self.backend.lease_acquire(self.name, self.owner, self.ttl)
+        except Exception as e:
+            logging.warning("lease %s acquire failed: %s", self.name, e)
+            fence = None
+        if not fence:
+            self._local.release()
+            return None
+        self.fence = fence; self._renewed = time.time()
+        return fence
+
+    def renew(self):
+        try:
+            ok = self.fence is not None and self.backend.lease_renew(self.name, self.owner, self.fence, self.ttl)
+        except Exception as e:
+            logging.warning("lease %s renew failed: %s", self.name, e)
+            ok = False
+        if ok:
+            self._renewed = time.time()
+        return ok
+
+    def valid(self):
+        return self.fence is not None and time.time() - self._renewed < self.ttl
+
+    def release(self):
+        self._stop.set()
+        if self.fence is None:
+            return
+        try:
+            self.backend.lease_release(self.name, self.owner, self.fence)
+        except Exception as e:
+            logging.warning("lease %s release failed: %s", self.name, e)
+        self.fence = None
+        self._local.release()
+
+    def hold(self):
+        """Renew every ttl/3 until release(); call right after a successful acquire()."""
+        self._stop.clear()
+        def beat():
+            while not self._stop.wait(self.ttl / 3.0):
+                if self.fence is None or not self.renew():
+                    return
+        t = threading.Thread(target=beat, daemon=True); t.start()
+        return t
+
+    def state(self):
+        try:
+            st = self.backend.lease_state(self.name)
+        except Exception as e:
+            st = {"error": str(e)}
+        st["held_here"] = self.fence is not None; st["ttl_s"] = self.ttl
+        return st
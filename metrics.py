@@ -0,0 +1,234 @@
+# metrics.py – In-process metrics with a Prometheus text exposition (GET /metrics)
+#
+# Histograms and counters are recorded in place, on the request / scan / fetch path, so
+# recording has to stay cheap enough to leave on: a labelled child is looked up once per
+# label tuple, an observation is one bisect over the bucket bounds plus two increments
+# under the family's lock (about a microsecond, see `python metrics.py`). Anything that
+# already keeps its own counters (caches, queues, threads) is not double-recorded; a
+# collector callback reads it when /metrics is scraped.
+#
+# instrument_requests() times every HTTP call made through `requests` (requests.get / post
+# and Sessions all end in Session.send) and labels it by dependency from the URL's host,
+# so call sites don't need to change.
+#
+# Values are per process: with several gunicorn workers each one answers for itself.
+#
+#   python metrics.py      → recording overhead + a sample exposition
+
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# seconds: 1 ms … 60 s, enough resolution for both route handlers and slow upstreams
+DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _esc(v):
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join('%s="%s"' % (k, _esc(v)) for k, v in pairs) + "}"
+
+
+def _num(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Family:
+    kind = None
+
+    def __init__(self, name, doc, labels=()):
+        self.name = name
+        self.doc = doc
+        self.label_names = tuple(labels)
+        self._children = {}               # label values tuple -> child state
+        self._lock = threading.Lock()
+
+    def _child(self, values):
+        c = self._children.get(values)
+        if c is None:
+            with self._lock:
+                c = self._children.setdefault(values, self._new())
+        return c
+
+
+class Counter(_Family):
+    kind = "counter"
+
+    def _new(self):
+        return [0]
+
+    def inc(self, *labels, n=1):
+        c = self._child(labels)
+        with self._lock:
+            c[0] += n
+
+    def samples(self):
+        with self._lock:
+            items = [(k, v[0]) for k, v in self._children.items()]
+        for values, v in sorted(items):
+            yield "%s%s %s" % (self.name, _labels(self.label_names, values), _num(v))
+
+
+class Histogram(_Family):
+    kind = "histogram"
+
+    def __init__(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.bounds = tuple(sorted(buckets))
+
+    def _new(self):
+        return [[0] * (len(self.bounds) + 1), 0.0]    # per-bucket counts (last: +Inf), sum
+
+    def observe(self, value, *labels):
+        c = self._child(labels)
+        i = bisect.bisect_left(self.bounds, value)    # le is inclusive
+        with self._lock:
+            c[0][i] += 1; c[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, *labels)
+
+    def wrap(self, fn, *labels):
+        """fn with every call timed under `labels`."""
+        def timed(*a, **kw):
+            t0 = time.perf_counter()
+            try:
+                return fn(*a, **kw)
+            finally:
+                self.observe(time.perf_counter() - t0, *labels)
+        timed.__wrapped__ = fn
+        return timed
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(v[0]), v[1]) for k, v in self._children.items()]
+        for values, counts, total in sorted(items):
+            acc = 0
+            for le, n in zip(self.bounds + (float("inf"),), counts):
+                acc += n
+                yield "%s_bucket%s %d" % (self.name, _labels(self.label_names, values, ("le", _num(le))), acc)
+            yield "%s_sum%s %s" % (self.name, _labels(self.label_names, values), repr(round(total, 6)))
+            yield "%s_count%s %d" % (self.name, _labels(self.label_names, values), acc)
+
+
+class Registry:
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+        self._families = []
+        self._collectors = []
+        self.collector_errors = 0
+
+    def counter(self, name, doc, labels=()):
+        f = Counter(self.prefix + name, doc, labels); self._families.append(f)
+        return f
+
+    def histogram(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        f = Histogram(self.prefix + name, doc, labels, buckets); self._families.append(f)
+        return f
+
+    def collector(self, fn):
+        """Register fn() -> [(name, kind, doc, [(labels dict, value)])], read at scrape time.
+        Usable as a decorator."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        """The whole registry in the Prometheus text format (version 0.0.4)."""
+        out = []
+        for f in self._families:
+            out.append("# HELP %s %s" % (f.name, f.doc)); out.append("# TYPE %s %s" % (f.name, f.kind))
+            out.extend(f.samples())
+        for fn in self._collectors:
+            try:
+                fams = list(fn() or ())
+            except Exception as e:
+                self.collector_errors += 1
+                logging.warning("metrics collector %s failed: %s", getattr(fn, "__name__", fn), e)
+                continue
+            for name, kind, doc, samples in fams:
+                name = self.prefix + name
+                out.append("# HELP %s %s" % (name, doc)); out.append("# TYPE %s %s" % (name, kind))
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    out.append("%s%s %s" % (name, _labels(list(labels), list(labels.values())), _num(value)))
+        return "\n".join(out) + "\n"
+
+
+def instrument_requests(hist, errors, hosts, default="other"):
+    """Time every requests.Session.send into `hist` (label: dependency) and count failures —
+    exceptions and HTTP status >= 400 — into `errors` (labels: dependency, reason).
+    `hosts` is [(host suffix, dependency)]; the first suffix that matches wins."""
+    import requests
+    cache = {}
+
+    def dep_of(url):
+        host = (urlsplit(url).hostname or "").lower()
+        d = cache.get(host)
+        if d is None:
+            d = next((name for suffix, name in hosts if host == suffix or host.endswith("." + suffix)), default)
+            if len(cache) < 1024:
+                cache[host] = d
+        return d
+
+    send = requests.Session.send
+    if getattr(send, "_metrics", False):
+        return
+
+    def timed_send(self, req, **kw):
+        dep = dep_of(req.url or ""); t0 = time.perf_counter()
+        try:
+            r = send(self, req, **kw)
+        except Exception as e:
+            hist.observe(time.perf_counter() - t0, dep); errors.inc(dep, type(e).__name__)
+            raise
+        hist.observe(time.perf_counter() - t0, dep)
+        if r.status_code >= 400:
+            errors.inc(dep, "http_%d" % r.status_code)
+        return r
+
+    timed_send._metrics = True
+    requests.Session.send = timed_send
+
+
+if __name__ == "__main__":
+    reg = Registry("demo_")
+    h = reg.histogram("op_seconds", "Demo op latency.", ("op",))
+    c = reg.counter("ops_total", "Demo ops.", ("op", "status"))
+    n = 200000
+    t0 = time.perf_counter()
+    for i in range(n):
+        pass
+    base = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for i in range(n):
+        h.observe(0.003, "a")
+    print("observe          %6.2f µs" % ((time.perf_counter() - t0 - base) / n * 1e6))
+    t0 = time.perf_counter()
+    for i in range(n):
+        c.inc("a", "200")
+    print("inc              %6.2f µs" % ((time.perf_counter() - t0 - base) / n * 1e6))
+    t0 = time.perf_counter()
+    for i in range(n):
+        with h.time("b"):
+            pass
+    print("with time()      %6.2f µs" % ((time.perf_counter() - t0 - base) / n * 1e6))
+    reg.collector(lambda: [("queue_depth", "gauge", "Demo queue.", [({"queue": "x"}, 3)])])
+    t0 = time.perf_counter(); text = reg.render()
+    print("render           %6.2f ms\n" % ((time.perf_counter() - t0) * 1000))
+    print("\n".join(l for l in text.splitlines() if "_bucket" not in l or 'le="0.005"' in l))
@@ -0,0 +1,121 @@
+# model_eval.py – Walk-forward / purged k-fold evaluation of the win-probability model
+#
+# Works on one pooled sample matrix (features X, labels y, sample day t as an integer day
+# number) as built once by app._build_samples. Folds are contiguous blocks of days; any
+# training sample whose label window (t, t + horizon] reaches into the test block is purged,
+# and an embargo after the test block keeps serially-correlated neighbours out too — the
+# same leakage the per-symbol 80/20 split in _train_model can't rule out across symbols.
+#
+# Each (fold, model) pair is an independent job, so callers can fan them out to a pool.
+
+import time
+
+import numpy as np
+
+MODELS = ("logreg", "hgb", "rf")
+
+
+def make_model(name):
+    """Unfitted estimator by short name. "logreg" is the production configuration."""
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+    if name == "logreg":
+        from sklearn.linear_model import LogisticRegression
+        return make_pipeline(StandardScaler(), LogisticRegression(max_iter=1000, class_weight="balanced"))
+    if name == "hgb":
+        from sklearn.ensemble import HistGradientBoostingClassifier
+        return HistGradientBoostingClassifier(max_iter=100, learning_rate=0.1, max_leaf_nodes=15,
+                                              min_samples_leaf=40, class_weight="balanced", random_state=0)
+    if name == "rf":
+        from sklearn.ensemble import RandomForestClassifier
+        return RandomForestClassifier(n_estimators=100, max_depth=8, min_samples_leaf=20, max_features="sqrt",
+                                      class_weight="balanced_subsample", n_jobs=1, random_state=0)
+    raise ValueError("unknown model %r" % name)
+
+
+def folds(t, k=5, scheme="walk_forward", horizon_days=14, embargo_days=5):
+    """[(train_idx, test_idx, info)] over samples with day numbers `t`.
+
+    walk_forward  — days split into k+1 blocks; fold i trains on blocks 0..i, tests on i+1.
+    purged_kfold  — days split into k blocks; each is the test set once, the rest trains.
+    Either way training rows with t in [test_start - horizon_days, test_end + embargo_days]
+    are dropped."""
+    t = np.asarray(t)
+    days = np.unique(t)
+    nb = k + 1 if scheme == "walk_forward" else k
+    edges = [days[int(round(i * len(days) / nb))] for i in range(nb)] + [days[-1] + 1]
+    out = []
+    for i in range(1 if scheme == "walk_forward" else 0, nb):
+        lo, hi = edges[i], edges[i + 1]
+        test = (t >= lo) & (t < hi)
+        train = (t < lo) if scheme == "walk_forward" else ~test
+        keep = train & ~((t >= lo - horizon_days) & (t < hi + embargo_days))
+        out.append((np.flatnonzero(keep), np.flatnonzero(test),
+                    {"fold": len(out), "test_start": int(lo), "test_end": int(hi - 1),
+                     "train_n": int(keep.sum()), "test_n": int(test.sum()),
+                     "purged": int(train.sum() - keep.sum())}))
+    return out
+
+
+def calibration(y, p, bins=10):
+    """Reliability table (equal-width probability bins) and expected calibration error."""
+    y = np.asarray(y, dtype=np.float64); p = np.asarray(p, dtype=np.float64)
+    b = np.minimum((p * bins).astype(int), bins - 1)
+    n = np.bincount(b, minlength=bins)
+    ps = np.bincount(b, weights=p, minlength=bins); ys = np.bincount(b, weights=y, minlength=bins)
+    table = [{"bin": "%.1f-%.1f" % (i / bins, (i + 1) / bins), "n": int(n[i]),
+              "p_mean": round(float(ps[i] / n[i]), 3), "y_rate": round(float(ys[i] / n[i]), 3)}
+             for i in range(bins) if n[i]]
+    ece = float(np.sum(np.abs(ps - ys)) / max(1, len(y)))
+    return table, ece
+
+
+def fit_score(name, X, y, train, test):
+    """Fit `name` on rows `train`, score rows `test` → (metrics dict, test probabilities)."""
+    from sklearn.metrics import brier_score_loss, log_loss, roc_auc_score
+    m = make_model(name)
+    t0 = time.perf_counter(); m.fit(X[train], y[train]); t1 = time.perf_counter()
+    p = m.predict_proba(X[test])[:, 1]; t2 = time.perf_counter()
+    yt = y[test]
+    try:
+        auc = round(float(roc_auc_score(yt, p)), 4)
+    except ValueError:
+        auc = None                      # single-class test block
+    _table, ece = calibration(yt, p)
+    return {"auc": auc, "brier": round(float(brier_score_loss(yt, p)), 4),
+            "log_loss": round(float(log_loss(yt, np.clip(p, 1e-6, 1 - 1e-6), labels=[0, 1])), 4),
+            "ece": round(ece, 4), "base_rate": round(float(yt.mean()), 3),
+            "fit_ms": round((t1 - t0) * 1000, 1), "predict_ms": round((t2 - t1) * 1000, 1)}, p
+
+
+def fold_job(data, job):
+    """One (fold, model) pair: data = (X, y, folds), job = (fold index, model name) →
+    (fold info, name, metrics, y_test, p_test). Module-level, so a spawned pool worker only
+    imports this module; bind `data` per evaluation with functools.partial."""
+    fi, name = job
+    X, y, fl = data
+    tr, te, info = fl[fi]
+    try:
+        met, p = fit_score(name, X, y, tr, te)
+    except Exception as e:
+        met, p = {"error": str(e)}, np.array([])
+    return info, name, met, y[te] if len(p) else np.array([]), p
+
+
+def summarize(results, names):
+    """results: [(fold_info, name, metrics, y_test, p_test)] → per-model mean/std + pooled calibration."""
+    out = {}
+    for name in names:
+        rs = [r for r in results if r[1] == name]
+        if not rs:
+            continue
+        auc = [r[2]["auc"] for r in rs if r[2]["auc"] is not None]
+        yy = np.concatenate([r[3] for r in rs]); pp = np.concatenate([r[4] for r in rs])
+        table, ece = calibration(yy, pp)
+        out[name] = {"auc_mean": round(float(np.mean(auc)), 4) if auc else None,
+                     "auc_std": round(float(np.std(auc)), 4) if auc else None,
+                     "brier_mean": round(float(np.mean([r[2]["brier"] for r in rs])), 4),
+                     "ece_pooled": round(ece, 4),
+                     "fit_ms_mean": round(float(np.mean([r[2]["fit_ms"] for r in rs])), 1),
+                     "calibration": table}
+    return out
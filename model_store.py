@@ -0,0 +1,141 @@
+# model_store.py – Versioned artifacts for the trained win-probability model
+#
+# An artifact is plain JSON: the fitted StandardScaler / LogisticRegression parameters, the
+# feature list, hold-out metrics and a hash of the training data — no pickles, so it
+# survives sklearn upgrades and fits in a KV value. Each save writes model-v<N> and then
+# moves a small "latest" pointer, so readers never see a half-written version; a worker
+# that boots after a retrain loads it in milliseconds instead of training its own.
+#
+# Storage: a local directory (DirArtifacts) or the app's KV store (KVArtifacts), so the
+# artifacts outlive an ephemeral disk and are shared by every instance.
+
+import json
+import os
+import threading
+import time
+
+
+def linear(model):
+    """Fold the scaler into the classifier: P(win) = sigmoid(X @ w + b) on raw features.
+    Returns (w, b) — equal to clf.predict_proba(scaler.transform(X))[:, 1]."""
+    import numpy as np
+    sc, clf = model["scaler"], model["clf"]
+    coef = np.asarray(clf.coef_[0], dtype=np.float64)
+    w = coef / sc.scale_
+    return w, float(clf.intercept_[0] - np.dot(sc.mean_, w))
+
+
+def encode(model):
+    """Fitted model dict → JSON-safe artifact dict (scaler / clf reduced to their arrays, plus
+    the folded linear weights so a non-sklearn consumer can score with one dot product)."""
+    sc, clf = model["scaler"], model["clf"]
+    art = {k: v for k, v in model.items() if k not in ("scaler", "clf", "linear")}
+    art["scaler"] = {"mean": sc.mean_.tolist(), "scale": sc.scale_.tolist(), "var": sc.var_.tolist(),
+                     "n_samples_seen": int(sc.n_samples_seen_)}
+    art["clf"] = {"coef": clf.coef_.tolist(), "intercept": clf.intercept_.tolist(),
+                  "classes": clf.classes_.tolist(), "params": clf.get_params()}
+    w, b = linear(model)
+    art["linear"] = {"w": w.tolist(), "b": b}
+    return art
+
+
+def decode(art):
+    """Artifact dict → model dict with live StandardScaler / LogisticRegression objects."""
+    import numpy as np
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.preprocessing import StandardScaler
+    s, c = art["scaler"], art["clf"]
+    sc = StandardScaler()
+    sc.mean_ = np.array(s["mean"]); sc.scale_ = np.array(s["scale"]); sc.var_ = np.array(s["var"])
+    sc.n_samples_seen_ = s["n_samples_seen"]; sc.n_features_in_ = len(s["mean"])
+    clf = LogisticRegression(**c.get("params", {}))
+    clf.coef_ = np.array(c["coef"]); clf.intercept_ = np.array(c["intercept"])
+    clf.classes_ = np.array(c["classes"]); clf.n_features_in_ = clf.coef_.shape[1]
+    m = dict(art, scaler=sc, clf=clf)
+    m["linear"] = linear(m)
+    return m
+
+
+class DirArtifacts:
+    """One JSON file per name in `root`, replaced atomically."""
+    kind = "dir"
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.root, name + ".json")
+
+    def get(self, name):
+        try:
+            with open(self._path(name)) as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def put(self, name, obj):
+        tmp = "%s.%d.%d.tmp" % (self._path(name), os.getpid(), threading.get_ident())
+        with open(tmp, "w") as f:
+            json.dump(obj, f)
+        os.replace(tmp, self._path(name))
+
+    def delete(self, name):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+
+class KVArtifacts:
+    """Artifacts as KV values under `prefix` (kv: a kv_store.KVStore)."""
+    kind = "kv"
+
+    def __init__(self, kv, prefix="v3k_model_"):
+        self.kv = kv; self.prefix = prefix
+
+    def get(self, name):
+        return self.kv.get(self.prefix + name, None)
+
+    def put(self, name, obj):
+        self.kv.set(self.prefix + name, obj)
+        self.kv.flush()                   # other workers poll "latest" — publish now
+
+    def delete(self, name):
+        self.kv.delete(self.prefix + name)
+
+
+class ModelStore:
+    def __init__(self, storage, keep=5):
+        self.storage = storage
+        self.keep = keep                 # versions retained (older ones are deleted)
+        self._lock = threading.Lock()
+
+    def latest(self):
+        """The "latest" pointer ({version, saved_at, data_hash, ...}) or None."""
+        try:
+            return self.storage.get("latest")
+        except Exception:
+            return None
+
+    def save(self, model, meta=None):
+        """Persist a fitted model dict as the next version. Returns the version."""
+        with self._lock:
+            version = int((self.latest() or {}).get("version", 0)) + 1
+            self.storage.put("v%d" % version, dict(encode(model), version=version))
+            self.storage.put("latest", dict(meta or {}, version=version, saved_at=time.time()))
+            if version - self.keep > 0:
+                self.storage.delete("v%d" % (version - self.keep))
+            return version
+
+    def load(self, version=None):
+        """Load one version (default: latest) → model dict, or None if unavailable."""
+        if version is None:
+            version = (self.latest() or {}).get("version")
+        if not version:
+            return None
+        try:
+            art = self.storage.get("v%d" % int(version))
+            return decode(art) if art else None
+        except Exception:
+            return None
@@ -0,0 +1,202 @@
+# payload.py – Compact columnar encoding, compression and ETags for large JSON responses
+#
+# Opt-in (?format=columnar) wire format for series-heavy responses. A numeric column is
+# sent as delta-encoded scaled integers, base64'd little-endian int32 (int64 if needed):
+#   {"enc": "delta", "n": N, "dec": d, "dtype": "i4", "b64": "...", "nan": "..."?}
+#   decode: values = cumsum(ints) / 10**dec; bit i of the little-endian "nan" bitmap → NaN
+# Values that don't fit in 6 decimals go as raw float64 ({"enc": "f8", "n", "b64"}).
+# pack() applies this to every long numeric list in a nested response, and turns long lists
+# of same-keyed records into {"enc": "rows", "n", "keys", "cols": {key: column or list}}
+# and long lists of same-length tuples (e.g. [date, equity] pairs) into
+# {"enc": "tuples", "n", "cols": [column or list, ...]}.
+#
+# compress() negotiates brotli (if the module is installed) or gzip from Accept-Encoding;
+# etag() hashes the uncompressed body, so both encodings share one (weak) validator.
+#
+#   python payload.py      → size / latency benchmark vs the current JSON responses
+
+import base64
+import gzip
+import hashlib
+import importlib.util
+
+import numpy as np
+
+BROTLI_AVAILABLE = importlib.util.find_spec("brotli") is not None
+MIN_COMPRESS = 1024          # bytes; smaller bodies go out as they are
+_MAX_DEC = 6
+
+
+def _b64(buf):
+    return base64.b64encode(buf).decode("ascii")
+
+
+def _decimals(a):
+    """Fewest decimals (≤ 6) that reproduce every finite value exactly, else None."""
+    for d in range(_MAX_DEC + 1):
+        if np.array_equal(np.round(a, d), a):
+            return d
+    return None
+
+
+def encode(values, decimals=None):
+    """Numeric sequence (None / NaN allowed) → column dict. With `decimals` the values are
+    rounded to that many places; without, the encoding is lossless."""
+    a = np.asarray(values, dtype=np.float64).ravel()
+    nan = np.isnan(a); fin = a[~nan]
+    d = decimals if decimals is not None else _decimals(fin)
+    q = None
+    if d is not None and len(fin):
+        qf = np.round(fin * 10.0 ** d)
+        if np.all(np.abs(qf) < 2 ** 52):
+            q = qf
+    if q is None and len(fin):
+        return {"enc": "f8", "n": len(a), "b64": _b64(a.astype("<f8").tobytes())}
+    full = np.zeros(len(a), dtype=np.int64)
+    if len(fin):
+        full[~nan] = q.astype(np.int64)
+        if nan.any():              # carry the last value through gaps: a NaN costs a zero delta
+            idx = np.where(~nan, np.arange(len(a)), 0)
+            full = full[np.maximum.accumulate(idx)]
+    dq = np.diff(full, prepend=0)
+    dtype = "i4" if (not len(dq) or np.abs(dq).max() < 2 ** 31) else "i8"
+    col = {"enc": "delta", "n": len(a), "dec": int(d or 0), "dtype": dtype,
+           "b64": _b64(dq.astype("<" + dtype).tobytes())}
+    if nan.any():
+        col["nan"] = _b64(np.packbits(nan, bitorder="little").tobytes())
+    return col
+
+
+def decode(col):
+    """Column dict → float64 array (the reference for client-side decoders)."""
+    raw = base64.b64decode(col["b64"])
+    if col["enc"] == "f8":
+        return np.frombuffer(raw, dtype="<f8").astype(np.float64)
+    a = np.cumsum(np.frombuffer(raw, dtype="<" + col["dtype"]).astype(np.int64)) / 10.0 ** col["dec"]
+    if "nan" in col:
+        m = np.unpackbits(np.frombuffer(base64.b64decode(col["nan"]), dtype=np.uint8),
+                          bitorder="little")[:col["n"]].astype(bool)
+        a[m] = np.nan
+    return a
+
+
+def to_list(a, decimals):
+    """Array → JSON list rounded in one vectorized pass, None where NaN (what the routes
+    built element by element with round(float(x), d))."""
+    a = np.round(np.asarray(a, dtype=np.float64), decimals)
+    nan = np.isnan(a)
+    if not nan.any():
+        return a.tolist()
+    o = a.astype(object); o[nan] = None
+    return o.tolist()
+
+
+def _numeric(v):
+    return all((x is None or (isinstance(x, (int, float)) and not isinstance(x, bool))) for x in v)
+
+
+def pack(obj, min_len=32):
+    """Columnar form of a JSON-ready object: long numeric lists → encode() (lossless), long
+    lists of records with one key set → {"enc": "rows"} of per-key columns, long lists of
+    same-length tuples → {"enc": "tuples"} of per-position columns."""
+    if isinstance(obj, dict):
+        return {k: pack(v, min_len) for k, v in obj.items()}
+    if not isinstance(obj, list):
+        return obj
+    if len(obj) >= min_len:
+        if _numeric(obj):
+            return encode(obj)
+        if all(isinstance(x, dict) for x in obj):
+            keys = list(obj[0])
+            if all(len(x) == len(keys) and all(k in x for k in keys) for x in obj):
+                return {"enc": "rows", "n": len(obj), "keys": keys,
+                        "cols": {k: pack([x[k] for x in obj], min_len) for k in keys}}
+        if all(isinstance(x, (list, tuple)) for x in obj):
+            w = len(obj[0])
+            if w and all(len(x) == w for x in obj):
+                return {"enc": "tuples", "n": len(obj),
+                        "cols": [pack([x[i] for x in obj], min_len) for i in range(w)]}
+    return [pack(x, min_len) for x in obj]
+
+
+def etag(body):
+    return hashlib.sha1(body).hexdigest()[:20]
+
+
+def _accepts(header, coding):
+    for part in (header or "").lower().split(","):
+        bits = part.strip().split(";")
+        if bits[0].strip() == coding:
+            q = [b for b in bits[1:] if b.strip().startswith("q=")]
+            try:
+                return not q or float(q[0].split("=")[1]) > 0
+            except ValueError:
+                return True
+    return False
+
+
+def compress(body, accept_encoding):
+    """(bytes, content-encoding or None) — brotli if the client takes it and the module is
+    installed, else gzip, else the body untouched."""
+    if len(body) < MIN_COMPRESS:
+        return body, None
+    if BROTLI_AVAILABLE and _accepts(accept_encoding, "br"):
+        import brotli
+        return brotli.compress(body, quality=5), "br"
+    if _accepts(accept_encoding, "gzip"):
+        return gzip.compress(body, compresslevel=6, mtime=0), "gzip"
+    return body, None
+
+
+if __name__ == "__main__":
+    # Benchmark: /history for 2y and 10y of daily bars and a /portfolio-backtest-shaped
+    # payload — the current per-element JSON vs vectorized JSON vs columnar, raw and gzip'd.
+    import json
+    import time
+
+    rng = np.random.default_rng(3)
+
+    def _bars(n):
+        c = 1500 * np.exp(np.cumsum(rng.normal(0, 0.015, n)))
+        return c, c * (1 + rng.uniform(0, .02, n)), c * (1 - rng.uniform(0, .02, n)), rng.integers(1e5, 5e7, n).astype(float)
+
+    def _timed(fn, reps=50):
+        t0 = time.perf_counter()
+        for _ in range(reps):
+            out = fn()
+        return out, (time.perf_counter() - t0) / reps * 1000
+
+    def _row(name, fn):
+        body, ms = _timed(lambda: json.dumps(fn(), separators=(",", ":")).encode())
+        gz, gz_ms = _timed(lambda: compress(body, "gzip")[0], 10)
+        print("  %-26s %9d B %8d B gzip   %6.2f ms build  %6.2f ms gzip" % (name, len(body), len(gz), ms, gz_ms))
+        return body
+
+    for n in (504, 2520):
+        c, hi, lo, vol = _bars(n)
+        print("/history, %d bars" % n)
+        old = _row("json (per-element)", lambda: {
+            "close": [None if x != x else round(float(x), 4) for x in c],
+            "high": [None if x != x else round(float(x), 4) for x in hi],
+            "low": [None if x != x else round(float(x), 4) for x in lo],
+            "vol": [0 if x != x else int(x) for x in vol]})
+        new = _row("json (vectorized)", lambda: {"close": to_list(c, 4), "high": to_list(hi, 4),
+                                                "low": to_list(lo, 4), "vol": np.nan_to_num(vol).astype(np.int64).tolist()})
+        assert json.loads(old) == json.loads(new)
+        col = _row("columnar", lambda: {"close": encode(c, 4), "high": encode(hi, 4), "low": encode(lo, 4),
+                                        "vol": encode(np.nan_to_num(vol), 0)})
+        d = json.loads(col)
+        assert np.array_equal(decode(d["close"]), np.round(c, 4)) and np.array_equal(decode(d["vol"]), vol)
+
+    eq = [["2024-%03d" % i, v] for i, v in
+          enumerate(np.round(100000 * np.exp(np.cumsum(rng.normal(0, .004, 500))), 2).tolist())]
+    trades = [{"sym": "S%d" % (i % 40), "entry": round(float(x), 2), "exit": round(float(x) * 1.01, 2),
+               "pnl_pct": round(float(rng.normal(0.3, 2)), 3), "bars": int(rng.integers(1, 20))}
+              for i, x in enumerate(rng.uniform(100, 3000, 600))]
+    bt = {"market": "india", "equity_curve": eq, "trades": trades, "stats": {"n": 600, "win_rate": 54.2}}
+    print("/portfolio-backtest-shaped (500-point curve, 600 trades)")
+    _row("json", lambda: bt)
+    col = _row("columnar (pack)", lambda: pack(bt))
+    p = json.loads(col)
+    assert decode(p["equity_curve"]["cols"][1]).tolist() == [v for _, v in eq]
+    assert decode(p["trades"]["cols"]["pnl_pct"]).tolist() == [t["pnl_pct"] for t in trades]
@@ -0,0 +1,109 @@
+# quote_service.py – Shared short-TTL quote cache with batched, de-duplicated fetching
+#
+# /quotes, /watchlist-prices and /sector-performance all want "last price + % change vs the
+# previous close" for a handful of symbols, on every dashboard refresh of every user. One
+# QuoteService answers all of them: symbols quoted in the last `ttl` seconds come from a
+# TTLCache (optionally shared host-wide), the misses of one call are fetched together in a
+# single load_many() batch, and a symbol that another request is already fetching is
+# waited for rather than fetched again. Upstream cost tracks the union of the symbols
+# being asked for, not the sum over requests.
+
+import threading
+import time
+
+from ttl_cache import TTLCache
+
+_MISSING = object()
+
+
+class _Batch:
+    __slots__ = ("done", "quotes")
+
+    def __init__(self):
+        self.done = threading.Event(); self.quotes = {}
+
+
+def quote_from_frame(h):
+    """{"price", "prev", "change" (%)} from a daily history frame, or None if it's empty."""
+    if h is None or not len(h):
+        return None
+    c = h["Close"].dropna()
+    if not len(c):
+        return None
+    price = float(c.iloc[-1]); prev = float(c.iloc[-2]) if len(c) >= 2 else price
+    return {"price": price, "prev": prev, "change": ((price - prev) / prev * 100) if prev else 0.0}
+
+
+class QuoteService:
+    def __init__(self, load_many, ttl=10, shared=None, wait=30):
+        self.load_many = load_many        # [sym] -> {sym: daily frame}, one batch per call
+        self.ttl = ttl
+        self.wait = wait                  # max seconds to wait on another request's batch
+        self.cache = TTLCache("quotes", 4096, ttl, shared=shared)   # sym -> quote dict or None
+        self._inflight = {}               # sym -> _Batch fetching it now
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "symbols": 0, "cached": 0, "fetched": 0, "coalesced": 0,
+                         "batches": 0, "batch_ms": 0.0, "errors": 0}
+
+    def get(self, syms):
+        """{sym: quote or None} for every distinct symbol in `syms`."""
+        syms = list(dict.fromkeys(s for s in syms if s))
+        out, need = {}, []
+        for s in syms:
+            q = self.cache.get(s, _MISSING)
+            if q is _MISSING:
+                need.append(s)
+            else:
+                out[s] = q
+        mine, theirs = [], {}
+        with self._lock:
+            self.counters["calls"] += 1; self.counters["symbols"] += len(syms)
+            self.counters["cached"] += len(syms) - len(need)
+            batch = _Batch()
+            for s in need:
+                b = self._inflight.get(s)
+                if b is None:
+                    self._inflight[s] = batch; mine.append(s)
+                else:
+                    theirs[s] = b
+            self.counters["coalesced"] += len(theirs)
+        if mine:
+            self._fetch(mine, batch)
+            out.update(batch.quotes)
+        for s, b in theirs.items():
+            b.done.wait(self.wait)
+            out[s] = b.quotes.get(s)
+        return {s: out.get(s) for s in syms}
+
+    def _fetch(self, syms, batch):
+        t0 = time.perf_counter(); frames = {}
+        try:
+            frames = self.load_many(syms) or {}
+        except Exception:
+            with self._lock:
+                self.counters["errors"] += 1
+        try:
+            for s in syms:
+                q = None
+                try:
+                    q = quote_from_frame(frames.get(s))
+                except Exception:
+                    pass
+                batch.quotes[s] = q
+                self.cache.set(s, q)
+        finally:
+            with self._lock:
+                for s in syms:
+                    if self._inflight.get(s) is batch:
+                        del self._inflight[s]
+                self.counters["batches"] += 1; self.counters["fetched"] += len(syms)
+                self.counters["batch_ms"] += (time.perf_counter() - t0) * 1000
+            batch.done.set()
+
+    def stats(self):
+        with self._lock:
+            c = dict(self.counters); c["inflight"] = len(self._inflight)
+        c["batch_ms"] = round(c["batch_ms"], 1)
+        c["avg_batch_ms"] = round(c["batch_ms"] / c["batches"], 1) if c["batches"] else None
+        c["ttl_s"] = self.ttl
+        return c
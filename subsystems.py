@@ -0,0 +1,121 @@
+# subsystems.py – Lazily constructed app layers and a startup-time report
+#
+# app.py used to build every layer at import — the risk manager (and its SQLite DB), the
+# smart-alert system, the tick streamer, the multi-timeframe analyzer — and start the scan
+# and model threads, in every gunicorn worker and every `import app`. Each layer is now
+# registered with a factory and built the first time something touches it (through a Lazy
+# proxy that stands in for the old module global), so a worker pays only for what it uses.
+# SUBSYSTEMS="scan_loop,ml,web_jobs" (the default in app.py) / "all" / "none" picks which
+# ones are built at import instead.
+#
+# mark() stamps the end of each import phase; report() breaks the import down per phase
+# and lists each subsystem's state and construction time.
+#
+#   python subsystems.py      → cold `import app` timing + report, in a fresh interpreter
+
+import os
+import threading
+import time
+
+_T0 = time.perf_counter()       # `import subsystems` is app.py's first statement
+
+
+class Registry:
+    def __init__(self, t0=None):
+        self.t0 = _T0 if t0 is None else t0
+        self._last = self.t0
+        self.phases = []                  # [(phase, ms)] in import order
+        self.import_ms = None
+        self._subs = {}                   # name -> {"factory", "doc", "obj", "state", "init_ms", "error"}
+        self._lock = threading.RLock()    # a factory may touch another subsystem
+
+    def mark(self, phase):
+        """Close the current import phase: time since the previous mark is charged to it."""
+        now = time.perf_counter()
+        self.phases.append((phase, round((now - self._last) * 1000, 1)))
+        self._last = now
+
+    def register(self, name, factory, doc=""):
+        self._subs[name] = {"factory": factory, "doc": doc, "obj": None, "state": "lazy",
+                            "init_ms": None, "error": None}
+        return Lazy(self, name)
+
+    def get(self, name):
+        """The subsystem's object, constructing it on first call. A failed factory is
+        re-raised and retried next time."""
+        s = self._subs[name]
+        if s["state"] == "ready":
+            return s["obj"]
+        with self._lock:
+            if s["state"] != "ready":
+                t = time.perf_counter()
+                try:
+                    s["obj"] = s["factory"]()
+                except Exception as e:
+                    s["state"] = "failed"; s["error"] = str(e)
+                    raise
+                s["init_ms"] = round((time.perf_counter() - t) * 1000, 1)
+                s["state"] = "ready"; s["error"] = None
+        return s["obj"]
+
+    def ready(self, name):
+        return self._subs[name]["state"] == "ready"
+
+    def start(self, spec):
+        """Build the subsystems named in `spec` ("a,b" / "all" / "none") and end the import clock."""
+        spec = (spec or "").strip().lower()
+        names = list(self._subs) if spec == "all" else [n.strip() for n in spec.split(",") if n.strip()]
+        for n in names:
+            if n in self._subs:
+                try:
+                    self.get(n)
+                except Exception:
+                    pass
+        self.mark("eager subsystems")
+        self.import_ms = round((time.perf_counter() - self.t0) * 1000, 1)
+
+    def report(self):
+        return {"import_ms": self.import_ms,
+                "phases": [{"phase": p, "ms": ms} for p, ms in self.phases],
+                "subsystems": {n: {"state": s["state"], "init_ms": s["init_ms"], "error": s["error"],
+                                   "doc": s["doc"]} for n, s in self._subs.items()}}
+
+
+class Lazy:
+    """Stands in for a subsystem object: attribute access builds it via the registry."""
+    __slots__ = ("_reg", "_name")
+
+    def __init__(self, reg, name):
+        object.__setattr__(self, "_reg", reg); object.__setattr__(self, "_name", name)
+
+    def __getattr__(self, attr):
+        return getattr(self._reg.get(self._name), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._reg.get(self._name), attr, value)
+
+    def __repr__(self):
+        state = "ready" if self._reg.ready(self._name) else "not built"
+        return "<lazy %s (%s)>" % (self._name, state)
+
+
+if __name__ == "__main__":
+    import json
+    import subprocess
+    import sys
+    code = ("import time, json; t = time.perf_counter(); import app; "
+            "print(json.dumps(dict(app._SUBS.report(), wall_ms=round((time.perf_counter() - t) * 1000, 1))))")
+    env = dict(os.environ, SUBSYSTEMS=os.environ.get("SUBSYSTEMS", "none"))
+    out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    line = [l for l in out.stdout.splitlines() if l.startswith("{")]
+    if not line:
+        sys.exit(out.stderr[-2000:])
+    r = json.loads(line[-1])
+    print("cold import app : %8.1f ms   (SUBSYSTEMS=%s)" % (r["wall_ms"], env["SUBSYSTEMS"]))
+    # before app.py's first statement runs, its (large) bytecode is read and unmarshalled
+    print("  %-28s %8.1f ms" % ("(load app bytecode)", r["wall_ms"] - r["import_ms"]))
+    for p in r["phases"]:
+        print("  %-28s %8.1f ms" % (p["phase"], p["ms"]))
+    for n, s in r["subsystems"].items():
+        print("  [%s] %-20s %s" % (s["state"], n, "" if s["init_ms"] is None else "%.1f ms" % s["init_ms"]))
@@ -0,0 +1,34 @@
+import os
+
+os.environ.setdefault("SUBSYSTEMS", "none")   # app's helpers only: no scan loop / model thread
+
+import numpy as np
+
+import app
+import indicators as ind
+
+
+def test_feat_matrix_matches_feat_vec():
+    """_feat_matrix (one vectorized pass) vs _feat_vec at every bar, on synthetic bars."""
+    rng = np.random.default_rng(11)
+    n = 300
+    c = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, (3, n)), axis=-1))
+    hi = c * (1 + rng.uniform(0, 0.02, c.shape)); lo = c * (1 - rng.uniform(0, 0.02, c.shape))
+    vol = rng.integers(10_000, 5_000_000, c.shape).astype(np.float64)
+    got = ind.compute(c, hi, lo, vol)
+    L = ind.to_list
+    for j in range(3):
+        row = {k: v[j] for k, v in got.items()}
+        dr = np.where(ind.score(c[j], hi[j], row) > 0, 1, -1)
+        ic = (c[(j + 1) % 3] * 3).tolist()
+        F = app._feat_matrix(c[j], hi[j], lo[j], vol[j], row, dr, ic)
+        args = (c[j].tolist(), hi[j].tolist(), lo[j].tolist(), vol[j].tolist(), L(row["ema20"]),
+                L(row["ema50"]), L(row["ema200"]), L(row["macd"]), L(row["macd_sig"]), L(row["rsi"]))
+        ref = np.array([app._feat_vec(*args, i, int(dr[i]), ic) for i in range(n)])
+        assert F.shape == ref.shape
+        assert np.max(np.abs(F - ref)) < 1e-9
+
+
+if __name__ == "__main__":
+    test_feat_matrix_matches_feat_vec()
+    print("✅ _feat_matrix matches _feat_vec")
@@ -0,0 +1,86 @@
+import time
+
+from kv_store import KVStore, Lease, MemoryBackend
+
+
+def _store(backend=None):
+    # flush_interval long enough that only explicit flush() calls reach the backend
+    return KVStore(backend or MemoryBackend(), ttl=30.0, flush_interval=60.0)
+
+
+def test_read_through_cache():
+    """A miss reads the backend once; later reads of the key are cache hits."""
+    b = MemoryBackend(); b.data["k"] = '{"v": 1}'
+    kv = _store(b)
+    assert kv.get("k") == {"v": 1} and b.reads == 1
+    assert kv.get("k") == {"v": 1} and kv.get("k") == {"v": 1} and b.reads == 1
+    assert kv.get("missing", []) == [] and b.reads == 2
+    assert kv.get("missing", []) == [] and b.reads == 2         # absent values are cached too
+    st = kv.stats()
+    assert (st["hits"], st["misses"]) == (3, 2)
+
+
+def test_write_behind_coalesces_into_one_set_many():
+    """Writes are visible to the writer at once and reach the backend in one batch on flush()."""
+    b = MemoryBackend(); kv = _store(b)
+    for i in range(5):
+        kv.set("a", i)
+    kv.set("b", "x")
+    assert kv.get("a") == 4 and b.writes == 0 and b.reads == 0
+    assert kv.flush()
+    assert b.writes == 1 and b.data == {"a": "4", "b": '"x"'}
+    assert kv.flush() and b.writes == 1                         # nothing pending: no round trip
+    assert kv.stats()["coalesced_writes"] == 4
+
+
+def test_delete_removes_key_and_pending_write():
+    """delete() removes the key from the backend now and drops an unflushed write of it."""
+    b = MemoryBackend(); b.data["old"] = "1"
+    kv = _store(b)
+    kv.set("old", 2)                                            # unflushed: must not re-create it
+    assert kv.delete("old") and "old" not in b.data
+    assert kv.get("old", "gone") == "gone" and b.reads == 0
+    assert kv.flush() and "old" not in b.data
+
+
+def test_set_fenced_rejects_stale_token():
+    """A holder deposed by a newer acquisition has its fenced writes rejected."""
+    b = MemoryBackend(); kv = _store(b)
+    old = Lease(b, "t_lease", ttl=0.05); assert old.acquire()
+    assert kv.set_fenced(old, {"k": 1}) and b.data["k"] == "1"
+    time.sleep(0.1)                                             # old stalls past its TTL
+    new = Lease(b, "t_lease", ttl=30.0); assert new.acquire() > old.fence
+    assert not kv.set_fenced(old, {"k": 2})
+    assert b.data["k"] == "1" and kv.get("k") == 1
+    assert kv.set_fenced(new, {"k": 3}) and b.data["k"] == "3"
+    assert kv.update("k", lambda v: v + 1, lease=old) is None and b.data["k"] == "3"
+    assert kv.stats()["fenced_rejects"] == 2
+    new.release()
+
+
+def test_update_keeps_concurrent_writes():
+    """update() re-reads past a stale cache, so two processes' read-modify-writes both land."""
+    b = MemoryBackend(); b.data["alerts"] = '["a"]'
+    p1, p2 = _store(b), _store(b)
+    assert p1.get("alerts") == ["a"]                            # p1 now caches ["a"]
+    assert p2.update("alerts", lambda cur: cur + ["b"], []) == ["a", "b"]
+    assert p1.update("alerts", lambda cur: cur + ["c"], []) == ["a", "b", "c"]
+    assert p1.get("alerts") == ["a", "b", "c"]
+
+    calls = []
+    def racing(cur):                                            # another writer lands mid-update
+        calls.append(1)
+        if len(calls) == 1:
+            b.data["alerts"] = '["a", "b", "c", "d"]'
+        return cur + ["e"]
+    assert p1.update("alerts", racing, []) == ["a", "b", "c", "d", "e"]
+    assert len(calls) == 2 and p1.stats()["cas_retries"] == 1
+
+
+if __name__ == "__main__":
+    test_read_through_cache()
+    test_write_behind_coalesces_into_one_set_many()
+    test_delete_removes_key_and_pending_write()
+    test_set_fenced_rejects_stale_token()
+    test_update_keeps_concurrent_writes()
+    print("✅ KVStore cache, write-behind, delete, fencing and compare-and-set")
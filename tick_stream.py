@@ -0,0 +1,252 @@
+# tick_stream.py – Live tick sources, incremental bar aggregation and latency metering
+#
+# A TickSource pushes batches of ticks to one callback from its own thread. A tick is a dict:
+#   {"symbol": "INFY.NS", "price": float, "volume": cumulative day volume or None,
+#    "close": previous close or None, "ts": exchange time (unix s), "recv": perf_counter()}
+# `recv` is stamped the moment the batch arrives, so consumers can measure tick → callback
+# latency. Sources: KiteSource (Zerodha KiteConnect WebSocket) and ReplaySource (a JSON-lines
+# file, for offline testing and reproducing a session).
+#
+# BarAggregator folds ticks into OHLCV bars for several intervals as they arrive — O(1) per
+# tick per interval, no re-resampling of the tick history.
+
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta, timezone
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+
+def _epoch(ts):
+    """Exchange timestamp (datetime — naive means IST, as kiteconnect returns it — unix
+    seconds or ISO string) → unix seconds."""
+    if ts is None:
+        return time.time()
+    if isinstance(ts, (int, float)):
+        return float(ts)
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts)
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=IST)
+    return ts.timestamp()
+
+
+class TickSource:
+    name = "none"
+
+    def __init__(self):
+        self.counters = {"batches": 0, "ticks": 0, "errors": 0}
+        self.connected = False
+
+    def start(self, symbols, on_ticks):
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+    def _emit(self, on_ticks, ticks):
+        self.counters["batches"] += 1; self.counters["ticks"] += len(ticks)
+        try:
+            on_ticks(ticks)
+        except Exception as e:
+            self.counters["errors"] += 1
+            logging.warning("tick consumer failed: %s", e)
+
+    def stats(self):
+        return dict(self.counters, source=self.name, connected=self.connected)
+
+
+class KiteSource(TickSource):
+    """Zerodha KiteTicker in quote mode. Symbols are Yahoo-style ("INFY.NS"); ones Kite
+    can't resolve on `exchange` (e.g. US tickers) are skipped and listed in stats()."""
+    name = "kite"
+
+    def __init__(self, api_key, access_token, exchange="NSE"):
+        super().__init__()
+        self.api_key = api_key; self.access_token = access_token; self.exchange = exchange
+        self._tokens = {}                 # instrument_token -> symbol
+        self._ws = None
+        self.unresolved = []
+
+    def _resolve(self, symbols):
+        from kiteconnect import KiteConnect
+        kite = KiteConnect(api_key=self.api_key)
+        kite.set_access_token(self.access_token)
+        keys = {"%s:%s" % (self.exchange, s.split(".")[0]): s for s in symbols}
+        q = kite.ltp(list(keys))
+        self.unresolved = [s for k, s in keys.items() if k not in q]
+        return {v["instrument_token"]: keys[k] for k, v in q.items()}
+
+    def start(self, symbols, on_ticks):
+        from kiteconnect import KiteTicker
+        self._tokens = self._resolve(symbols)
+        if not self._tokens:
+            raise RuntimeError("no symbols resolvable on %s" % self.exchange)
+        ws = KiteTicker(self.api_key, self.access_token)
+
+        def _on_ticks(_ws, ticks):
+            recv = time.perf_counter(); out = []
+            for t in ticks:
+                sym = self._tokens.get(t.get("instrument_token"))
+                if sym is None or not t.get("last_price"):
+                    continue
+                out.append({"symbol": sym, "price": float(t["last_price"]), "volume": t.get("volume_traded"),
+                            "close": (t.get("ohlc") or {}).get("close"),
+                            "ts": _epoch(t.get("exchange_timestamp") or t.get("last_trade_time")), "recv": recv})
+            if out:
+                self._emit(on_ticks, out)
+
+        def _on_connect(_ws, _resp):
+            self.connected = True
+            toks = list(self._tokens)
+            _ws.subscribe(toks); _ws.set_mode(_ws.MODE_QUOTE, toks)
+
+        def _on_close(_ws, code, reason):
+            self.connected = False
+            logging.warning("kite ticker closed: %s %s", code, reason)
+
+        def _on_error(_ws, code, reason):
+            self.counters["errors"] += 1
+            logging.warning("kite ticker error: %s %s", code, reason)
+
+        ws.on_ticks = _on_ticks; ws.on_connect = _on_connect; ws.on_close = _on_close; ws.on_error = _on_error
+        self._ws = ws
+        ws.connect(threaded=True)
+
+    def stop(self):
+        if self._ws is not None:
+            try:
+                self._ws.close()
+            except Exception:
+                pass
+            self._ws = None
+        self.connected = False
+
+    def stats(self):
+        return dict(super().stats(), subscribed=len(self._tokens), unresolved=self.unresolved)
+
+
+class ReplaySource(TickSource):
+    """Replays a JSON-lines tick file ({"symbol", "price", "volume"?, "close"?, "ts"}) with
+    its original spacing divided by `speed` (0 = as fast as possible). Consecutive lines with
+    the same ts are delivered as one batch. `loop` restarts at the end of the file."""
+    name = "replay"
+
+    def __init__(self, path, speed=1.0, loop=False):
+        super().__init__()
+        self.path = path; self.speed = speed; self.loop = loop
+        self.done = threading.Event()
+        self._stop = threading.Event()
+
+    def _read(self, want):
+        with open(self.path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    r = json.loads(line)
+                    sym = r["symbol"]
+                    if want and sym not in want and sym + ".NS" not in want:
+                        continue
+                    sym = sym if sym in want or not want else sym + ".NS"
+                    yield {"symbol": sym, "price": float(r["price"]), "volume": r.get("volume"),
+                           "close": r.get("close"), "ts": _epoch(r.get("ts"))}
+                except (KeyError, ValueError, TypeError):
+                    self.counters["errors"] += 1
+
+    def _run(self, symbols, on_ticks):
+        want = set(symbols or ())
+        try:
+            while not self._stop.is_set():
+                prev = None; batch = []
+                for t in self._read(want):
+                    if batch and t["ts"] != batch[-1]["ts"]:
+                        self._flush(batch, prev, on_ticks); prev = batch[-1]["ts"]; batch = []
+                        if self._stop.is_set():
+                            return
+                    batch.append(t)
+                if batch:
+                    self._flush(batch, prev, on_ticks)
+                if not self.loop:
+                    break
+        except OSError as e:
+            logging.warning("tick replay %s failed: %s", self.path, e)
+        finally:
+            self.connected = False
+            self.done.set()
+
+    def _flush(self, batch, prev, on_ticks):
+        if prev is not None and self.speed > 0:
+            self._stop.wait(max(0.0, batch[0]["ts"] - prev) / self.speed)
+        recv = time.perf_counter()
+        for t in batch:
+            t["recv"] = recv
+        self._emit(on_ticks, batch)
+
+    def start(self, symbols, on_ticks):
+        self._stop.clear(); self.done.clear(); self.connected = True
+        threading.Thread(target=self._run, args=(symbols, on_ticks), daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return dict(super().stats(), path=self.path, speed=self.speed, finished=self.done.is_set())
+
+
+class BarAggregator:
+    """Incremental OHLCV bars per (symbol, interval seconds). Bars are aligned to the epoch,
+    which for 1m / 5m also lines up with IST session minutes (+5:30 is a multiple of 5m)."""
+
+    def __init__(self, intervals=(60, 300), keep=500):
+        self.intervals = tuple(intervals)
+        self._open = {}                                   # (sym, iv) -> [t, o, h, l, c, v]
+        self._closed = defaultdict(lambda: deque(maxlen=keep))
+        self._lock = threading.Lock()
+        self.late_ticks = 0
+
+    def add(self, sym, ts, price, vol=0.0):
+        with self._lock:
+            for iv in self.intervals:
+                start = int(ts - ts % iv); k = (sym, iv)
+                b = self._open.get(k)
+                if b is None or start > b[0]:
+                    if b is not None:
+                        self._closed[k].append(tuple(b))
+                    self._open[k] = [start, price, price, price, price, vol]
+                elif start == b[0]:
+                    b[2] = max(b[2], price); b[3] = min(b[3], price); b[4] = price; b[5] += vol
+                else:
+                    self.late_ticks += 1                  # belongs to a bar already closed
+
+    def bars(self, sym, iv, n=None, include_open=True):
+        """[{t, o, h, l, c, v}] oldest first; the last one is still forming if include_open."""
+        with self._lock:
+            rows = list(self._closed.get((sym, iv), ()))
+            if include_open and (sym, iv) in self._open:
+                rows.append(tuple(self._open[(sym, iv)]))
+        rows = rows[-n:] if n else rows
+        return [{"t": r[0], "o": r[1], "h": r[2], "l": r[3], "c": r[4], "v": r[5]} for r in rows]
+
+
+class LatencyMeter:
+    """Rolling latency samples (seconds) → count / avg / p50 / p95 / p99 / max in ms."""
+
+    def __init__(self, keep=5000):
+        self._s = deque(maxlen=keep)
+        self.n = 0
+
+    def add(self, seconds):
+        self._s.append(seconds); self.n += 1
+
+    def stats(self):
+        v = sorted(self._s)
+        if not v:
+            return {"n": self.n}
+        q = lambda p: round(v[int(p * (len(v) - 1))] * 1000, 3)
+        return {"n": self.n, "avg": round(sum(v) / len(v) * 1000, 3), "p50": q(0.5), "p95": q(0.95),
+                "p99": q(0.99), "max": round(v[-1] * 1000, 3)}
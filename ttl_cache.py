@@ -0,0 +1,312 @@
+# ttl_cache.py – Bounded, thread-safe LRU + TTL cache with single-flight loading
+#
+# Replaces the app's module-level `{key: (ts, value)}` dicts: entries expire after a TTL,
+# the least-recently-used entry is evicted once `maxsize` is reached, and get_or_set()
+# lets one thread compute a missing key while concurrent callers for the same key wait for
+# its result instead of computing it again. Every cache registers itself by name so the
+# app can report hit / miss / eviction counters for all of them in one place.
+#
+# A cache can sit in front of a host-wide tier (FileTier): a local miss first looks there,
+# and a load runs under a per-key file lock, so N gunicorn workers on one machine compute
+# each entry once and the others read the result from disk (JSON-serializable values only).
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+CACHES = {}             # name -> TTLCache
+
+
+class FileTier:
+    """Shared second level: <root>/<cache>/<hash>.json = {"exp": unix time, "v": value},
+    replaced atomically; lock() is an exclusive flock per key across processes.
+    Keys come from query strings, so the directory is kept bounded: an expired entry is
+    deleted (with its .lock) when read, and each cache's directory is swept every
+    `sweep_every` seconds — expired entries, stale lock / temp files, and the entries
+    closest to expiry beyond `max_entries`."""
+
+    def __init__(self, root, max_entries=2048, sweep_every=300):
+        self.root = root
+        self.max_entries = max_entries
+        self.sweep_every = sweep_every
+        self._swept = {}                  # cache -> time of this process's last sweep
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, cache, key):
+        d = os.path.join(self.root, cache)
+        os.makedirs(d, exist_ok=True)
+        return os.path.join(d, hashlib.sha1(repr(key).encode()).hexdigest()[:24])
+
+    def _remove(self, base):
+        """Delete an entry and its lock file. The lock file goes only if no process holds
+        it; at worst a racing loader then locks an unlinked file and one value is computed
+        twice."""
+        with contextlib.suppress(OSError):
+            os.unlink(base + ".json")
+        try:
+            fd = os.open(base + ".lock", os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.unlink(base + ".lock")
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def get(self, cache, key):
+        """(value, seconds left) or None when absent / expired / unreadable."""
+        base = self._path(cache, key)
+        try:
+            with open(base + ".json") as f:
+                e = json.load(f)
+        except Exception:
+            return None
+        left = e["exp"] - time.time()
+        if left > 0:
+            return e["v"], left
+        self._remove(base)
+        return None
+
+    def set(self, cache, key, value, ttl):
+        """False if the value isn't JSON-serializable (it then stays process-local)."""
+        try:
+            body = json.dumps({"exp": time.time() + ttl, "v": value})
+        except (TypeError, ValueError):
+            return False
+        path = self._path(cache, key) + ".json"
+        tmp = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+        with open(tmp, "w") as f:
+            f.write(body)
+        os.replace(tmp, path)
+        if time.time() - self._swept.get(cache, 0) > self.sweep_every:
+            self.sweep(cache)
+        return True
+
+    def sweep(self, cache, grace=60):
+        """Bound one cache's directory; returns how many entries were removed. Lock and
+        temp files without an entry are removed once they are `grace` seconds old."""
+        now = time.time(); self._swept[cache] = now
+        d = os.path.join(self.root, cache)
+        try:
+            names = os.listdir(d)
+        except OSError:
+            return 0
+        live, removed = [], 0
+        for n in names:
+            p = os.path.join(d, n)
+            if n.endswith(".json"):
+                try:
+                    with open(p) as f:
+                        exp = json.load(f)["exp"]
+                except Exception:
+                    exp = 0
+                if exp > now:
+                    live.append((exp, p[:-5]))
+                else:
+                    self._remove(p[:-5]); removed += 1
+            elif n.endswith((".lock", ".tmp")):
+                try:
+                    stale = now - os.stat(p).st_mtime > grace
+                except OSError:
+                    continue
+                if stale and n.endswith(".tmp"):
+                    with contextlib.suppress(OSError):
+                        os.unlink(p)
+                elif stale and n[:-5] + ".json" not in names:
+                    self._remove(p[:-5])
+        if len(live) > self.max_entries:
+            live.sort()
+            for _, base in live[:len(live) - self.max_entries]:
+                self._remove(base); removed += 1
+        return removed
+
+    @contextlib.contextmanager
+    def lock(self, cache, key):
+        with open(self._path(cache, key) + ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class _Flight:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event(); self.value = None; self.error = None
+
+
+class TTLCache:
+    def __init__(self, name, maxsize=256, ttl=300, shared=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared = shared                  # FileTier (or None = this process only)
+        self._data = OrderedDict()            # key -> (expires_at, value), LRU first
+        self._inflight = {}                   # key -> _Flight
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expired": 0,
+                         "loads": 0, "load_errors": 0, "coalesced": 0, "shared_hits": 0, "shared_writes": 0}
+        CACHES[name] = self
+
+    def _lookup(self, key, now):
+        """Caller holds the lock. Fresh value (marked most-recently-used) or _MISSING."""
+        e = self._data.get(key)
+        if e is None:
+            return _MISSING
+        if e[0] <= now:
+            del self._data[key]; self.counters["expired"] += 1
+            return _MISSING
+        self._data.move_to_end(key)
+        return e[1]
+
+    def _store(self, key, value, ttl):
+        """Caller holds the lock."""
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        self.counters["sets"] += 1
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False); self.counters["evictions"] += 1
+
+    def _from_shared(self, key):
+        """Shared-tier value (copied into this process for its remaining TTL) or _MISSING."""
+        if self.shared is None:
+            return _MISSING
+        e = self.shared.get(self.name, key)
+        if e is None:
+            return _MISSING
+        with self._lock:
+            self.counters["shared_hits"] += 1
+            self._store(key, e[0], min(e[1], self.ttl))
+        return e[0]
+
+    def _to_shared(self, key, value, ttl):
+        if self.shared is not None:
+            try:
+                if self.shared.set(self.name, key, value, self.ttl if ttl is None else ttl):
+                    with self._lock:
+                        self.counters["shared_writes"] += 1
+            except OSError:
+                pass
+
+    def get(self, key, default=None):
+        with self._lock:
+            v = self._lookup(key, time.monotonic())
+            self.counters["hits" if v is not _MISSING else "misses"] += 1
+        if v is _MISSING:
+            v = self._from_shared(key)
+        return default if v is _MISSING else v
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._store(key, value, ttl)
+        self._to_shared(key, value, ttl)
+
+    def _load_shared(self, key, load, ttl, cache_none):
+        """Leader path with a shared tier: read it, else load under the per-key host lock
+        (re-checking once the lock is held — another process may just have written it)."""
+        v = self._from_shared(key)
+        if v is not _MISSING:
+            return v, False
+        with self.shared.lock(self.name, key):
+            v = self._from_shared(key)
+            if v is not _MISSING:
+                return v, False
+            v = load()
+            if v is not None or cache_none:
+                self._to_shared(key, v, ttl)
+            return v, True
+
+    def get_or_set(self, key, load, ttl=None, cache_none=True):
+        """Cached value for `key`, else load() — computed once even when many threads miss
+        at the same time (the others block until it finishes and share its result or error).
+        cache_none=False leaves a None result uncached (a failed load is retried next call)."""
+        with self._lock:
+            v = self._lookup(key, time.monotonic())
+            if v is not _MISSING:
+                self.counters["hits"] += 1
+                return v
+            self.counters["misses"] += 1
+            fl = self._inflight.get(key)
+            leader = fl is None
+            if leader:
+                fl = self._inflight[key] = _Flight()
+            else:
+                self.counters["coalesced"] += 1
+        if not leader:
+            fl.done.wait()
+            if fl.error is not None:
+                raise fl.error
+            return fl.value
+        loaded = True
+        try:
+            if self.shared is None:
+                fl.value = load()
+            else:
+                fl.value, loaded = self._load_shared(key, load, ttl, cache_none)
+        except BaseException as e:
+            fl.error = e
+            with self._lock:
+                self.counters["load_errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                if fl.error is None and loaded:
+                    self.counters["loads"] += 1
+                    if fl.value is not None or cache_none:
+                        self._store(key, fl.value, ttl)
+            fl.done.set()
+        return fl.value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            e = self._data.pop(key, None)
+        return default if e is None else e[1]
+
+    def clear(self):
+        """Drop every entry; returns how many there were."""
+        with self._lock:
+            n = len(self._data); self._data.clear()
+        return n
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._lookup(key, time.monotonic()) is not _MISSING
+
+    def stats(self):
+        with self._lock:
+            c = dict(self.counters); c["size"] = len(self._data); c["inflight"] = len(self._inflight)
+        lookups = c["hits"] + c["misses"]
+        c["hit_rate"] = round(c["hits"] / lookups, 3) if lookups else None
+        c["maxsize"] = self.maxsize; c["ttl_s"] = self.ttl; c["shared"] = self.shared is not None
+        return c
+
+
+def stats():
+    """{name: stats} for every cache created in this process."""
+    return {name: c.stats() for name, c in sorted(CACHES.items())}
+
+
+def _after_fork():
+    """In a forked child only the forking thread survives: a lock another thread held, or a
+    flight it was loading, would never be released there. Start each cache's coordination
+    state fresh (the cached entries themselves are still valid)."""
+    for c in list(CACHES.values()):
+        c._lock = threading.Lock(); c._inflight = {}
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)